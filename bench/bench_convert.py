@@ -0,0 +1,364 @@
+"""convert.py benchmark: throughput and peak RSS per function, plus correctness checks.
+
+Benchmarked functions
+    parse_ply_header              header only
+    read_vertex_table_binary      vertex table -> float32 columns
+    write_ply_binary_vertex_only  Scheme-B columns -> output PLY
+    convert                       end to end (parse + read + write)
+    prune_gaussians               all pruning rules (BENCH_PRUNE) on Scheme-B columns
+
+Each measurement runs in a fresh interpreter, so peak RSS (VmHWM) belongs to
+that function alone; `rss_delta_mb` is the growth over the child's RSS after
+setup (imports, and for write_ply the input columns).  Input files come from
+bench/gen_ply.py and are cached in --workdir between runs.
+
+Before timing, the suite checks convert.py against a numpy reference reader on
+small little/big-endian files with extra properties and extra elements, and
+exits non-zero if the output differs.
+
+Usage
+    python bench/bench_convert.py                                   # 10k, 100k, 1M
+    python bench/bench_convert.py --sizes 10000,5000000 --extra-props 45 --endian big
+    python bench/bench_convert.py --repeat 5 --out convert_bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import convert as conv  # noqa: E402
+from bench import gen_ply  # noqa: E402
+
+FUNCTIONS = ["parse_ply_header", "read_vertex_table_binary", "write_ply_binary_vertex_only", "convert",
+             "prune_gaussians"]
+BENCH_PRUNE = conv.PruneOptions(min_opacity=0.005, min_scale=1e-4, max_scale=0.05, outlier_k=8)
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def _proc_status_mb(field: str) -> float | None:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb() -> float:
+    # VmHWM 只属于当前进程映像；ru_maxrss 在 Linux 上会继承 fork 前父进程的峰值
+    peak = _proc_status_mb("VmHWM")
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return peak
+
+
+def _reset_peak_rss() -> float:
+    """Reset the RSS high-water mark where supported; returns current RSS in MB"""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+    current = _proc_status_mb("VmRSS")
+    return current if current is not None else _peak_rss_mb()
+
+
+def _scheme_b_columns(path: Path) -> Dict[str, np.ndarray]:
+    """Build write_ply input columns with the reference reader (not the code under test)"""
+    header = conv.parse_ply_header(path)
+    endian = "<" if header.format == "binary_little_endian" else ">"
+    rows = gen_ply.read_vertices(path, header.vertex_count, header.vertex_properties, endian,
+                                 header.data_start_offset)
+    columns = {}
+    for _t, name in conv.target_schema_scheme_b():
+        if name in rows.dtype.names and name not in ("nx", "ny", "nz"):
+            columns[name] = rows[name].astype(np.float32)
+        else:
+            columns[name] = np.zeros(header.vertex_count, dtype=np.float32)
+    return columns
+
+
+# ------------------------------------------------------------------ child
+
+
+def run_child(func: str, input_path: Path, output_path: Path) -> dict:
+    """Runs one function once in this process and reports time / RSS / processed bytes"""
+    header = conv.parse_ply_header(input_path)
+    n = header.vertex_count
+    vertex_bytes = n * conv._struct_for_vertex(header.vertex_properties, "<").size
+    columns = _scheme_b_columns(input_path) if func in ("write_ply_binary_vertex_only", "prune_gaussians") else None
+
+    baseline = _reset_peak_rss()
+    t0 = time.perf_counter()
+    if func == "parse_ply_header":
+        conv.parse_ply_header(input_path)
+        processed = header.data_start_offset
+    elif func == "read_vertex_table_binary":
+        conv.read_vertex_table_binary(input_path, header)
+        processed = vertex_bytes
+    elif func == "write_ply_binary_vertex_only":
+        conv.write_ply_binary_vertex_only(output_path, n, conv.target_schema_scheme_b(), columns)
+        processed = output_path.stat().st_size
+    elif func == "convert":
+        conv.convert(input_path, output_path)
+        processed = vertex_bytes
+    elif func == "prune_gaussians":
+        conv.prune_gaussians(columns, BENCH_PRUNE)
+        processed = sum(col.nbytes for col in columns.values())
+    else:
+        raise ValueError(f"unknown function: {func}")
+    seconds = time.perf_counter() - t0
+    peak = _peak_rss_mb()
+
+    return {
+        "seconds": seconds,
+        "bytes": processed,
+        "gaussians": n,
+        "peak_rss_mb": round(peak, 1),
+        "rss_delta_mb": round(max(0.0, peak - baseline), 1),
+    }
+
+
+def measure(func: str, input_path: Path, workdir: Path, repeat: int) -> dict:
+    runs: List[dict] = []
+    output_path = workdir / f"out_{func}.ply"
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--child", func,
+             "--input", str(input_path), "--child-output", str(output_path)],
+            cwd=REPO_ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            return {"function": func, "error": proc.stderr.strip().splitlines()[-1:]}
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    output_path.unlink(missing_ok=True)
+
+    seconds = statistics.median(r["seconds"] for r in runs)
+    first = runs[0]
+    return {
+        "function": func,
+        "gaussians": first["gaussians"],
+        "median_s": round(seconds, 4),
+        "min_s": round(min(r["seconds"] for r in runs), 4),
+        "gaussians_per_s": round(first["gaussians"] / seconds) if seconds else None,
+        "mb_per_s": round(first["bytes"] / 1e6 / seconds, 2) if seconds else None,
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "rss_delta_mb": max(r["rss_delta_mb"] for r in runs),
+    }
+
+
+# ------------------------------------------------------------ correctness
+
+
+def check_correctness(workdir: Path, count: int = 2000) -> List[str]:
+    """Compare convert.py against the numpy reference reader; returns a list of failures"""
+    failures: List[str] = []
+    cases = [
+        ("little", "<", 0, True),
+        ("big", ">", 0, True),
+        ("little+f_rest", "<", 45, True),
+        ("vertex-only", "<", 3, False),
+    ]
+    schema = conv.target_schema_scheme_b()
+    for label, endian, extra_props, extra_elements in cases:
+        src = gen_ply.write_teaser_ply(workdir / f"check_{label}.ply", count, extra_props=extra_props,
+                                       endian=endian, extra_elements=extra_elements, seed=7)
+        dst = workdir / f"check_{label}_out.ply"
+        props = gen_ply.vertex_properties(extra_props)
+
+        header = conv.parse_ply_header(src)
+        if header.vertex_count != count or header.vertex_properties != props:
+            failures.append(f"{label}: parse_ply_header returned wrong vertex element")
+            continue
+        expected = gen_ply.read_vertices(src, count, props, endian, header.data_start_offset)
+
+        cols = conv.read_vertex_table_binary(src, header)
+        for _t, name in props:
+            if not np.array_equal(cols[name], expected[name].astype(np.float32)):
+                failures.append(f"{label}: read_vertex_table_binary column {name} differs")
+                break
+
+        conv.convert(src, dst, tile_size=0)
+        out_header = conv.parse_ply_header(dst)
+        if out_header.format != "binary_little_endian" or out_header.vertex_properties != schema:
+            failures.append(f"{label}: convert output header/schema differs")
+            continue
+        if len(out_header.header_lines) != len(schema) + 4:
+            failures.append(f"{label}: convert output has extra header lines or elements")
+        if dst.stat().st_size != out_header.data_start_offset + count * 4 * len(schema):
+            failures.append(f"{label}: convert output size differs")
+            continue
+        out = gen_ply.read_vertices(dst, count, schema, "<", out_header.data_start_offset)
+        for _t, name in schema:
+            want = (np.zeros(count, dtype=np.float32) if name in ("nx", "ny", "nz")
+                    else expected[name].astype(np.float32))
+            if not np.array_equal(out[name], want):
+                failures.append(f"{label}: convert column {name} differs")
+                break
+        src.unlink(missing_ok=True)
+        dst.unlink(missing_ok=True)
+    failures.extend(check_tiles(workdir, count))
+    failures.extend(check_prune(count))
+    return failures
+
+
+def check_prune(count: int) -> List[str]:
+    """Each rule removes exactly the rows it should, counted against the first matching rule"""
+    failures: List[str] = []
+    rng = np.random.default_rng(3)
+    columns = {name: np.zeros(count, dtype=np.float32) for _t, name in conv.target_schema_scheme_b()}
+    for axis in ("x", "y", "z"):
+        columns[axis] = rng.normal(0.0, 1.0, count).astype(np.float32)
+    columns["opacity"][:] = 5.0
+    for axis in range(3):
+        columns[f"scale_{axis}"][:] = np.log(0.01)
+    columns["x"][0] = np.nan
+    columns["opacity"][1:4] = -10.0                 # sigmoid ~ 4.5e-5
+    columns["opacity"][0] = -10.0                   # already non-finite: counted once
+    columns["scale_1"][4:6] = np.log(1e-6)          # largest axis still 0.01: kept
+    columns["scale_0"][6:8] = np.log(10.0)          # too large
+    columns["x"][8] = 1000.0                        # floater
+
+    options = conv.PruneOptions(min_opacity=0.01, min_scale=1e-3, max_scale=1.0, outlier_k=8)
+    for method in ("grid", "kdtree"):
+        try:
+            keep, removed = conv.prune_gaussians(columns, conv.PruneOptions(**dict(options.__dict__, outlier_method=method)))
+        except ImportError:
+            continue                                # scipy 未安装
+        want = {"non_finite": 1, "opacity": 3, "scale": 2}
+        if {k: removed[k] for k in want} != want or keep[:9].tolist() != [False] * 4 + [True] * 2 + [False] * 3:
+            failures.append(f"prune ({method}): rule counts {removed}")
+        if removed["outlier"] < 1 or removed["outlier"] > count // 20:
+            failures.append(f"prune ({method}): outlier count {removed['outlier']}")
+    return failures
+
+
+def check_tiles(workdir: Path, count: int, tile_size: int = 128) -> List[str]:
+    """Tiled output is a permutation of the source rows and every tile's rows lie in its bounds"""
+    failures: List[str] = []
+    src = gen_ply.write_teaser_ply(workdir / "check_tiles.ply", count, seed=11)
+    dst = workdir / "check_tiles_out.ply"
+    header = conv.parse_ply_header(src)
+    expected = gen_ply.read_vertices(src, count, header.vertex_properties, "<", header.data_start_offset)
+    conv.convert(src, dst, tile_size=tile_size)
+    schema = conv.target_schema_scheme_b()
+    out_header = conv.parse_ply_header(dst)
+    out = gen_ply.read_vertices(dst, count, schema, "<", out_header.data_start_offset)
+    index = json.loads(Path(conv.tiles_path(dst)).read_text(encoding="utf-8"))
+
+    def row_order(cols):
+        return np.lexsort([cols[name].astype(np.float32) for name in ("opacity", "z", "y", "x")])
+
+    src_order, out_order = row_order(expected), row_order(out)
+    for _t, name in schema:
+        if name in ("nx", "ny", "nz"):
+            continue
+        if not np.array_equal(out[name][out_order], expected[name].astype(np.float32)[src_order]):
+            failures.append(f"tiles: output is not a permutation of the input (column {name})")
+            break
+    if index["data_offset"] != out_header.data_start_offset or index["row_size"] != 4 * len(schema):
+        failures.append("tiles: index data_offset/row_size differs from the PLY")
+    rows = 0
+    for tile in index["tiles"]:
+        bbox, first, n = tile[:6], tile[6], tile[7]
+        if first != rows or n <= 0:
+            failures.append(f"tiles: bad tile row range {tile}")
+            break
+        rows += n
+        if bbox[0] is None:
+            continue
+        pts = np.stack([out[a][first:first + n] for a in ("x", "y", "z")], axis=1)
+        if (pts < np.array(bbox[:3]) - 1e-4).any() or (pts > np.array(bbox[3:]) + 1e-4).any():
+            failures.append(f"tiles: rows outside tile bounds {tile}")
+            break
+    if rows != count:
+        failures.append(f"tiles: tiles cover {rows} rows, expected {count}")
+    for path in (src, dst, Path(conv.tiles_path(dst))):
+        path.unlink(missing_ok=True)
+    return failures
+
+
+# ------------------------------------------------------------------- main
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark convert.py")
+    ap.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                    help="Comma separated gaussian counts")
+    ap.add_argument("--extra-props", type=int, default=0, help="Extra f_rest_* properties in the input")
+    ap.add_argument("--endian", choices=("little", "big"), default="little")
+    ap.add_argument("--functions", nargs="*", default=FUNCTIONS, choices=FUNCTIONS)
+    ap.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per measurement")
+    ap.add_argument("--workdir", type=Path, default=Path(tempfile.gettempdir()) / "qs_bench_convert",
+                    help="Generated inputs are cached here")
+    ap.add_argument("--skip-check", action="store_true", help="Skip correctness checks")
+    ap.add_argument("--out", type=Path, default=None, help="Write JSON results to this path")
+    ap.add_argument("--child", choices=FUNCTIONS, help=argparse.SUPPRESS)
+    ap.add_argument("--input", type=Path, help=argparse.SUPPRESS)
+    ap.add_argument("--child-output", type=Path, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.input, args.child_output)))
+        return 0
+
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "repeat": args.repeat,
+        "extra_props": args.extra_props,
+        "endian": args.endian,
+        "checks": None,
+        "results": [],
+    }
+
+    if not args.skip_check:
+        failures = check_correctness(args.workdir)
+        report["checks"] = {"passed": not failures, "failures": failures}
+        print("correctness: " + ("ok" if not failures else "FAILED"))
+        for failure in failures:
+            print(f"  {failure}")
+
+    endian = "<" if args.endian == "little" else ">"
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        src = args.workdir / f"teaser_{size}_{args.endian}_{args.extra_props}.ply"
+        if not src.exists():
+            gen_ply.write_teaser_ply(src, size, extra_props=args.extra_props, endian=endian)
+        for func in args.functions:
+            result = measure(func, src, args.workdir, args.repeat)
+            report["results"].append(result)
+            if "error" in result:
+                print(f"{size:>9} {func:<30} ERROR {result['error']}")
+                continue
+            print(f"{size:>9} {func:<30} {result['median_s']:>9.3f} s "
+                  f"{result['gaussians_per_s']:>12,} g/s {result['mb_per_s']:>9.1f} MB/s "
+                  f"peak {result['peak_rss_mb']:>7.1f} MB (+{result['rss_delta_mb']:.1f})")
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    if report["checks"] is not None and not report["checks"]["passed"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
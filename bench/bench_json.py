@@ -0,0 +1,153 @@
+"""json_response micro-benchmark: per-response cost of each serializer backend.
+
+Payloads mirror the real endpoints:
+
+    ping        /ping, /sharp/ping (constant body, cached after the first call)
+    status      /sharp/status/<task_id> poll
+    list_<N>    /manager/list/ with N models carrying the index metadata
+                (size, vertices, tiles, bbox, centroid, opacity, scale, preview)
+
+For every payload the script times Flask's jsonify (the previous
+json_response) and json_response with each available backend ('json', and
+'orjson' when installed), inside a request context, including building the
+Response and reading its body.  It also checks that every backend's body
+decodes to the same document as jsonify's.
+
+Usage
+    python bench/bench_json.py                          # 1000, 5000, 20000 models
+    python bench/bench_json.py --models 2000,50000 --repeat 7 --out json_bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from flask import Flask, jsonify  # noqa: E402
+
+from error_code import JsonError  # noqa: E402
+
+
+def make_models(count: int, seed: int = 1) -> List[dict]:
+    rng = random.Random(seed)
+    models = []
+    for i in range(count):
+        folder = f"{2016 + i % 9}{rng.randrange(1, 13):02d}{rng.randrange(1, 29):02d}_IMG_{i:05d}"
+        path = f"{folder}/{folder}.ply"
+        lo = [round(rng.uniform(-5, 0), 6) for _ in range(3)]
+        hi = [round(v + rng.uniform(0.5, 10), 6) for v in lo]
+        models.append({
+            'path': path,
+            'url': f"/manager/models/{path}",
+            'size': rng.randrange(5, 80) * 1024 * 1024,
+            'vertices': rng.randrange(200_000, 1_500_000),
+            'tiles': rng.randrange(10, 90),
+            'bbox': [lo, hi],
+            'centroid': [round((a + b) / 2, 6) for a, b in zip(lo, hi)],
+            'opacity': round(rng.random(), 4),
+            'scale': round(rng.uniform(0.001, 0.2), 5),
+            'preview': f"/manager/preview/{path}?v={1700000000 + i}",
+        })
+    return models
+
+
+def payloads(model_counts: Sequence[int]) -> Dict[str, tuple]:
+    status = {'task': {'status': 'training', 'progress': 42, 'message': '正在重建...', 'result': None,
+                       'queuePosition': 3}}
+    cases = {
+        'ping': (0, 'pong', {}),
+        'status': (0, '获取任务状态成功', status),
+    }
+    for n in model_counts:
+        cases[f"list_{n}"] = (0, '获取模型列表成功', {'models': make_models(n)})
+    return cases
+
+
+def _time(fn: Callable[[], bytes], repeat: int, budget: float) -> dict:
+    fn()  # 预热（常量响应在此填充缓存）
+    start = time.perf_counter()
+    fn()
+    once = max(time.perf_counter() - start, 1e-7)
+    number = max(1, min(10000, int(budget / once)))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {'us': round(statistics.median(samples) * 1e6, 2), 'min_us': round(min(samples) * 1e6, 2),
+            'number': number}
+
+
+def run(model_counts: Sequence[int], repeat: int, budget: float) -> dict:
+    app = Flask(__name__)
+    results = {}
+    with app.test_request_context('/'):
+        for name, (code, msg, data) in payloads(model_counts).items():
+            def legacy():
+                return jsonify({'code': code, 'msg': msg, 'data': data}).get_data()
+
+            expected = json.loads(legacy())
+            row = {'jsonify': _time(legacy, repeat, budget)}
+            row['jsonify']['bytes'] = len(legacy())
+            for backend in JsonError.BACKENDS:
+                JsonError.set_backend(backend)
+
+                def fast():
+                    return JsonError.json_response(code=code, msg=msg, data=data).get_data()
+
+                body = fast()
+                if json.loads(body) != expected:
+                    raise SystemExit(f"{name}: backend {backend} output differs from jsonify")
+                row[backend] = _time(fast, repeat, budget)
+                row[backend]['bytes'] = len(body)
+                row[backend]['speedup'] = round(row['jsonify']['us'] / row[backend]['us'], 2)
+            results[name] = row
+    return results
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark json_response serializer backends")
+    ap.add_argument("--models", default="1000,5000,20000", help="Comma separated model counts for list payloads")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--budget", type=float, default=0.2, help="Seconds per timing sample")
+    ap.add_argument("--out", type=Path, default=None)
+    args = ap.parse_args(argv)
+
+    counts = [int(n) for n in args.models.split(",") if n]
+    results = run(counts, args.repeat, args.budget)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "backends": sorted(JsonError.BACKENDS),
+        "results": results,
+    }
+
+    backends = ['jsonify'] + sorted(JsonError.BACKENDS)
+    print(f"{'payload':<12}" + "".join(f"{b:>22}" for b in backends) + f"{'bytes':>12}")
+    for name, row in results.items():
+        cells = []
+        for b in backends:
+            cell = f"{row[b]['us']:.1f} us"
+            if 'speedup' in row[b]:
+                cell += f" x{row[b]['speedup']:.1f}"
+            cells.append(f"{cell:>22}")
+        print(f"{name:<12}" + "".join(cells) + f"{row['jsonify']['bytes']:>12}")
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
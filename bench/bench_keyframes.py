@@ -0,0 +1,181 @@
+"""Keyframe selection benchmark: scoring throughput and selection quality.
+
+A synthetic clip is generated with numpy (no ffmpeg needed): a textured scene
+panned across the frame, with motion-blurred stretches (box blur along the pan)
+and a static segment that repeats one view.  The script checks that
+
+    - no selected frame comes from a blurred stretch,
+    - the selected frames are mutually different (no two from the static segment),
+
+and times scoring the clip serially against scoring it in a spawn process
+pool (the keyframes.score_video batching: _BATCH frames per task, at most
+2 * workers batches in flight).  With --video and ffmpeg/ffprobe on PATH it also
+runs the real extract_keyframes end to end.
+
+Usage
+    python bench/bench_keyframes.py                            # 600 frames, 320 px, 1/2/4 workers
+    python bench/bench_keyframes.py --frames 1200 --workers 1,2,8 --count 3
+    python bench/bench_keyframes.py --video clip.mp4 --count 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import List, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import numpy as np  # noqa: E402
+
+import keyframes  # noqa: E402
+
+
+def make_clip(frames: int, width: int, seed: int = 1):
+    """(n, h, w) uint8 frames plus the set of blurred indices and the static segment range"""
+    rng = np.random.default_rng(seed)
+    height = width * 3 // 4
+    scene = rng.integers(0, 256, size=(height, width * 4), dtype=np.uint8).astype(np.float32)
+    # 平滑一次：类似真实画面的纹理，而不是纯噪声
+    scene = (scene + np.roll(scene, 1, 0) + np.roll(scene, 1, 1) + np.roll(scene, (1, 1), (0, 1))) / 4
+    blurred = set()
+    for start in range(frames // 10, frames, frames // 4):
+        blurred.update(range(start, min(frames, start + frames // 20)))
+    static = (frames // 2, frames // 2 + frames // 10)
+    clip = np.empty((frames, height, width), dtype=np.uint8)
+    pan = scene.shape[1] - width
+    for i in range(frames):
+        x = (static[0] if static[0] <= i < static[1] else i) * pan // frames
+        frame = scene[:, x:x + width]
+        if i in blurred:
+            kernel = 9
+            padded = np.pad(frame, ((0, 0), (kernel // 2, kernel // 2)), mode="edge")
+            frame = np.mean([padded[:, k:k + width] for k in range(kernel)], axis=0)
+        noise = rng.normal(0, 1.5, size=frame.shape)
+        clip[i] = np.clip(frame + noise, 0, 255).astype(np.uint8)
+    return clip, blurred, static
+
+
+def score_serial(clip: np.ndarray):
+    results = [keyframes.score_batch(clip[i:i + keyframes._BATCH]) for i in range(0, len(clip), keyframes._BATCH)]
+    return np.concatenate([s for s, _ in results]), np.concatenate([d for _, d in results])
+
+
+def score_pool(clip: np.ndarray, pool, workers: int):
+    sharpness, descriptors, pending = [], [], deque()
+
+    def collect(future):
+        s, d = future.result()
+        sharpness.append(s)
+        descriptors.append(d)
+
+    for i in range(0, len(clip), keyframes._BATCH):
+        pending.append(pool.submit(keyframes.score_batch, clip[i:i + keyframes._BATCH]))
+        while len(pending) > 2 * workers:
+            collect(pending.popleft())
+    while pending:
+        collect(pending.popleft())
+    return np.concatenate(sharpness), np.concatenate(descriptors)
+
+
+def check_selection(sharpness, descriptors, blurred, static, count: int, min_difference: float,
+                    blur_quantile: float) -> dict:
+    selected = keyframes.select_keyframes(sharpness, descriptors, count=count, min_difference=min_difference,
+                                          blur_quantile=blur_quantile)
+    in_static = [i for i in selected if static[0] <= i < static[1]]
+    pairwise = [keyframes.difference(descriptors[a], descriptors[b])
+                for n, a in enumerate(selected) for b in selected[n + 1:]]
+    return {
+        'selected': selected,
+        'blurred_selected': [i for i in selected if i in blurred],
+        'static_selected': len(in_static),
+        'min_pairwise_difference': round(min(pairwise), 4) if pairwise else None,
+        'ok': (not any(i in blurred for i in selected) and len(in_static) <= 1
+               and all(d >= min_difference for d in pairwise)),
+    }
+
+
+def timed(fn, repeat: int):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_video(path: str, count: int, workers: int) -> dict:
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        return {'skipped': 'ffmpeg / ffprobe not on PATH'}
+    out_dir = tempfile.mkdtemp(prefix='keyframes-')
+    pool = ProcessPoolExecutor(workers, mp_context=get_context('spawn')) if workers else None
+    try:
+        start = time.perf_counter()
+        frames = keyframes.extract_keyframes(path, out_dir, count=count, pool=pool)
+        return {'seconds': round(time.perf_counter() - start, 3), 'frames': frames}
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=600, help='synthetic clip length (sampled frames)')
+    parser.add_argument('--width', type=int, default=320, help='scoring width (VIDEO_SCORE_WIDTH)')
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated process pool sizes')
+    parser.add_argument('--count', type=int, default=3, help='keyframes to select')
+    parser.add_argument('--min-difference', type=float, default=0.1)
+    parser.add_argument('--blur-quantile', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--video', help='also run extract_keyframes on a real clip')
+    parser.add_argument('--out', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    clip, blurred, static = make_clip(args.frames, args.width)
+    print(f"clip: {clip.shape[0]} frames {clip.shape[2]}x{clip.shape[1]}, {len(blurred)} blurred, "
+          f"static {static[0]}-{static[1]}  ({platform.python_version()}, {os.cpu_count()} cpus)")
+
+    serial, (sharpness, descriptors) = timed(lambda: score_serial(clip), args.repeat)
+    results = {'frames': args.frames, 'width': args.width, 'serial_seconds': round(serial, 4), 'pool': {}}
+    print(f"{'serial':>10}: {serial * 1000:8.1f} ms  {args.frames / serial:8.0f} frames/s")
+
+    worker_counts: List[int] = [int(w) for w in args.workers.split(',') if w.strip()]
+    for workers in worker_counts:
+        with ProcessPoolExecutor(workers, mp_context=get_context('spawn')) as pool:
+            score_pool(clip[:keyframes._BATCH], pool, workers)  # 预热：spawn 的子进程需要先导入 numpy
+            seconds, (s, d) = timed(lambda: score_pool(clip, pool, workers), args.repeat)
+        assert np.allclose(s, sharpness) and np.allclose(d, descriptors), 'pool scores differ from serial'
+        results['pool'][workers] = round(seconds, 4)
+        print(f"{f'pool x{workers}':>10}: {seconds * 1000:8.1f} ms  {args.frames / seconds:8.0f} frames/s  "
+              f"({serial / seconds:.2f}x)")
+
+    selection = check_selection(sharpness, descriptors, blurred, static, args.count, args.min_difference,
+                                args.blur_quantile)
+    results['selection'] = selection
+    print(f"selected {selection['selected']}  blurred={selection['blurred_selected']}  "
+          f"static={selection['static_selected']}  min difference={selection['min_pairwise_difference']}  "
+          f"{'OK' if selection['ok'] else 'FAIL'}")
+
+    if args.video:
+        results['video'] = run_video(args.video, args.count, max(worker_counts or [0]))
+        print(json.dumps(results['video'], ensure_ascii=False, indent=2))
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+    return 0 if selection['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Worker startup benchmark: per-module import cost + create_app() wall time.
+
+Every measurement runs in a fresh interpreter (like a freshly forked gunicorn
+worker), using `python -X importtime`, so nothing is served from sys.modules.
+
+Usage
+    python bench/bench_startup.py                      # print table
+    python bench/bench_startup.py --repeat 7 --out startup.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_MODULES = [
+    "config",
+    "error_code.JsonError",
+    "utils.tools",
+    "utils.storage",
+    "db.db",
+    "routes",
+    "routes.login",
+    "routes.viewer",
+    "routes.manager",
+    "routes.sharp",
+    "trainer_image",
+    "convert",
+    "main",
+]
+
+_APP_SNIPPET = (
+    "import time; t0 = time.perf_counter(); import main; "
+    "main.create_app(); print(time.perf_counter() - t0)"
+)
+
+
+def _run(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="0"),
+    )
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """Return {module: cumulative_us} from `-X importtime` output."""
+    result: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative = int(parts[1].strip())
+        except ValueError:
+            continue  # header line
+        result[parts[2].strip()] = cumulative
+    return result
+
+
+def measure_module(module: str, repeat: int) -> dict:
+    samples: List[int] = []
+    heavy: Dict[str, List[int]] = {}
+    for _ in range(repeat):
+        proc = _run(f"import {module}")
+        if proc.returncode != 0:
+            return {"module": module, "error": proc.stderr.strip().splitlines()[-1:]}
+        times = parse_importtime(proc.stderr)
+        samples.append(times.get(module, 0))
+        for name in ("numpy", "requests", "bcrypt", "flask", "jwt", "sqlite3"):
+            if name in times:
+                heavy.setdefault(name, []).append(times[name])
+    return {
+        "module": module,
+        "cumulative_ms": round(statistics.median(samples) / 1000.0, 2),
+        "min_ms": round(min(samples) / 1000.0, 2),
+        "pulls_in": {k: round(statistics.median(v) / 1000.0, 2) for k, v in heavy.items()},
+    }
+
+
+def measure_create_app(repeat: int) -> dict:
+    samples: List[float] = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", _APP_SNIPPET], cwd=REPO_ROOT, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1:]}
+        samples.append(float(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "median_ms": round(statistics.median(samples) * 1000.0, 2),
+        "min_ms": round(min(samples) * 1000.0, 2),
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Measure worker import/startup cost")
+    ap.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per measurement")
+    ap.add_argument("--modules", nargs="*", default=DEFAULT_MODULES)
+    ap.add_argument("--out", type=Path, default=None, help="Write JSON results to this path")
+    args = ap.parse_args(argv)
+
+    modules = [measure_module(m, args.repeat) for m in args.modules]
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "modules": modules,
+        "create_app": measure_create_app(args.repeat),
+    }
+
+    for m in modules:
+        if "error" in m:
+            print(f"{m['module']:<24} ERROR {m['error']}")
+            continue
+        pulls = ", ".join(f"{k}={v}ms" for k, v in m["pulls_in"].items())
+        print(f"{m['module']:<24} {m['cumulative_ms']:>9.2f} ms   {pulls}")
+    print(f"{'create_app()':<24} {report['create_app']}")
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
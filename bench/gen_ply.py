@@ -0,0 +1,145 @@
+"""Synthetic teaser-style PLY generator for convert.py benchmarks.
+
+Writes a binary PLY shaped like `sharp predict` output: a `vertex` element with
+the gaussian properties (x/y/z, f_dc_*, opacity, scale_*, rot_*), optional extra
+per-vertex properties (f_rest_*), and the small trailing elements teaser files
+carry (extrinsic / intrinsic / image_size) that Scheme-B drops.
+
+Values are drawn from a seeded RNG, so the same arguments always give the same
+bytes.  Data is written in chunks, so 5M gaussians do not need 5M rows in memory.
+
+Usage
+    python bench/gen_ply.py --count 100000 --out /tmp/teaser_100k.ply
+    python bench/gen_ply.py --count 5000000 --extra-props 45 --endian big --out /tmp/big.ply
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+GAUSSIAN_PROPERTIES = [
+    "x", "y", "z",
+    "f_dc_0", "f_dc_1", "f_dc_2",
+    "opacity",
+    "scale_0", "scale_1", "scale_2",
+    "rot_0", "rot_1", "rot_2", "rot_3",
+]
+
+# teaser 文件在 vertex 之后附带的相机元素（element 名, 行数, [(类型, 属性名)]）
+EXTRA_ELEMENTS = [
+    ("extrinsic", 16, [("float", "extrinsic")]),
+    ("intrinsic", 9, [("float", "intrinsic")]),
+    ("image_size", 2, [("uint", "image_size")]),
+]
+
+_NP_TYPES = {"float": "f4", "double": "f8", "uchar": "u1", "int": "i4", "uint": "u4"}
+_CHUNK = 1_000_000
+
+
+def vertex_properties(extra_props: int = 0) -> List[Tuple[str, str]]:
+    """(type, name) list of the generated vertex element"""
+    names = GAUSSIAN_PROPERTIES + [f"f_rest_{i}" for i in range(extra_props)]
+    return [("float", n) for n in names]
+
+
+def vertex_dtype(props: Sequence[Tuple[str, str]], endian: str = "<") -> np.dtype:
+    return np.dtype([(name, endian + _NP_TYPES[t]) for t, name in props])
+
+
+def _header(count: int, props, endian: str, extra_elements: bool) -> bytes:
+    fmt = "binary_little_endian" if endian == "<" else "binary_big_endian"
+    lines = ["ply", f"format {fmt} 1.0", "comment generated by bench/gen_ply.py", f"element vertex {count}"]
+    lines += [f"property {t} {n}" for t, n in props]
+    if extra_elements:
+        for name, rows, elem_props in EXTRA_ELEMENTS:
+            lines.append(f"element {name} {rows}")
+            lines += [f"property {t} {n}" for t, n in elem_props]
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def _fill(rows: np.ndarray, rng: np.random.Generator) -> None:
+    n = rows.shape[0]
+    for axis in ("x", "y", "z"):
+        rows[axis] = rng.normal(0.0, 2.0, n)
+    for name in ("f_dc_0", "f_dc_1", "f_dc_2"):
+        rows[name] = rng.normal(0.0, 1.0, n)
+    rows["opacity"] = rng.normal(0.0, 3.0, n)          # logit
+    for name in ("scale_0", "scale_1", "scale_2"):
+        rows[name] = rng.normal(-5.0, 1.0, n)          # log scale
+    quat = rng.normal(size=(n, 4))
+    quat /= np.linalg.norm(quat, axis=1, keepdims=True)
+    for i in range(4):
+        rows[f"rot_{i}"] = quat[:, i]
+    for name in rows.dtype.names:
+        if name.startswith("f_rest_"):
+            rows[name] = rng.normal(0.0, 0.1, n)
+
+
+def write_teaser_ply(
+    path: Path,
+    count: int,
+    extra_props: int = 0,
+    endian: str = "<",
+    extra_elements: bool = True,
+    seed: int = 0,
+) -> Path:
+    """Write a teaser-like PLY with `count` gaussians and return its path"""
+    if endian not in ("<", ">"):
+        raise ValueError(f"endian must be '<' or '>', got {endian!r}")
+    props = vertex_properties(extra_props)
+    dtype = vertex_dtype(props, endian)
+    rng = np.random.default_rng(seed)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as f:
+        f.write(_header(count, props, endian, extra_elements))
+        written = 0
+        while written < count:
+            rows = np.empty(min(_CHUNK, count - written), dtype=dtype)
+            _fill(rows, rng)
+            rows.tofile(f)
+            written += rows.shape[0]
+        if extra_elements:
+            for _name, rows_count, elem_props in EXTRA_ELEMENTS:
+                t = elem_props[0][0]
+                np.arange(rows_count).astype(endian + _NP_TYPES[t]).tofile(f)
+    return path
+
+
+def read_vertices(path: Path, count: int, props, endian: str, data_start: int) -> np.ndarray:
+    """Reference reader (numpy structured dtype) used by the benchmark correctness checks"""
+    with Path(path).open("rb") as f:
+        f.seek(data_start)
+        return np.fromfile(f, dtype=vertex_dtype(props, endian), count=count)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Generate a synthetic teaser-style gaussian PLY")
+    ap.add_argument("--count", type=int, default=100_000, help="Number of gaussians")
+    ap.add_argument("--extra-props", type=int, default=0, help="Extra per-vertex properties (f_rest_*)")
+    ap.add_argument("--endian", choices=("little", "big"), default="little")
+    ap.add_argument("--no-extra-elements", action="store_true", help="Only write the vertex element")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, required=True)
+    args = ap.parse_args(argv)
+
+    path = write_teaser_ply(
+        args.out,
+        args.count,
+        extra_props=args.extra_props,
+        endian="<" if args.endian == "little" else ">",
+        extra_elements=not args.no_extra_elements,
+        seed=args.seed,
+    )
+    print(f"{path}: {args.count} gaussians, {path.stat().st_size / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
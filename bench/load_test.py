@@ -0,0 +1,220 @@
+"""End-to-end load test: concurrent uploads to /sharp/images, polled via /sharp/status.
+
+Each simulated client uploads an image as one of --users users, then polls the
+task until it reaches a final status.  The report covers throughput, upload and
+completion latency percentiles (p50/p95/p99) and error rates, optionally as JSON.
+
+Without --base-url the script starts the GPU-side app (inference, storage,
+manager roles) in-process on a free port with a temporary DATA_DIR and
+bench/stub_sharp.py in place of `sharp`, so queueing and conversion behaviour
+can be measured on any Linux box:
+
+    python bench/load_test.py --requests 40 --concurrency 8 --slots 2 \\
+        --stub-latency 1.5 --stub-gaussians 200000 --stub-fail-rate 0.05
+
+Against a running server (its `sharp` can be the stub too, see stub_sharp.py):
+
+    python bench/load_test.py --base-url http://127.0.0.1:21000 --requests 100 --concurrency 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shlex
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import requests
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+FINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def tiny_png(size: int = 8) -> bytes:
+    """Smallest useful upload body: a grey size x size PNG"""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    raw = b"".join(b"\x00" + b"\x80" * size for _ in range(size))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(pct / 100.0 * len(ordered) + 0.5))))
+    return round(ordered[rank - 1], 3)
+
+
+def summarize(values: Sequence[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": round(statistics.mean(values), 3) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 3) if values else None,
+    }
+
+
+# ----------------------------------------------------------------- server
+
+
+def spawn_server(args) -> str:
+    """Start the GPU-side app in a background thread, return its base URL"""
+    from werkzeug.serving import make_server
+
+    from config import Config
+
+    workdir = Path(tempfile.mkdtemp(prefix="qs_load_"))
+    Config.DATA_DIR = workdir / "data"
+    Config.LOG_DIR = workdir / "logs"
+    Config.METRICS_DIR = Config.LOG_DIR / "metrics"
+    Config.TRACE_DIR = Config.LOG_DIR / "traces"
+    Config.DISPATCH_DIR = Config.DATA_DIR / ".dispatch"
+    Config.DATA_DIR.mkdir(parents=True)
+    Config.LOG_DIR.mkdir(parents=True)
+    Config.USE_GPU_SERVER = True
+    Config.SHARP_MAX_CONCURRENT = args.slots
+    Config.SHARP_USE_CONDA = False
+    Config.SHARP_COMMAND = f"{shlex.quote(sys.executable)} {shlex.quote(str(REPO_ROOT / 'bench' / 'stub_sharp.py'))}"
+    # stub 参数通过环境变量传给 sharp 子进程
+    os.environ.update({
+        "STUB_SHARP_LATENCY": str(args.stub_latency),
+        "STUB_SHARP_JITTER": str(args.stub_jitter),
+        "STUB_SHARP_GAUSSIANS": str(args.stub_gaussians),
+        "STUB_SHARP_FAIL_RATE": str(args.stub_fail_rate),
+    })
+
+    import main as app_main
+
+    app = app_main.create_app(Config.GPU_ROLES)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"spawned server on port {server.server_port}, data in {workdir}")
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+# ----------------------------------------------------------------- client
+
+
+def run_one(base_url: str, token: str, index: int, image: bytes, args) -> dict:
+    session = requests.Session()
+    session.headers["token"] = token
+    record = {"index": index, "outcome": None, "upload_s": None, "completion_s": None}
+    start = time.perf_counter()
+    try:
+        res = session.post(f"{base_url}/sharp/images", timeout=args.http_timeout,
+                           files={"image": (f"load_{index}.png", image, "image/png")},
+                           data={"originalName": f"load_{index}.png"})
+        record["upload_s"] = time.perf_counter() - start
+        body = res.json() if res.ok else {}
+        if body.get("code") != 0:
+            record["outcome"] = f"upload_http_{res.status_code}" if not res.ok else f"upload_code_{body.get('code')}"
+            return record
+        task_id = body["data"]["taskId"]
+
+        deadline = start + args.task_timeout
+        while time.perf_counter() < deadline:
+            time.sleep(args.poll_interval)
+            res = session.get(f"{base_url}/sharp/status/{task_id}", timeout=args.http_timeout)
+            body = res.json() if res.ok else {}
+            if body.get("code") != 0:
+                record["outcome"] = f"status_code_{body.get('code', res.status_code)}"
+                return record
+            status = body["data"]["task"]["status"]
+            if status in FINAL_STATUSES:
+                record["completion_s"] = time.perf_counter() - start
+                record["outcome"] = status
+                return record
+        record["outcome"] = "client_timeout"
+    except (requests.RequestException, ValueError, KeyError) as e:
+        record["outcome"] = f"error_{type(e).__name__}"
+    return record
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Load-test /sharp/images end to end")
+    ap.add_argument("--base-url", default=None, help="Target server; omit to spawn a local app with the stub")
+    ap.add_argument("--requests", type=int, default=20, help="Total uploads")
+    ap.add_argument("--concurrency", type=int, default=4, help="Concurrent clients")
+    ap.add_argument("--users", type=int, default=4, help="Distinct users the uploads are spread over")
+    ap.add_argument("--token", default=None, help="Use this token for every request instead of minting JWTs")
+    ap.add_argument("--image", type=Path, default=None, help="Image to upload (default: tiny generated PNG)")
+    ap.add_argument("--poll-interval", type=float, default=0.5)
+    ap.add_argument("--task-timeout", type=float, default=1800, help="Give up on a task after this many seconds")
+    ap.add_argument("--http-timeout", type=float, default=60)
+    ap.add_argument("--out", type=Path, default=None, help="Write JSON report to this path")
+    spawn = ap.add_argument_group("spawned server (no --base-url)")
+    spawn.add_argument("--slots", type=int, default=1, help="SHARP_MAX_CONCURRENT")
+    spawn.add_argument("--stub-latency", type=float, default=2.0)
+    spawn.add_argument("--stub-jitter", type=float, default=0.0)
+    spawn.add_argument("--stub-gaussians", type=int, default=100_000)
+    spawn.add_argument("--stub-fail-rate", type=float, default=0.0)
+    args = ap.parse_args(argv)
+
+    base_url = (args.base_url or spawn_server(args)).rstrip("/")
+    image = args.image.read_bytes() if args.image else tiny_png()
+    if args.token:
+        tokens = [args.token]
+    else:
+        from utils.tools import generate_jwt
+        tokens = [generate_jwt(10_000 + i, f"loadtest{i}") for i in range(max(1, args.users))]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_one, base_url, tokens[i % len(tokens)], i, image, args)
+                   for i in range(args.requests)]
+        records: List[dict] = [f.result() for f in futures]
+    wall = time.perf_counter() - started
+
+    outcomes = Counter(r["outcome"] for r in records)
+    completed = [r["completion_s"] for r in records if r["outcome"] == "completed"]
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "base_url": args.base_url or "spawned",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "users": len(tokens),
+        "wall_s": round(wall, 3),
+        "throughput_per_min": round(len(completed) / wall * 60, 2) if wall else None,
+        "outcomes": dict(outcomes),
+        "error_rate": round(1 - len(completed) / args.requests, 4) if args.requests else None,
+        "upload_s": summarize([r["upload_s"] for r in records if r["upload_s"] is not None]),
+        "completion_s": summarize(completed),
+    }
+    if not args.base_url:
+        report["stub"] = {"slots": args.slots, "latency": args.stub_latency, "jitter": args.stub_jitter,
+                          "gaussians": args.stub_gaussians, "fail_rate": args.stub_fail_rate}
+
+    print(f"{len(completed)}/{args.requests} completed in {wall:.1f}s "
+          f"({report['throughput_per_min']} tasks/min), error rate {report['error_rate']:.1%}")
+    print(f"outcomes: {dict(outcomes)}")
+    for key in ("upload_s", "completion_s"):
+        s = report[key]
+        print(f"{key:<13} p50={s['p50']} p95={s['p95']} p99={s['p99']} max={s['max']} (n={s['count']})")
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
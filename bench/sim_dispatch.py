@@ -0,0 +1,319 @@
+"""End-to-end check of utils.dispatcher with an in-process LoopbackWorker.
+
+No GPU or HTTP: the worker runs a fake reconstruct_fn that writes a small model
+file, and everything else (JobStore, fair queue, retry thread, LoopbackTransport,
+complete -> on_complete) is the production code.  Four scenarios:
+
+    e2e       submit a few jobs to a capacity-1 loopback worker: all complete, each
+              model is stored under DATA_DIR/<user>/<rel_folder>, progress was reported
+    pending   a child process queues a job (no workers) and exits: while it is alive
+              recover() must leave the job alone, afterwards adopt and complete it
+    orphaned  a job assigned to a remote worker whose heartbeat expires is re-queued
+              and completed locally; the stale worker's late result is ignored
+    tiles     dispatch + storage + manager app (Flask test client): a loopback job and a
+              job posted to /dispatch/jobs/<id>/result as a remote worker would, both
+              with a real convert (tile index); /manager/tiles serves the index and
+              tile data of each stored model afterwards
+
+Traces and logs go to a temporary LOG_DIR, not the repo's.  The script exits
+non-zero if any check fails.
+
+    python bench/sim_dispatch.py
+    python bench/sim_dispatch.py --jobs 8 --out dispatch.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from config import Config  # noqa: E402
+from utils.dispatcher import Dispatcher, LoopbackWorker  # noqa: E402
+
+# 子进程：创建没有 worker 的分派器并提交一个任务（进入内存队列），等 stdin 关闭后退出
+_CHILD = """
+import sys
+sys.path.insert(0, {repo!r})
+from config import Config
+Config.LOG_DIR = Config.TRACE_DIR = {logs!r}
+from utils.dispatcher import Dispatcher
+d = Dispatcher({data!r}, {dispatch!r}, 'http://127.0.0.1:1', 'token',
+               on_status=lambda *a: None, on_complete=lambda *a: None, retry_interval=3600)
+d.submit('orphan-pending', 'bob', 'pending', {image!r}, lane='bulk')
+print('queued', flush=True)
+sys.stdin.read()
+"""
+
+
+def fake_reconstruct(delay: float):
+    def reconstruct(image_dir, out_dir, on_stage=None, cancel_event=None):
+        on_stage('training', '正在重建...', 50)
+        if cancel_event.wait(delay):
+            return {'success': False, 'message': 'cancelled', 'log': [], 'model_file': None,
+                    'converted': False, 'cancelled': True}
+        on_stage('processing', '正在处理数据...', 90)
+        model = Path(out_dir) / f"{Path(out_dir).name}.ply"
+        model.write_bytes(b'ply\nformat binary_little_endian 1.0\nend_header\n')
+        return {'success': True, 'message': 'ok', 'log': [], 'model_file': str(model), 'converted': True}
+    return reconstruct
+
+
+def converting_reconstruct(gaussians: int, tile_size: int):
+    """Like sharp_pipeline.reconstruct after predict: teaser PLY -> convert (writes <model>.tiles.json)"""
+    def reconstruct(image_dir, out_dir, on_stage=None, cancel_event=None):
+        from bench import gen_ply
+        from convert import convert
+
+        raw = gen_ply.write_teaser_ply(Path(out_dir) / 'teaser.ply', gaussians, seed=1)
+        model = Path(out_dir) / f"{Path(out_dir).name}.ply"
+        meta = convert(Path(raw), model, tile_size=tile_size)
+        os.remove(raw)
+        return {'success': True, 'message': 'ok', 'log': [], 'model_file': str(model), 'converted': True,
+                'metadata': meta}
+    return reconstruct
+
+
+class Recorder:
+    def __init__(self):
+        self.status = {}
+        self.complete = {}
+        self.cond = threading.Condition()
+
+    def on_status(self, task_id, status, message, progress):
+        with self.cond:
+            self.status.setdefault(task_id, []).append((status, progress))
+
+    def on_complete(self, task_id, username, rel_folder, result):
+        with self.cond:
+            self.complete.setdefault(task_id, []).append(result)
+            self.cond.notify_all()
+
+    def wait(self, job_ids, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while not all(j in self.complete for j in job_ids):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+
+def make_dispatcher(tmp: Path, rec: Recorder, ttl: float, delay: float, capacity: int = 1) -> Dispatcher:
+    d = Dispatcher(tmp / 'data', tmp / 'dispatch', 'http://127.0.0.1:1', 'token',
+                   on_status=rec.on_status, on_complete=rec.on_complete,
+                   heartbeat_ttl=ttl, retry_interval=0.05)
+    d.add_worker(LoopbackWorker(d, tmp / 'scratch', capacity=capacity, reconstruct_fn=fake_reconstruct(delay)))
+    return d
+
+
+def make_image(tmp: Path, name: str) -> Path:
+    path = tmp / 'uploads' / f"{name}.jpg"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'\xff\xd8\xff\xd9')
+    return path
+
+
+def check_model(tmp: Path, rec: Recorder, job_id: str, username: str, rel_folder: str, failures: List[str]):
+    results = rec.complete.get(job_id, [])
+    if len(results) != 1:
+        failures.append(f"{job_id}: on_complete called {len(results)} times")
+        return
+    model = results[0].get('model_file')
+    expected = tmp / 'data' / username / rel_folder
+    if not results[0].get('success') or not model or Path(model).parent != expected or not os.path.isfile(model):
+        failures.append(f"{job_id}: model not stored under {expected}: {results[0]}")
+
+
+def scenario_e2e(tmp: Path, jobs: int, delay: float, failures: List[str]) -> dict:
+    rec = Recorder()
+    d = make_dispatcher(tmp, rec, ttl=30, delay=delay)
+    ids = [f"e2e-{i}" for i in range(jobs)]
+    started = time.monotonic()
+    for i, job_id in enumerate(ids):
+        d.submit(job_id, 'alice', f"e2e/{i}", make_image(tmp, job_id))
+    if not rec.wait(ids, timeout=jobs * delay + 10):
+        failures.append(f"e2e: only {len(rec.complete)}/{jobs} jobs completed")
+    for i, job_id in enumerate(ids):
+        check_model(tmp, rec, job_id, 'alice', f"e2e/{i}", failures)
+        if [p for _s, p in rec.status.get(job_id, [])] != [50, 90]:
+            failures.append(f"{job_id}: progress reports {rec.status.get(job_id)}")
+    return {'scenario': 'e2e', 'jobs': jobs, 'elapsed': round(time.monotonic() - started, 3)}
+
+
+def scenario_pending(tmp: Path, delay: float, failures: List[str]) -> dict:
+    rec = Recorder()
+    d = make_dispatcher(tmp, rec, ttl=30, delay=delay)
+    child = subprocess.Popen([sys.executable, '-c', _CHILD.format(
+        repo=str(REPO_ROOT), logs=str(Config.TRACE_DIR), data=str(tmp / 'data'), dispatch=str(tmp / 'dispatch'),
+        image=str(make_image(tmp, 'pending')))], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    child.stdout.readline()
+    while_alive = d.recover()
+    if while_alive:
+        failures.append(f"pending: adopted {while_alive} while the owner was alive")
+
+    child.stdin.close()
+    child.wait()
+    adopted = d.recover()
+    if adopted != ['orphan-pending']:
+        failures.append(f"pending: adopted {adopted} after the owner exited")
+    if not rec.wait(['orphan-pending'], timeout=delay + 10):
+        failures.append("pending: adopted job never completed")
+    check_model(tmp, rec, 'orphan-pending', 'bob', 'pending', failures)
+    job = d.store.get('orphan-pending')
+    if job.get('owner') != d.owner or job.get('lane') != 'bulk':
+        failures.append(f"pending: owner / lane not carried over: {job}")
+    return {'scenario': 'pending', 'while_alive': while_alive, 'adopted': adopted}
+
+
+def scenario_orphaned(tmp: Path, ttl: float, delay: float, failures: List[str]) -> dict:
+    rec = Recorder()
+    d = make_dispatcher(tmp, rec, ttl=ttl, delay=delay)
+    # 模拟已被远程 worker 接收的任务（_dispatch 成功后的状态）
+    d.registry.heartbeat('gpu-gone', 'http://127.0.0.1:1', 1, 1)
+    now = time.time()
+    d.store.create({
+        'job_id': 'orphan-assigned', 'username': 'carol', 'rel_folder': 'assigned',
+        'image_path': str(make_image(tmp, 'assigned')), 'status': 'training', 'message': '正在重建...',
+        'progress': 50, 'result': None, 'worker_id': 'gpu-gone', 'local': False, 'lane': None,
+        'owner': d.owner, 'attempt': 0, 'created_at': now, 'updated_at': now,
+    })
+    while_alive = d.recover()
+    if while_alive:
+        failures.append(f"orphaned: adopted {while_alive} while the worker was alive")
+
+    time.sleep(ttl + 0.2)
+    adopted = d.recover()
+    if adopted != ['orphan-assigned']:
+        failures.append(f"orphaned: adopted {adopted} after the worker expired")
+    if not rec.wait(['orphan-assigned'], timeout=delay + 10):
+        failures.append("orphaned: re-queued job never completed")
+    check_model(tmp, rec, 'orphan-assigned', 'carol', 'assigned', failures)
+
+    # 下线的 worker 迟到的结果（attempt 0）不能覆盖重新执行的结果
+    stale = d.complete('orphan-assigned', {'success': False, 'message': 'stale'}, '', None, attempt=0)
+    if stale or len(rec.complete['orphan-assigned']) != 1:
+        failures.append("orphaned: stale result of attempt 0 was applied")
+    return {'scenario': 'orphaned', 'while_alive': while_alive, 'adopted': adopted,
+            'attempt': d.store.get('orphan-assigned').get('attempt')}
+
+
+def scenario_tiles(tmp: Path, gaussians: int, tile_size: int, failures: List[str]) -> dict:
+    Config.DATA_DIR = tmp / 'data'
+    Config.DISPATCH_DIR = tmp / 'dispatch'
+    Config.DISPATCH_LOOPBACK_WORKERS = 0
+    Config.DISPATCH_RETRY_INTERVAL = 0.05
+    Config.WORKER_TOKEN = 'token'
+    Config.PREVIEW_ENABLED = False
+    from main import create_app
+    from routes import sharp
+    from utils.dispatcher import WORKER_TOKEN_HEADER
+    from utils.tools import generate_jwt
+
+    app = create_app('dispatch,storage,manager')
+    client = app.test_client()
+    d = sharp.dispatcher
+    reconstruct = converting_reconstruct(gaussians, tile_size)
+    d.add_worker(LoopbackWorker(d, tmp / 'scratch', reconstruct_fn=reconstruct))
+    d.submit('tiles-loopback', 'dave', 'tiles/loop', make_image(tmp, 'loop'))
+
+    # 远程 worker：任务已被接收，worker 在本地重建后把模型和分块索引 POST 到 result_url
+    now = time.time()
+    d.store.create({
+        'job_id': 'tiles-http', 'username': 'dave', 'rel_folder': 'tiles/http',
+        'image_path': str(make_image(tmp, 'http')), 'status': 'training', 'message': '正在重建...',
+        'progress': 50, 'result': None, 'worker_id': 'gpu-http', 'local': False, 'lane': None,
+        'owner': d.owner, 'attempt': 0, 'created_at': now, 'updated_at': now,
+    })
+    work_dir = tmp / 'remote' / 'http'
+    work_dir.mkdir(parents=True)
+    result = reconstruct(work_dir, work_dir)
+    model_path = Path(result.pop('model_file'))
+    with open(model_path, 'rb') as model, open(model_path.with_suffix('').with_suffix('.tiles.json'), 'rb') as tiles:
+        res = client.post('/dispatch/jobs/tiles-http/result?attempt=0', headers={WORKER_TOKEN_HEADER: 'token'},
+                          data={'result': json.dumps(result), 'model': (model, model_path.name),
+                                'tiles': (tiles, model_path.name.replace('.ply', '.tiles.json'))})
+    if res.status_code != 200:
+        failures.append(f"tiles: result upload returned {res.status_code} {res.get_json()}")
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and (d.store.get('tiles-loopback') or {}).get('status') != 'completed':
+        time.sleep(0.05)
+
+    headers = {'token': generate_jwt(1, 'dave')}
+    listed = {m['path']: m for m in client.get('/manager/list/', headers=headers).get_json()['data']['models']}
+    served = {}
+    for rel_model in ('tiles/loop/loop.ply', 'tiles/http/http.ply'):
+        entry = listed.get(rel_model)
+        if entry is None or not entry.get('tiles'):
+            failures.append(f"tiles: {rel_model} not listed with tiles: {entry}")
+            continue
+        res = client.get(f"/manager/tiles/{rel_model}", headers=headers)
+        if res.status_code != 200:
+            failures.append(f"tiles: index of {rel_model} returned {res.status_code}")
+            continue
+        index = res.get_json()
+        if len(index['tiles']) != int(entry['tiles']):
+            failures.append(f"tiles: {rel_model} lists {entry['tiles']} tiles, index has {len(index['tiles'])}")
+        res = client.get(f"/manager/tiles/{rel_model}?ids=0", headers=headers)
+        expected = index['tiles'][0][7] * index['row_size']
+        if res.status_code != 200 or len(res.data) != expected:
+            failures.append(f"tiles: tile 0 of {rel_model}: {res.status_code}, {len(res.data)} of {expected} bytes")
+        served[rel_model] = len(index['tiles'])
+    return {'scenario': 'tiles', 'served': served}
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=4, help='jobs of the e2e scenario')
+    parser.add_argument('--delay', type=float, default=0.2, help='fake reconstruction time in seconds')
+    parser.add_argument('--ttl', type=float, default=1.0, help='worker heartbeat TTL of the orphaned scenario')
+    parser.add_argument('--gaussians', type=int, default=20000, help='gaussians per model of the tiles scenario')
+    parser.add_argument('--tile-size', type=int, default=4096, help='convert tile size of the tiles scenario')
+    parser.add_argument('--out', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    # 与 load_test.py 相同：trace / 日志 / 指标写入临时目录
+    workdir = Path(tempfile.mkdtemp(prefix='sim-dispatch-'))
+    Config.LOG_DIR = workdir / 'logs'
+    Config.METRICS_DIR = Config.LOG_DIR / 'metrics'
+    Config.TRACE_DIR = Config.LOG_DIR / 'traces'
+    Config.LOG_DIR.mkdir(parents=True)
+
+    failures = []
+    results = []
+    for name in ('e2e', 'pending', 'orphaned', 'tiles'):
+        with tempfile.TemporaryDirectory(prefix=f'sim-dispatch-{name}-') as tmp:
+            tmp = Path(tmp)
+            if name == 'e2e':
+                r = scenario_e2e(tmp, args.jobs, args.delay, failures)
+            elif name == 'pending':
+                r = scenario_pending(tmp, args.delay, failures)
+            elif name == 'orphaned':
+                r = scenario_orphaned(tmp, args.ttl, args.delay, failures)
+            else:
+                r = scenario_tiles(tmp, args.gaussians, args.tile_size, failures)
+        results.append(r)
+        print(f"{name:>9}: {r}")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({'results': results, 'failures': failures}, indent=2))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print('OK' if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
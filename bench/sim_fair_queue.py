@@ -0,0 +1,143 @@
+"""Discrete-event simulation of the sharp job scheduler under contention.
+
+One heavy user bulk-uploads an album at t=0 while light users upload single
+photos at random times.  The same arrivals are run through
+utils.jobqueue.FairScheduler twice:
+
+    fifo   every job in one flow (the previous JobQueue behaviour)
+    fair   per-user flows, interactive / bulk lanes and the per-user cap,
+           with lane selection as in routes/sharp.choose_lane
+
+and the report shows queue wait times per class of user.  For the fair policy
+each light job's wait is checked against the bound implied by start-time fair
+queueing: at most one job per other active flow (bulk flows of weight w_bulk
+against interactive w_inter get ceil(w_bulk / w_inter) each) can be scheduled
+before it, plus one service time for a slot to free up:
+
+    wait <= max_service * (1 + ceil(jobs_ahead / slots))
+
+The script exits non-zero if any light job exceeds its bound.
+
+    python bench/sim_fair_queue.py
+    python bench/sim_fair_queue.py --slots 2 --bulk 500 --light-users 30 --out sim.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import math
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench.load_test import summarize  # noqa: E402
+from utils.jobqueue import FairScheduler  # noqa: E402
+
+
+def make_arrivals(args) -> List[dict]:
+    rng = random.Random(args.seed)
+    jobs = [{"id": f"heavy-{i}", "user": "heavy", "t": i * args.bulk_gap, "light": False} for i in range(args.bulk)]
+    for u in range(args.light_users):
+        for k in range(args.light_jobs):
+            jobs.append({"id": f"light{u}-{k}", "user": f"light{u}", "t": rng.uniform(0, args.window), "light": True})
+    for job in jobs:
+        job["service"] = max(0.1, rng.gauss(args.service, args.service_jitter))
+    return sorted(jobs, key=lambda j: j["t"])
+
+
+def simulate(arrivals: Sequence[dict], policy: str, args) -> Dict[str, dict]:
+    lane_weights = {"interactive": args.interactive_weight, "bulk": args.bulk_weight}
+    sched = FairScheduler(lane_weights, user_max_running=args.user_cap if policy == "fair" else 0)
+    max_service = max(j["service"] for j in arrivals)
+    jobs = {j["id"]: dict(j) for j in arrivals}
+    running: List[tuple] = []   # (finish_time, job_id, user)
+    pending = list(arrivals)
+    now = 0.0
+    i = 0
+    while i < len(pending) or running or len(sched):
+        next_arrival = pending[i]["t"] if i < len(pending) else math.inf
+        next_finish = running[0][0] if running else math.inf
+        now = min(next_arrival, next_finish)
+        while running and running[0][0] <= now:
+            _t, _job_id, user = heapq.heappop(running)
+            sched.done(user)
+        while i < len(pending) and pending[i]["t"] <= now:
+            job = jobs[pending[i]["id"]]
+            i += 1
+            if policy == "fair":
+                queued = sched.queued(job["user"])
+                job["lane"] = "bulk" if args.bulk_threshold and queued >= args.bulk_threshold else "interactive"
+                # 排在它前面的最多任务数：其他每个活跃流各一个（按权重折算）
+                ahead = 0
+                for (user, lane) in {f for f in sched._flows}:
+                    if user != job["user"]:
+                        ahead += math.ceil(lane_weights.get(lane, 1) / lane_weights[job["lane"]])
+                job["bound"] = max_service * (1 + math.ceil((ahead + len(running)) / args.slots))
+                sched.push(job["id"], job["user"], job["lane"])
+            else:
+                sched.push(job["id"])
+        while len(running) < args.slots:
+            picked = sched.pop()
+            if picked is None:
+                break
+            job = jobs[picked[0]]
+            job["wait"] = now - job["t"]
+            heapq.heappush(running, (now + job["service"], job["id"], job["user"] if policy == "fair" else None))
+
+    light = [j for j in jobs.values() if j["light"]]
+    heavy = [j for j in jobs.values() if not j["light"]]
+    report = {
+        "light_wait_s": summarize([j["wait"] for j in light]),
+        "heavy_wait_s": summarize([j["wait"] for j in heavy]),
+        "makespan_s": round(now, 1),
+    }
+    if policy == "fair":
+        violations = [j for j in light if j["wait"] > j["bound"] + 1e-9]
+        report["bound_violations"] = len(violations)
+        report["max_wait_over_bound"] = round(max(j["wait"] / j["bound"] for j in light), 3) if light else None
+    return report
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Simulate FIFO vs fair sharp scheduling")
+    ap.add_argument("--slots", type=int, default=1, help="GPU slots (SHARP_MAX_CONCURRENT)")
+    ap.add_argument("--bulk", type=int, default=200, help="Jobs in the heavy user's bulk upload")
+    ap.add_argument("--bulk-gap", type=float, default=0.5, help="Seconds between the heavy user's uploads")
+    ap.add_argument("--light-users", type=int, default=20)
+    ap.add_argument("--light-jobs", type=int, default=1, help="Uploads per light user")
+    ap.add_argument("--window", type=float, default=3600, help="Light uploads arrive uniformly in [0, window]")
+    ap.add_argument("--service", type=float, default=30.0, help="Mean reconstruction time (s)")
+    ap.add_argument("--service-jitter", type=float, default=5.0)
+    ap.add_argument("--interactive-weight", type=float, default=4)
+    ap.add_argument("--bulk-weight", type=float, default=1)
+    ap.add_argument("--user-cap", type=int, default=1, help="SHARP_USER_MAX_RUNNING")
+    ap.add_argument("--bulk-threshold", type=int, default=3, help="SHARP_BULK_THRESHOLD")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", type=Path, default=None)
+    args = ap.parse_args(argv)
+
+    arrivals = make_arrivals(args)
+    report = {"params": vars(args) | {"out": None}}
+    for policy in ("fifo", "fair"):
+        result = simulate(arrivals, policy, args)
+        report[policy] = result
+        lw, hw = result["light_wait_s"], result["heavy_wait_s"]
+        print(f"{policy:<5} light wait p50={lw['p50']} p95={lw['p95']} max={lw['max']}  "
+              f"heavy wait p50={hw['p50']} max={hw['max']}  makespan={result['makespan_s']}")
+    fair = report["fair"]
+    print(f"fair: {fair['bound_violations']} light jobs over the SFQ bound "
+          f"(max wait / bound = {fair['max_wait_over_bound']})")
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 1 if fair["bound_violations"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+"""Timeout / cancel check of the sharp subprocess against a hanging stub.
+
+Runs trainer_image.ImageModelTrainer.train with bench/stub_sharp.py --hang as
+the sharp command (no conda).  The stub stops at 50%, starts a grandchild and
+both ignore SIGTERM, so only the SIGKILL escalation in _kill_process_group ends
+them.  Two scenarios:
+
+    timeout   train(timeout=T): must return timed_out within T + grace + slack
+    cancel    cancel_event set after the stub hangs: must return cancelled
+              within poll interval + grace + slack
+
+After each run no live process may remain in the stub's process group (read
+from /proc; zombies waiting for their parent to reap them are not counted).
+train() only waits for the group leader, so an orphaned grandchild that got
+SIGKILL is given --settle seconds to disappear before it counts as a survivor.
+The script exits non-zero if any check fails.
+
+    python bench/sim_hang.py
+    python bench/sim_hang.py --timeout 3 --grace 2 --out hang.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from config import Config  # noqa: E402
+from trainer_image import ImageModelTrainer, _POLL_INTERVAL  # noqa: E402
+
+_HANG_RE = re.compile(r'hang: pid (\d+) grandchild (\d+) pgid (\d+)')
+
+
+def group_members(pgid: int) -> List[int]:
+    """Live (non-zombie) pids whose process group is pgid"""
+    members = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm 可能含空格和括号，从最后一个 ')' 之后解析
+        fields = stat[stat.rindex(')') + 2:].split()
+        if fields[0] != 'Z' and int(fields[2]) == pgid:
+            members.append(int(name))
+    return members
+
+
+def survivors_after(pgid: int, settle: float) -> List[int]:
+    """group_members(pgid) once it is empty, or what is left after settle seconds"""
+    deadline = time.monotonic() + settle
+    while True:
+        members = group_members(pgid)
+        if not members or time.monotonic() >= deadline:
+            return members
+        time.sleep(0.02)
+
+
+def run(scenario: str, input_dir: Path, output_dir: Path, timeout: float, cancel_after: float,
+        settle: float) -> dict:
+    trainer = ImageModelTrainer()
+    cancel = threading.Event()
+    hung = {}
+
+    if scenario == 'cancel':
+        threading.Timer(cancel_after, cancel.set).start()
+    started = time.monotonic()
+    result = trainer.train(input_dir, output_dir,
+                           timeout=timeout if scenario == 'timeout' else 0, cancel_event=cancel)
+    elapsed = time.monotonic() - started
+    cancel_latency = elapsed - cancel_after if scenario == 'cancel' else None
+
+    for line in result.get('log', []):
+        m = _HANG_RE.search(line)
+        if m:
+            hung = {'pid': int(m.group(1)), 'grandchild': int(m.group(2)), 'pgid': int(m.group(3))}
+    survivors = survivors_after(hung['pgid'], settle) if hung else None
+    return {
+        'scenario': scenario,
+        'elapsed': round(elapsed, 3),
+        'cancel_latency': round(cancel_latency, 3) if cancel_latency is not None else None,
+        'timed_out': bool(result.get('timed_out')),
+        'cancelled': bool(result.get('cancelled')),
+        'hung': hung,
+        'survivors': survivors,
+    }
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--timeout', type=float, default=2.0, help='predict timeout of the timeout scenario')
+    parser.add_argument('--grace', type=float, default=1.0, help='SHARP_KILL_GRACE (SIGTERM -> SIGKILL)')
+    parser.add_argument('--cancel-after', type=float, default=1.5, help='seconds before cancelling')
+    parser.add_argument('--slack', type=float, default=1.0, help='allowed scheduling overhead in seconds')
+    parser.add_argument('--settle', type=float, default=0.5,
+                        help='seconds a SIGKILLed grandchild may take to disappear from /proc')
+    parser.add_argument('--out', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    Config.SHARP_COMMAND = f"{sys.executable} {REPO_ROOT / 'bench' / 'stub_sharp.py'} --hang --latency 0.5"
+    Config.SHARP_USE_CONDA = False
+    Config.SHARP_KILL_GRACE = args.grace
+
+    failures = []
+    results = []
+    with tempfile.TemporaryDirectory(prefix='sim-hang-') as tmp:
+        input_dir = Path(tmp) / 'in'
+        input_dir.mkdir()
+        (input_dir / 'photo.jpg').write_bytes(b'\xff\xd8\xff\xd9')
+        for scenario in ('timeout', 'cancel'):
+            r = run(scenario, input_dir, Path(tmp) / scenario, args.timeout, args.cancel_after, args.settle)
+            results.append(r)
+            if not r['hung']:
+                failures.append(f"{scenario}: stub never reached the hang point")
+            elif r['survivors']:
+                failures.append(f"{scenario}: processes left in group {r['hung']['pgid']}: {r['survivors']}")
+            if scenario == 'timeout':
+                bound = args.timeout + args.grace + args.slack
+                if not r['timed_out'] or r['elapsed'] > bound:
+                    failures.append(f"timeout: timed_out={r['timed_out']} after {r['elapsed']}s (bound {bound}s)")
+            else:
+                bound = _POLL_INTERVAL + args.grace + args.slack
+                if not r['cancelled'] or r['cancel_latency'] > bound:
+                    failures.append(f"cancel: cancelled={r['cancelled']} {r['cancel_latency']}s after the "
+                                    f"request (bound {bound}s)")
+            print(f"{scenario:>8}: returned after {r['elapsed']:.2f}s"
+                  + (f" ({r['cancel_latency']:.2f}s after cancel)" if r['cancel_latency'] is not None else '')
+                  + f", hung={r['hung']}, survivors={r['survivors']}")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({'results': results, 'failures': failures}, indent=2))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print('OK' if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Stand-in for the `sharp` CLI, for load-testing without a GPU or the ml-sharp env.
+
+Accepts `sharp predict -i <input_dir> -o <output_dir>`, sleeps for the simulated
+inference latency while printing tqdm-style progress (so trainer_image parses
+progress as with the real CLI), then writes a teaser-like PLY named after the
+first input image into the output directory.
+
+Behaviour is configured with options or environment variables (options win):
+
+    --latency / STUB_SHARP_LATENCY       mean inference time in seconds (default 2)
+    --jitter / STUB_SHARP_JITTER         +- uniform jitter in seconds (default 0)
+    --gaussians / STUB_SHARP_GAUSSIANS   gaussians in the output PLY (default 100000)
+    --fail-rate / STUB_SHARP_FAIL_RATE   probability of exiting with status 1 (default 0)
+    --hang / STUB_SHARP_HANG=1           stop at 50% and never exit: starts a grandchild, and both
+                                         ignore SIGTERM, so only the SIGKILL escalation of
+                                         trainer_image._kill_process_group stops them
+                                         (prints "hang: pid <pid> grandchild <pid> pgid <pgid>")
+    --seed / STUB_SHARP_SEED             RNG seed (default: random)
+
+Point the server at it with
+    QS_SHARP_COMMAND="python /path/to/bench/stub_sharp.py" QS_SHARP_USE_CONDA=0
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench import gen_ply  # noqa: E402
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".jfif")
+PROGRESS_STEPS = 20
+
+
+def _env(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="sharp", description="Stub sharp CLI for load tests")
+    ap.add_argument("--latency", type=float, default=float(_env("STUB_SHARP_LATENCY", "2")))
+    ap.add_argument("--jitter", type=float, default=float(_env("STUB_SHARP_JITTER", "0")))
+    ap.add_argument("--gaussians", type=int, default=int(_env("STUB_SHARP_GAUSSIANS", "100000")))
+    ap.add_argument("--fail-rate", type=float, default=float(_env("STUB_SHARP_FAIL_RATE", "0")))
+    ap.add_argument("--hang", action="store_true", default=_env("STUB_SHARP_HANG", "0") == "1")
+    ap.add_argument("--seed", type=int, default=int(_env("STUB_SHARP_SEED", "-1")))
+    sub = ap.add_subparsers(dest="command", required=True)
+    predict = sub.add_parser("predict")
+    predict.add_argument("-i", "--input", type=Path, required=True)
+    predict.add_argument("-o", "--output", type=Path, required=True)
+    args = ap.parse_args(argv)
+
+    rng = random.Random(None if args.seed < 0 else args.seed)
+    images = sorted(p for p in args.input.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not images:
+        print(f"error: no input images in {args.input}", flush=True)
+        return 2
+    print(f"Loaded {len(images)} image(s) from {args.input}", flush=True)
+
+    latency = max(0.0, args.latency + rng.uniform(-args.jitter, args.jitter))
+    fail_at = rng.randint(1, PROGRESS_STEPS) if rng.random() < args.fail_rate else None
+    for step in range(1, PROGRESS_STEPS + 1):
+        time.sleep(latency / PROGRESS_STEPS)
+        print(f"predict: {step * 100 // PROGRESS_STEPS}%| {step}/{PROGRESS_STEPS}", flush=True)
+        if step == fail_at:
+            print("error: simulated inference failure (stub)", flush=True)
+            return 1
+        if args.hang and step == PROGRESS_STEPS // 2:
+            _hang()
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    out = gen_ply.write_teaser_ply(args.output / f"{images[0].stem}.ply", args.gaussians,
+                                   seed=rng.randrange(2 ** 32))
+    print(f"Saved {out}", flush=True)
+    return 0
+
+
+def _hang() -> None:
+    """Simulate a stuck inference: a grandchild in the same process group, neither exits on SIGTERM"""
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # 子进程继承 SIG_IGN；stdout 不接管道，模拟脱离输出的后台进程
+    child = subprocess.Popen([sys.executable, "-c", "import time\nwhile True: time.sleep(60)"],
+                             stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    print(f"hang: pid {os.getpid()} grandchild {child.pid} pgid {os.getpgid(0)}", flush=True)
+    while True:
+        time.sleep(60)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -31,14 +31,27 @@ class Config:
     DEBUG = True
     
     USE_GPU_SERVER = True  #启用GPU服务器进行模型转换
+
+    # 应用角色（auth / viewer / storage / manager / inference / dispatch / worker），可组合在同一进程中部署
+    # None 表示按 USE_GPU_SERVER 推导；也可通过环境变量 QS_APP_ROLES="auth,viewer,storage" 覆盖
+    APP_ROLES = None
+    BUSINESS_ROLES = ('auth', 'viewer')
+    GPU_ROLES = ('inference', 'storage', 'manager')
     
     # 文件上传配置
     MAX_VIDEO_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB
     ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
-    UPLOAD_VIDEO_CHUNK_SIZE = 8192
+    UPLOAD_VIDEO_CHUNK_SIZE = 1024 * 1024         # 分片写入时每次读取请求体 / 写入文件的字节数
     
     MAX_IMAGE__CONTENT_LENGTH = 30 * 1024 * 1024  # 500MB
     ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'jfif'}
+
+    # 断点续传上传（/sharp/uploads，见 utils.uploads）：大文件分片上传，断线后从已收到的偏移量继续
+    UPLOAD_DIR = DATA_DIR / ".uploads"            # 上传中的会话（需与 DATA_DIR 在同一文件系统）
+    UPLOAD_MAX_CHUNK_SIZE = 32 * 1024 * 1024      # 单个分片上限（小于 nginx client_max_body_size）
+    UPLOAD_MAX_SESSIONS = 20                      # 每个用户同时进行的上传会话数
+    UPLOAD_SESSION_TTL = 24 * 3600                # 超过该时间没有写入的会话被清理（秒）
+    UPLOAD_GC_INTERVAL = 3600                     # 清理间隔（秒）
     
     Target_File = "train.ply"
     
@@ -52,10 +65,146 @@ class Config:
     GAUSSIAN_REPO_PATH = Path("/home/fzg25/project/ml-sharp")
     #虚拟环境名
     GAUSSIAN_ENV = "sharp"
+    # sharp 可执行文件；压测时可设 QS_SHARP_COMMAND="python bench/stub_sharp.py"、QS_SHARP_USE_CONDA=0
+    SHARP_COMMAND = os.environ.get('QS_SHARP_COMMAND', 'sharp')
+    SHARP_USE_CONDA = os.environ.get('QS_SHARP_USE_CONDA', '1') != '0'
+
+    # 重建任务调度与超时（秒，0 表示不限）
+    SHARP_MAX_CONCURRENT = 1                      # 同时执行的重建任务数（GPU 槽位）
+    SHARP_QUEUE_TIMEOUT = 3600                    # 排队等待槽位的最长时间
+    SHARP_PREDICT_TIMEOUT = 900                   # sharp predict 阶段的最长时间
+    SHARP_KILL_GRACE = 5                          # 超时/取消时 SIGTERM 到 SIGKILL 的等待时间
+    # 按用户加权公平排队（utils.jobqueue.FairScheduler）：每个用户的每个通道各自排队，轮流占用 GPU
+    SHARP_LANE_WEIGHTS = {'interactive': 4, 'bulk': 1}  # 通道权重：单张上传优先于批量导入
+    SHARP_USER_WEIGHTS = {}                       # 个别用户的权重（默认 1）
+    SHARP_USER_MAX_RUNNING = 1                    # 单用户同时执行的任务数上限（0 表示不限）
+    SHARP_BULK_THRESHOLD = 3                      # 用户已有这么多任务排队时，新上传自动进入 bulk 通道
+
+    # 重建日志：内存中只保留尾部若干行，转发到 app.log 时限速
+    TRAIN_LOG_TAIL_LINES = 200
+    TRAIN_LOG_RATE_LINES = 20                     # 每个窗口最多转发的行数
+    TRAIN_LOG_RATE_WINDOW = 10                    # 限速窗口（秒）
+    TRAIN_LOG_SAMPLE_EVERY = 50                   # 超出限速后每隔多少行抽样转发一行（0 表示全部省略）
     
 
     
     
+    # ==================== 远程 GPU worker 分派 ====================
+    # 业务服务器（dispatch 角色）保存上传文件并把任务分派给已注册的 GPU worker（worker 角色）
+    DISPATCHER_URL = "http://127.0.0.1:8090"      # GPU worker 访问业务服务器的地址
+    WORKER_TOKEN = "your-worker-token-change-this"  # 业务服务器与 worker 之间的共享令牌
+    WORKER_ID = None                              # 默认 主机名:端口
+    WORKER_PUBLIC_URL = "http://101.6.64.77:21000"  # 业务服务器访问 worker 的地址
+    WORKER_CAPACITY = 1                           # 单个 worker 同时执行的任务数
+    WORKER_HEARTBEAT_INTERVAL = 10                # worker 心跳间隔（秒）
+    WORKER_HEARTBEAT_TTL = 30                     # 超过该时间无心跳视为下线（秒）
+    WORKER_SCRATCH_DIR = BASE_DIR / "worker_scratch"
+    DISPATCH_DIR = DATA_DIR / ".dispatch"         # 任务与 worker 注册表（多进程共享）
+    DISPATCH_RETRY_INTERVAL = 5                   # 无空闲 worker 时的重试间隔（秒）
+    DISPATCH_LOOPBACK_WORKERS = 0                 # 进程内 loopback worker 数（测试 / 单机部署）
+    
+    # ==================== 删除与回收站 ====================
+    # 删除模型时整个文件夹移入 DATA_DIR/<user>/.trash，超过撤销窗口后由后台线程限速删除
+    TRASH_UNDO_WINDOW = 600                       # 可撤销删除的时间（秒）
+    TRASH_REAP_INTERVAL = 60                      # 回收站扫描间隔（秒）
+    TRASH_REAP_BYTES_PER_SEC = 64 * 1024 * 1024   # 删除限速（字节/秒，0 表示不限）
+    TRASH_REAP_FILES_PER_SEC = 200                # 删除限速（文件数/秒，0 表示不限）
+    MANAGER_BATCH_MAX_OPS = 500                   # /manager/batch 单次请求的最大操作数
+    
+    # ==================== 模型预览图 ====================
+    # 转换完成后在进程池中渲染 <模型名>.preview.png，供模型列表展示
+    PREVIEW_ENABLED = True
+    PREVIEW_SIZE = 256                            # 预览图边长（像素）
+    PREVIEW_TOP_K = 60000                         # 参与渲染的最重要高斯数
+    PREVIEW_WORKERS = 1                           # 渲染进程数
+    PREVIEW_MAX_AGE = 30 * 24 * 3600              # 预览图 Cache-Control max-age（秒）
+    
+    # ==================== 视频关键帧 ====================
+    # 上传的视频按清晰度与画面差异选出关键帧，每帧作为一张图片进入重建队列（见 keyframes.py）
+    FFMPEG_PATH = "ffmpeg"
+    FFPROBE_PATH = "ffprobe"
+    VIDEO_KEYFRAMES = 1                           # 每个视频生成的模型数（1 表示只用最佳画面）
+    VIDEO_SAMPLE_FPS = 4.0                        # 每秒视频参与打分的帧数
+    VIDEO_MAX_FRAMES = 1200                       # 参与打分的最大帧数（长视频自动降低采样率）
+    VIDEO_SCORE_WIDTH = 320                       # 打分时的画面宽度（像素）
+    VIDEO_BLUR_QUANTILE = 0.5                     # 只在清晰度不低于该分位数的帧中选择
+    VIDEO_MIN_DIFFERENCE = 0.1                    # 关键帧之间的最小画面差异（0~1，越大越不相似）
+    VIDEO_FRAME_QUALITY = 2                       # 导出关键帧的 JPEG 质量（ffmpeg -q:v，2~31，越小越好）
+    VIDEO_SCORE_WORKERS = 2                       # 打分进程数（0 表示在任务线程内计算）
+    VIDEO_MAX_CONCURRENT = 2                      # 同时解析的视频数
+
+    # ==================== 空间分块 ====================
+    # 转换时按八叉树把高斯分块写出，并生成 <模型名>.tiles.json，客户端可按块 Range 拉取
+    TILE_TARGET_GAUSSIANS = 16384                 # 每块最多高斯数（0 表示不分块）
+    
+    # ==================== 高斯裁剪 ====================
+    # 转换时丢弃非有限值、近乎透明、过小 / 过大的高斯以及离群点（见 convert.PruneOptions）
+    PRUNE_ENABLED = False
+    PRUNE_MIN_OPACITY = 0.005                     # sigmoid(opacity) 下限
+    PRUNE_MIN_SCALE = 0.0                         # exp(scale) 最大轴下限（0 表示不限）
+    PRUNE_MAX_SCALE = 0.0                         # exp(scale) 最大轴上限（0 表示不限）
+    PRUNE_OUTLIER_K = 8                           # 离群点检测近邻数（0 表示不检测）
+    PRUNE_OUTLIER_STD = 3.0                       # 离群阈值：mean + STD * std
+    PRUNE_OUTLIER_METHOD = 'grid'                 # grid（仅 NumPy）或 kdtree（需要 scipy）
+    
+    # ==================== 批量重转换 ====================
+    # python -m utils.reconvert：转换器升级后重新转换全部模型
+    RECONVERT_WORKERS = 2                         # 转换进程数
+    RECONVERT_BYTES_PER_SEC = 64 * 1024 * 1024    # 所有进程合计读写限速（字节/秒，0 表示不限）
+    
+    # ==================== 冷存储分层 ====================
+    # 超过 COLD_AFTER_DAYS 未访问的模型 gzip 压缩后移到 COLD_DIR（可挂载慢速盘），首次访问时自动恢复（见 utils.tiering）
+    COLD_TIER_ENABLED = False                     # 是否启动后台分层线程（manager 角色）
+    COLD_DIR = DATA_DIR / ".cold"
+    COLD_AFTER_DAYS = 90                          # 未访问多少天后移入冷存储
+    COLD_SCAN_INTERVAL = 6 * 3600                 # 扫描间隔（秒）
+    COLD_BYTES_PER_SEC = 32 * 1024 * 1024         # 压缩时读取限速（字节/秒，0 表示不限）
+    COLD_COMPRESS_LEVEL = 6                       # gzip 压缩级别
+    COLD_REHYDRATE = True                         # 首次访问时解压回原位置；False 时只流式解压返回（只读副本）
+    ACCESS_TOUCH_INTERVAL = 24 * 3600             # 索引中访问时间的最小更新间隔（秒，0 表示不记录）
+
+    # ==================== 存储一致性检查 ====================
+    # python -m utils.fsck：比对磁盘与 models.xml，修复悬空记录、隔离孤立文件（见 utils.fsck）
+    FSCK_GRACE_SECONDS = 2 * 24 * 3600            # 文件夹最近修改后多久才处理（秒，避免误伤进行中的任务）
+    FSCK_QUARANTINE_DAYS = 30                     # 隔离区（DATA_DIR/.quarantine）保留天数
+    
+    # ==================== 存储统计与配额 ====================
+    # 每个用户的占用记录在 DATA_DIR/<user>/usage.json，增量维护并定期全量校正
+    USER_QUOTA_BYTES = 10 * 1024 * 1024 * 1024    # 单用户存储上限（字节，0 表示不限）
+    USER_QUOTA_FILES = 0                          # 单用户文件数上限（0 表示不限）
+    USAGE_RECONCILE_INTERVAL = 6 * 3600           # 全量校正间隔（秒）
+    
+    # ==================== 接口响应 ====================
+    JSON_BACKEND = 'auto'                         # json_response 序列化后端：auto（有 orjson 用 orjson）/ orjson / json
+    
+    # ==================== 日志 ====================
+    # 日志先进入有界队列，由后台线程写 LOG_DIR/app.log（见 utils.logs）
+    LOG_LEVEL = 'INFO'
+    LOG_FORMAT = 'json'                           # json（每行一个 JSON 对象）或 text
+    LOG_MAX_BYTES = 100 * 1024 * 1024             # 超过该大小轮转（0 表示不按大小）
+    LOG_ROTATE_INTERVAL = 24 * 3600               # 按本地时间整点轮转的间隔（秒，0 表示不按时间）
+    LOG_BACKUP_COUNT = 14                         # 保留的历史日志文件数
+    LOG_QUEUE_SIZE = 10000                        # 队列满时丢弃 WARNING 以下的记录
+    LOG_BLOCK_TIMEOUT = 1.0                       # 队列满时 WARNING 及以上最多等待（秒）
+    
+    # ==================== 监控指标 ====================
+    METRICS_ENABLED = True
+    METRICS_DIR = LOG_DIR / "metrics"             # 各进程的指标快照，/metrics 汇总
+    METRICS_FLUSH_INTERVAL = 2                    # 快照写入间隔（秒）
+    METRICS_TOKEN = None                          # /metrics 需要 Authorization: Bearer <token>；未设置时拒绝访问
+    
+    # ==================== 请求 profiling ====================
+    # 开启后带有效签名请求头 X-Profile（python -m utils.profiling token）或被抽中的请求会记录 cProfile
+    PROFILING_ENABLED = False                     # 关闭时不注册任何钩子
+    PROFILING_SECRET = None                       # 签名请求头、访问 /debug/profiles 的管理员密钥
+    PROFILING_SAMPLE_RATE = 0.0                   # 抽样比例（0~1）
+    PROFILING_DIR = LOG_DIR / "profiles"
+    PROFILING_MAX_FILES = 200                     # 最多保留的 profile 数
+    
+    # ==================== 任务 trace ====================
+    TRACE_DIR = LOG_DIR / "traces"                # 每个任务一个 JSON-lines 文件
+    TRACE_RETENTION_DAYS = 7
+    
     # 用户会话配置
     SECRET_KEY = "your-secret-key-change-this"
     
@@ -66,6 +215,17 @@ class Config:
         for dir_path in dirs:
             dir_path.mkdir(exist_ok=True)
     
+    @classmethod
+    def resolve_roles(cls, roles=None):
+        """解析应用角色：参数 > 环境变量 QS_APP_ROLES > APP_ROLES > USE_GPU_SERVER"""
+        if roles is None:
+            roles = os.environ.get('QS_APP_ROLES') or cls.APP_ROLES
+        if roles is None:
+            roles = cls.GPU_ROLES if cls.USE_GPU_SERVER else cls.BUSINESS_ROLES
+        if isinstance(roles, str):
+            roles = roles.split(',')
+        return {r.strip().lower() for r in roles if r and r.strip()}
+
     @classmethod
     def get_user_dir(cls, username):
         """获取用户目录"""
@@ -15,11 +15,28 @@ Output vertex schema (17 float32 properties, in this exact order):
 Notes
 - No SH high-order terms: f_rest_* are NOT written.
 - Output is binary_little_endian 1.0.
+
+Spatial tiles
+- With tile_size > 0 the rows are written grouped into spatial tiles (adaptive
+  octree cells in Morton order, each holding <= tile_size gaussians),
+  and `<output>.tiles.json` lists every tile's bounds and row range, so clients can
+  fetch only the tiles they need with HTTP Range requests.  The output is still a
+  plain Scheme-B PLY; only the row order changes.
+
+Pruning (optional, see PruneOptions)
+- Rows are dropped before tiling, rule by rule: non-finite values, low
+  sigmoid(opacity), too small / too large exp(scale), and statistical outliers
+  (mean distance to the k nearest neighbours above mean + std_ratio * std).
+  Each removed row is counted against the first rule that matched.
+- Neighbour distances come from scipy's cKDTree (method "kdtree", exact, needs
+  scipy) or from a voxel-density estimate (method "grid", NumPy only, default).
 """
 
 from __future__ import annotations
 
 import argparse
+import json
+import os
 import struct
 from dataclasses import dataclass
 from pathlib import Path
@@ -38,6 +55,16 @@ class PlyHeader:
     data_start_offset: int
 
 
+@dataclass(frozen=True)
+class PruneOptions:
+    min_opacity: float = 0.0       # sigmoid(opacity) 下限，0 表示不按不透明度裁剪
+    min_scale: float = 0.0         # exp(scale) 三轴最大值下限（过小的高斯），0 表示不限
+    max_scale: float = 0.0         # exp(scale) 三轴最大值上限（过大的高斯），0 表示不限
+    outlier_k: int = 0             # 离群点检测的近邻数，0 表示不做离群点检测
+    outlier_std: float = 3.0       # 平均近邻距离超过 mean + outlier_std * std 视为离群
+    outlier_method: str = "grid"   # grid（NumPy 体素密度估计）或 kdtree（scipy cKDTree，精确）
+
+
 _PLY_TYPE_TO_STRUCT = {
     "char": "b",
     "int8": "b",
@@ -58,6 +85,14 @@ _PLY_TYPE_TO_STRUCT = {
 }
 
 
+_PLY_TYPE_TO_NUMPY = {t: np.dtype(c).str[1:] for t, c in _PLY_TYPE_TO_STRUCT.items()}
+
+# 输出格式或转换逻辑变化时递增；批量重转换（utils.reconvert）据此判断模型是否需要重新转换
+CONVERTER_VERSION = 2
+TILES_SUFFIX = ".tiles.json"
+DEFAULT_TILE_SIZE = 16384
+
+
 def _readline_ascii(f) -> bytes:
     line = f.readline()
     if not line:
@@ -154,30 +189,30 @@ def _struct_for_vertex(props: Sequence[Tuple[str, str]], endian: str) -> struct.
     return struct.Struct(fmt)
 
 
+def _dtype_for_vertex(props: Sequence[Tuple[str, str]], endian: str) -> np.dtype:
+    try:
+        return np.dtype([(name, endian + _PLY_TYPE_TO_NUMPY[t]) for t, name in props])
+    except KeyError as e:
+        raise ValueError(f"Unsupported PLY scalar type: {e}") from e
+
+
 def read_vertex_table_binary(path: Path, header: PlyHeader) -> dict[str, np.ndarray]:
     if header.format not in ("binary_little_endian", "binary_big_endian"):
         raise ValueError(f"Only binary PLY is supported. Got: {header.format}")
 
     endian = _endian_for_format(header.format)
-    st = _struct_for_vertex(header.vertex_properties, endian)
-
-    arrays: dict[str, np.ndarray] = {}
-    for _ptype, pname in header.vertex_properties:
-        arrays[pname] = np.empty((header.vertex_count,), dtype=np.float32)
+    dtype = _dtype_for_vertex(header.vertex_properties, endian)
 
+    # 整表一次读入结构化数组，再按列转换为 float32
     with path.open("rb") as f:
         f.seek(header.data_start_offset)
-        for i in range(header.vertex_count):
-            chunk = f.read(st.size)
-            if len(chunk) != st.size:
-                raise EOFError(
-                    f"Unexpected EOF while reading vertex data at {i}/{header.vertex_count}"
-                )
-            values = st.unpack(chunk)
-            for (_ptype, pname), v in zip(header.vertex_properties, values):
-                arrays[pname][i] = float(v)
+        rows = np.fromfile(f, dtype=dtype, count=header.vertex_count)
+    if rows.shape[0] != header.vertex_count:
+        raise EOFError(
+            f"Unexpected EOF while reading vertex data at {rows.shape[0]}/{header.vertex_count}"
+        )
 
-    return arrays
+    return {pname: rows[pname].astype(np.float32) for _ptype, pname in header.vertex_properties}
 
 
 def write_ply_binary_vertex_only(
@@ -185,7 +220,8 @@ def write_ply_binary_vertex_only(
     vertex_count: int,
     schema: Sequence[Tuple[str, str]],
     columns: dict[str, np.ndarray],
-) -> None:
+) -> int:
+    """Write the vertex-only PLY; returns the byte offset where vertex data starts"""
     header_lines: List[str] = [
         "ply",
         "format binary_little_endian 1.0",
@@ -194,9 +230,7 @@ def write_ply_binary_vertex_only(
     for p_type, p_name in schema:
         header_lines.append(f"property {p_type} {p_name}")
     header_lines.append("end_header")
-    header = "\n".join(header_lines) + "\n"
-
-    st = _struct_for_vertex(schema, "<")
+    header = ("\n".join(header_lines) + "\n").encode("ascii")
 
     for _t, name in schema:
         if name not in columns:
@@ -206,11 +240,187 @@ def write_ply_binary_vertex_only(
                 f"Column {name} has {columns[name].shape[0]} rows, expected {vertex_count}"
             )
 
+    rows = np.empty((vertex_count,), dtype=_dtype_for_vertex(schema, "<"))
+    for _t, name in schema:
+        rows[name] = columns[name]
+
     with path.open("wb") as f:
-        f.write(header.encode("ascii"))
-        for i in range(vertex_count):
-            row = [columns[name][i] for _t, name in schema]
-            f.write(st.pack(*row))
+        f.write(header)
+        rows.tofile(f)
+    return len(header)
+
+
+def tiles_path(model_path) -> str:
+    """model.ply -> model.tiles.json"""
+    return os.path.splitext(str(model_path))[0] + TILES_SUFFIX
+
+
+_MORTON_BITS = 10  # 每轴 10 位：八叉树最多 10 层
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Insert two zero bits between each of the low 10 bits (Morton encoding)"""
+    v = v.astype(np.uint64) & np.uint64(0x3FF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x030000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x0300F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x030C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x09249249)
+    return v
+
+
+def spatial_tiles(x: np.ndarray, y: np.ndarray, z: np.ndarray, tile_size: int):
+    """Partition gaussians into spatially compact tiles (adaptive octree).
+
+    Positions are quantized to a 1024^3 grid over the finite bounds and sorted
+    by Morton code, so every octree cell is a contiguous run of rows; a cell is
+    split into its 8 children (np.searchsorted on the sorted codes) until it
+    holds <= tile_size gaussians or reaches the grid resolution.  Tiles come
+    out in Morton order, so neighbouring tiles are spatially close.  Rows with
+    non-finite positions go to a final tile without bounds.
+
+    Returns (order, tiles): order is the row permutation, tiles a list of
+    (bbox or None, first_row, count) in output order.
+    """
+    xyz = np.stack([x, y, z], axis=1)
+    finite = np.isfinite(xyz).all(axis=1)
+    order = np.flatnonzero(finite)
+    tiles = []
+    if order.size:
+        pts = xyz[order]
+        lo = pts.min(axis=0)
+        extent = np.maximum(pts.max(axis=0) - lo, 1e-12)
+        cells = np.minimum(((pts - lo) / extent * (1 << _MORTON_BITS)).astype(np.int64), (1 << _MORTON_BITS) - 1)
+        codes = (_spread_bits(cells[:, 0]) | (_spread_bits(cells[:, 1]) << np.uint64(1))
+                 | (_spread_bits(cells[:, 2]) << np.uint64(2)))
+        by_code = np.argsort(codes, kind="stable")
+        codes = codes[by_code]
+        order = order[by_code]
+        pts = pts[by_code]
+
+        ranges = []
+        stack = [(0, order.size, 0)]
+        while stack:
+            start, end, level = stack.pop()
+            if end - start <= tile_size or level == _MORTON_BITS:
+                ranges.append((start, end))
+                continue
+            cell_bits = np.uint64(3 * (_MORTON_BITS - level))
+            child_bits = np.uint64(3 * (_MORTON_BITS - level - 1))
+            base = (codes[start] >> cell_bits) << cell_bits
+            bounds = np.searchsorted(codes[start:end], base + (np.arange(1, 8, dtype=np.uint64) << child_bits))
+            edges = [start, *(bounds + start).tolist(), end]
+            # 逆序入栈，按 Morton 顺序输出
+            for a, b in reversed(list(zip(edges[:-1], edges[1:]))):
+                if b > a:
+                    stack.append((a, b, level + 1))
+
+        starts = np.array([s for s, _e in ranges], dtype=np.int64)
+        mins = np.minimum.reduceat(pts, starts, axis=0)
+        maxs = np.maximum.reduceat(pts, starts, axis=0)
+        tiles = [([float(v) for v in np.concatenate([mn, mx])], int(s), int(e - s))
+                 for (s, e), mn, mx in zip(ranges, mins, maxs)]
+
+    rest = np.flatnonzero(~finite)
+    if rest.size:
+        tiles.append((None, int(order.size), int(rest.size)))
+        order = np.concatenate([order, rest])
+    return order, tiles
+
+
+def write_tiles_index(path, tiles, data_offset: int, row_size: int, vertex_count: int) -> None:
+    """tiles.json: each tile is [min_x, min_y, min_z, max_x, max_y, max_z, first_row, count]
+    (bounds null for the non-finite tile); byte offset = data_offset + first_row * row_size."""
+    index = {
+        "version": 1,
+        "vertex_count": int(vertex_count),
+        "data_offset": int(data_offset),
+        "row_size": int(row_size),
+        "tiles": [
+            ([round(v, 5) for v in bbox] if bbox else [None] * 6) + [first, count]
+            for bbox, first, count in tiles
+        ],
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _grid_knn_distance(pts: np.ndarray, k: int) -> np.ndarray:
+    """Estimate each point's mean distance to its k nearest neighbours from local density.
+
+    The voxel size is chosen so that a cell holds ~k points at the average
+    density (robust 1%-99% extent); a point whose cell holds c points gets
+    distance voxel * cbrt(k / c).  Counting on two grids offset by half a voxel
+    and keeping the larger count limits cell-boundary effects.
+    """
+    n = pts.shape[0]
+    lo = np.percentile(pts, 1, axis=0)
+    hi = np.percentile(pts, 99, axis=0)
+    voxel = (float(np.prod(np.maximum(hi - lo, 1e-9))) / n * k) ** (1.0 / 3.0)
+    origin = pts.min(axis=0)
+    counts = np.zeros((n,), dtype=np.int64)
+    for shift in (0.0, 0.5):
+        cells = np.floor((pts - origin) / voxel + shift).astype(np.int64)
+        span = cells.max(axis=0) + 1
+        keys = (cells[:, 0] * span[1] + cells[:, 1]) * span[2] + cells[:, 2]
+        _keys, inverse, cell_counts = np.unique(keys, return_inverse=True, return_counts=True)
+        np.maximum(counts, cell_counts[inverse.reshape(-1)], out=counts)
+    return voxel * np.cbrt(k / counts)
+
+
+def _kdtree_knn_distance(pts: np.ndarray, k: int) -> np.ndarray:
+    """Exact mean distance to the k nearest neighbours (scipy.spatial.cKDTree)"""
+    from scipy.spatial import cKDTree
+
+    dist, _idx = cKDTree(pts).query(pts, k=k + 1, workers=-1)
+    return dist[:, 1:].mean(axis=1)
+
+
+def prune_gaussians(columns: dict[str, np.ndarray], options: PruneOptions) -> Tuple[np.ndarray, dict[str, int]]:
+    """Rows to keep and how many rows each rule removed.
+
+    Returns (keep, removed): keep is a boolean mask over the rows, removed maps
+    rule name (non_finite, opacity, scale, outlier) to the rows it dropped.
+    """
+    n = columns["x"].shape[0]
+    removed = {"non_finite": 0, "opacity": 0, "scale": 0, "outlier": 0}
+    keep = np.ones((n,), dtype=bool)
+    for col in columns.values():
+        keep &= np.isfinite(col)
+    removed["non_finite"] = int(n - np.count_nonzero(keep))
+
+    def apply(rule, mask):
+        before = np.count_nonzero(keep)
+        keep[:] &= mask
+        removed[rule] = int(before - np.count_nonzero(keep))
+
+    if options.min_opacity > 0:
+        # sigmoid(o) >= t  <=>  o >= logit(t)，无需对每行求 exp
+        t = min(options.min_opacity, 1.0 - 1e-7)
+        apply("opacity", columns["opacity"] >= np.float32(np.log(t / (1.0 - t))))
+    if options.min_scale > 0 or options.max_scale > 0:
+        log_scale = np.maximum(np.maximum(columns["scale_0"], columns["scale_1"]), columns["scale_2"])
+        mask = np.ones((n,), dtype=bool)
+        if options.min_scale > 0:
+            mask &= log_scale >= np.float32(np.log(options.min_scale))
+        if options.max_scale > 0:
+            mask &= log_scale <= np.float32(np.log(options.max_scale))
+        apply("scale", mask)
+
+    idx = np.flatnonzero(keep)
+    if options.outlier_k > 0 and idx.size > options.outlier_k:
+        pts = np.stack([columns["x"][idx], columns["y"][idx], columns["z"][idx]], axis=1)
+        if options.outlier_method == "kdtree":
+            dist = _kdtree_knn_distance(pts, options.outlier_k)
+        elif options.outlier_method == "grid":
+            dist = _grid_knn_distance(pts, options.outlier_k)
+        else:
+            raise ValueError(f"Unknown outlier method: {options.outlier_method}")
+        outliers = idx[dist > dist.mean() + options.outlier_std * dist.std()]
+        keep[outliers] = False
+        removed["outlier"] = int(outliers.size)
+    return keep, removed
 
 
 def target_schema_scheme_b() -> List[Tuple[str, str]]:
@@ -237,7 +447,50 @@ def target_schema_scheme_b() -> List[Tuple[str, str]]:
     return [("float", n) for n in names]
 
 
-def convert(teaser_path: Path, output_path: Path) -> None:
+def _stats(values: np.ndarray) -> dict[str, float]:
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return {"min": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "min": float(finite.min()),
+        "mean": float(finite.mean(dtype=np.float64)),
+        "max": float(finite.max()),
+    }
+
+
+def model_metadata(columns: dict[str, np.ndarray], vertex_count: int) -> dict:
+    """Summary of a Scheme-B vertex table, computed from the columns already in memory.
+
+    - bbox: [min_x, min_y, min_z, max_x, max_y, max_z]; centroid: mean position
+    - opacity: stats of sigmoid(opacity); scale: stats of exp(scale_*) over all axes
+    Non-finite values are ignored.
+    """
+    meta: dict = {"vertex_count": int(vertex_count)}
+    if vertex_count == 0:
+        return meta
+
+    xyz = np.stack([columns["x"], columns["y"], columns["z"]], axis=1)
+    finite = xyz[np.isfinite(xyz).all(axis=1)]
+    if finite.shape[0]:
+        meta["bbox"] = [float(v) for v in np.concatenate([finite.min(axis=0), finite.max(axis=0)])]
+        meta["centroid"] = [float(v) for v in finite.mean(axis=0, dtype=np.float64)]
+
+    with np.errstate(over="ignore"):
+        opacity = 1.0 / (1.0 + np.exp(-columns["opacity"].astype(np.float64)))
+        scales = np.exp(np.concatenate([columns[f"scale_{i}"] for i in range(3)]).astype(np.float64))
+    meta["opacity"] = _stats(opacity)
+    meta["scale"] = _stats(scales)
+    return meta
+
+
+def convert(teaser_path: Path, output_path: Path, tile_size: int = DEFAULT_TILE_SIZE,
+            prune: PruneOptions | None = None) -> dict:
+    """Convert teaser_path to Scheme-B at output_path and return its metadata
+    (see model_metadata, plus file_size of the output in bytes, tile_count and converter_version).
+
+    tile_size > 0 writes rows in spatial-tile order plus tiles_path(output_path); 0 keeps source order.
+    With prune, dropped rows are reported as metadata["pruned"] ({rule: count}).
+    """
     teaser_header = parse_ply_header(teaser_path)
     teaser_cols = read_vertex_table_binary(teaser_path, teaser_header)
 
@@ -256,7 +509,30 @@ def convert(teaser_path: Path, output_path: Path) -> None:
     out_cols["ny"].fill(0.0)
     out_cols["nz"].fill(0.0)
 
-    write_ply_binary_vertex_only(output_path, n, schema, out_cols)
+    removed = None
+    if prune is not None and n:
+        keep, removed = prune_gaussians(out_cols, prune)
+        if not keep.all():
+            out_cols = {name: col[keep] for name, col in out_cols.items()}
+            n = int(np.count_nonzero(keep))
+
+    meta = model_metadata(out_cols, n)
+    if removed is not None:
+        meta["pruned"] = removed
+
+    tiles = None
+    if tile_size and n:
+        order, tiles = spatial_tiles(out_cols["x"], out_cols["y"], out_cols["z"], tile_size)
+        out_cols = {name: col[order] for name, col in out_cols.items()}
+
+    data_offset = write_ply_binary_vertex_only(output_path, n, schema, out_cols)
+    if tiles is not None:
+        write_tiles_index(tiles_path(output_path), tiles, data_offset, 4 * len(schema), n)
+        meta["tile_count"] = len(tiles)
+
+    meta["file_size"] = output_path.stat().st_size
+    meta["converter_version"] = CONVERTER_VERSION
+    return meta
 
 
 def _summarize_header(path: Path) -> str:
@@ -282,11 +558,26 @@ def main(argv: Sequence[str] | None = None) -> int:
         default=Path("PLY") / "converted0112.ply",
         help="Output converted0112.ply path",
     )
+    ap.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE, help="Gaussians per spatial tile (0: no tiles)")
+    ap.add_argument("--prune", action="store_true", help="Drop non-finite rows and apply the thresholds below")
+    ap.add_argument("--min-opacity", type=float, default=0.0, help="Minimum sigmoid(opacity)")
+    ap.add_argument("--min-scale", type=float, default=0.0, help="Minimum largest exp(scale)")
+    ap.add_argument("--max-scale", type=float, default=0.0, help="Maximum largest exp(scale)")
+    ap.add_argument("--outlier-k", type=int, default=0, help="Neighbours for outlier removal (0: off)")
+    ap.add_argument("--outlier-std", type=float, default=3.0)
+    ap.add_argument("--outlier-method", choices=("grid", "kdtree"), default="grid")
     args = ap.parse_args(argv)
 
-    convert(args.teaser, args.out)
+    prune = None
+    if args.prune:
+        prune = PruneOptions(min_opacity=args.min_opacity, min_scale=args.min_scale, max_scale=args.max_scale,
+                             outlier_k=args.outlier_k, outlier_std=args.outlier_std,
+                             outlier_method=args.outlier_method)
+    meta = convert(args.teaser, args.out, tile_size=args.tile_size, prune=prune)
     print(_summarize_header(args.teaser))
     print(_summarize_header(args.out))
+    if "pruned" in meta:
+        print("pruned: " + ", ".join(f"{rule}={count}" for rule, count in meta["pruned"].items()))
     return 0
 
 
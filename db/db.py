@@ -13,8 +13,17 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
+_db_initialized = False
+
+
 def init_db():
-    """初始化用户表（首次运行自动创建）"""
+    """初始化用户表（首次运行自动创建）
+
+    由 create_app 显式调用，每个进程只执行一次，不再作为导入副作用。
+    """
+    global _db_initialized
+    if _db_initialized:
+        return
     conn = get_db_connection()
     cursor = conn.cursor()
     # 仅存储用户基础信息，不存JWT（JWT自身带签名和过期）
@@ -29,5 +38,4 @@ def init_db():
     conn.commit()
     cursor.close()
     conn.close()
-    
-init_db()
\ No newline at end of file
+    _db_initialized = True
@@ -1,26 +1,99 @@
-from flask import jsonify
-from typing import Any, Optional, Union, Dict, List
+import dataclasses
+import datetime
+import decimal
+import json
+import uuid
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
 
-def json_response(code: int = 200, 
-                  msg: str = "操作成功", 
-                  data: Optional[Any] = None,) -> Dict:
+from flask import current_app
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # 未安装时回退到标准库
+    orjson = None
+
+
+def _default(o):
+    """与 Flask 默认 JSON provider 一致的类型转换"""
+    if isinstance(o, datetime.date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _dumps_json(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def _dumps_orjson(obj) -> bytes:
+    try:
+        # datetime 交给 _default，保持与标准库后端相同的输出
+        return orjson.dumps(obj, default=_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    except TypeError:
+        # orjson 不支持的值（如超过 64 位的整数）
+        return _dumps_json(obj)
+
+
+# 可用的序列化后端：名称 -> dumps(obj) -> bytes
+BACKENDS: Dict[str, Callable[[Any], bytes]] = {'json': _dumps_json}
+if orjson is not None:
+    BACKENDS['orjson'] = _dumps_orjson
+
+_dumps = None
+
+
+def set_backend(name: str = 'auto') -> str:
+    """选择序列化后端（auto：已安装 orjson 时使用 orjson），返回实际使用的后端名"""
+    global _dumps
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in BACKENDS else 'json'
+    if name not in BACKENDS:
+        raise ValueError(f"未知或未安装的 JSON 后端: {name}，可用: {sorted(BACKENDS)}")
+    _dumps = BACKENDS[name]
+    _constant_body.cache_clear()
+    return name
+
+
+def dumps(obj) -> bytes:
+    if _dumps is None:
+        from config import Config
+        set_backend(Config.JSON_BACKEND)
+    return _dumps(obj)
+
+
+@lru_cache(maxsize=512)
+def _constant_body(code, msg) -> bytes:
+    # data 为空的响应（ping、常见错误码）只序列化一次
+    return dumps({'code': code, 'msg': msg, 'data': {}}) + b'\n'
+
+
+def json_response(code: int = 200,
+                  msg: str = "操作成功",
+                  data: Optional[Any] = None,
+                  success: Optional[bool] = None):
     """
     统一的JSON响应函数
-    
+
     Args:
         code: HTTP状态码/业务状态码
-        message: 提示信息
+        msg: 提示信息
         data: 返回的数据（任意类型）
-        success: 操作是否成功（可选，根据code自动判断）
-    
+        success: 兼容旧调用，不写入响应
+
     Returns:
         Flask JSON Response
     """
-    
-    response_data = {
-        'code': code,
-        'msg': msg,
-        'data': data if data is not None else {}  # 确保data不为None
-    }
-    
-    return jsonify(response_data)
\ No newline at end of file
+
+    if data is None or (type(data) is dict and not data):
+        body = _constant_body(code, msg)
+    else:
+        body = dumps({'code': code, 'msg': msg, 'data': data}) + b'\n'
+    return current_app.response_class(body, mimetype='application/json')
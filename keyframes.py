@@ -0,0 +1,280 @@
+"""Keyframe selection for video uploads.
+
+Sharp reconstructs from a single image, so a clip is reduced to its best few
+frames before anything reaches the GPU queue:
+
+1. ffmpeg decodes the clip at VIDEO_SAMPLE_FPS (capped at VIDEO_MAX_FRAMES
+   frames in total), scaled to VIDEO_SCORE_WIDTH and converted to grey, into a
+   pipe; no image library is needed.
+2. Batches of frames are scored in a process pool: sharpness is the variance of
+   the 4-neighbour Laplacian (motion blur and defocus flatten it), and a
+   thumbnail of the frame, normalised to zero mean and unit length, is its
+   appearance descriptor.
+3. `select_keyframes` keeps the frames at or above the VIDEO_BLUR_QUANTILE
+   sharpness quantile and picks the sharpest first, skipping frames whose
+   difference ((1 - correlation) / 2 of the descriptors) to an already picked
+   one is below VIDEO_MIN_DIFFERENCE, so near-duplicates of a static shot
+   count once.
+4. The picked frames are extracted at full resolution as JPEG.
+
+Steps 2 and 3 only use numpy, so selection can be checked on synthetic frames
+without ffmpeg or a GPU (see bench/bench_keyframes.py).
+
+Usage
+    python keyframes.py clip.mp4 --out frames/ [--count 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import threading
+from collections import deque
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTOR_WIDTH = 32
+_BATCH = 16
+
+
+# ------------------------------------------------------------- scoring
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian of a 2-D grey image (higher = sharper)"""
+    g = gray.astype(np.float32)
+    lap = (4.0 * g[1:-1, 1:-1] - g[:-2, 1:-1] - g[2:, 1:-1] - g[1:-1, :-2] - g[1:-1, 2:])
+    return float(lap.var())
+
+
+def descriptor(gray: np.ndarray, width: int = DESCRIPTOR_WIDTH) -> np.ndarray:
+    """Block-averaged thumbnail, zero mean and unit length (all zeros for a flat frame)"""
+    h, w = gray.shape
+    width = min(width, w)
+    height = max(1, min(h, round(width * h / w)))
+    bh, bw = h // height, w // width
+    thumb = gray[:height * bh, :width * bw].astype(np.float32).reshape(height, bh, width, bw).mean(axis=(1, 3))
+    thumb = thumb.ravel() - thumb.mean()
+    norm = float(np.linalg.norm(thumb))
+    return thumb / norm if norm > 1e-6 else np.zeros_like(thumb)
+
+
+def score_batch(frames: np.ndarray):
+    """(sharpness, descriptors) of a (n, h, w) uint8 batch; runs in the process pool"""
+    return (np.array([laplacian_variance(f) for f in frames], dtype=np.float64),
+            np.stack([descriptor(f) for f in frames]))
+
+
+def difference(a: np.ndarray, b: np.ndarray) -> float:
+    """0 for identical descriptors, 0.5 for unrelated ones, 1 for inverted"""
+    return (1.0 - float(np.dot(a, b))) / 2.0
+
+
+def select_keyframes(sharpness: Sequence[float], descriptors: np.ndarray, count: int = 1,
+                     min_difference: float = 0.1, blur_quantile: float = 0.5) -> List[int]:
+    """Indices of up to count sharp, mutually different frames, sharpest first"""
+    sharpness = np.asarray(sharpness, dtype=np.float64)
+    if sharpness.size == 0 or count <= 0:
+        return []
+    threshold = np.quantile(sharpness, blur_quantile) if blur_quantile > 0 else -np.inf
+    candidates = np.flatnonzero(sharpness >= threshold)
+    order = candidates[np.argsort(-sharpness[candidates], kind="stable")]
+    selected: List[int] = []
+    for i in order:
+        if len(selected) >= count:
+            break
+        if sharpness[i] <= 0:
+            break  # 纯色画面
+        if all(difference(descriptors[i], descriptors[j]) >= min_difference for j in selected):
+            selected.append(int(i))
+    return selected
+
+
+# ------------------------------------------------------------- decoding
+
+def probe(video_path, ffprobe: str = "ffprobe") -> dict:
+    """{'width', 'height', 'duration'} of the first video stream, as displayed (rotation applied)"""
+    out = subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height,duration:stream_tags=rotate:stream_side_data=rotation:format=duration",
+         "-of", "json", str(video_path)],
+        capture_output=True, text=True, check=True).stdout
+    info = json.loads(out)
+    if not info.get("streams"):
+        raise ValueError("文件中没有视频流")
+    stream = info["streams"][0]
+    width, height = int(stream["width"]), int(stream["height"])
+    rotation = stream.get("tags", {}).get("rotate")
+    for side in stream.get("side_data_list", []):
+        rotation = side.get("rotation", rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+    duration = stream.get("duration") or info.get("format", {}).get("duration")
+    return {"width": width, "height": height, "duration": float(duration) if duration else None}
+
+
+def iter_frames(video_path, width: int, height: int, sample_fps: float, ffmpeg: str = "ffmpeg"):
+    """Yield (index, grey (height, width) uint8 frame) sampled at sample_fps"""
+    cmd = [ffmpeg, "-nostdin", "-v", "error", "-i", str(video_path), "-an", "-sn",
+           "-vf", f"fps={sample_fps:g},scale={width}:{height},format=gray", "-f", "rawvideo", "pipe:1"]
+    size = width * height
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=size * 4) as proc:
+        index = 0
+        try:
+            while True:
+                buf = proc.stdout.read(size)
+                if len(buf) < size:
+                    break
+                yield index, np.frombuffer(buf, dtype=np.uint8).reshape(height, width)
+                index += 1
+        finally:
+            proc.stdout.close()
+            stderr = proc.stderr.read().decode("utf-8", "replace")
+            if proc.wait() != 0 and index == 0:
+                raise RuntimeError(f"ffmpeg 解码失败: {stderr.strip()[-500:]}")
+
+
+def extract_frame(video_path, timestamp: float, out_path, quality: int = 2, ffmpeg: str = "ffmpeg") -> str:
+    """Write the full-resolution frame at timestamp (seconds) as JPEG"""
+    tmp = os.path.join(os.path.dirname(str(out_path)), f".{os.path.basename(str(out_path))}.{os.getpid()}.jpg")
+    subprocess.run([ffmpeg, "-nostdin", "-v", "error", "-ss", f"{timestamp:.3f}", "-i", str(video_path),
+                    "-frames:v", "1", "-q:v", str(quality), "-y", tmp], capture_output=True, check=True)
+    if not os.path.exists(tmp):
+        raise RuntimeError(f"未能提取 {timestamp:.3f}s 处的画面")
+    os.replace(tmp, out_path)
+    return str(out_path)
+
+
+# ------------------------------------------------------------- pipeline
+
+def score_video(video_path, score_width: int = 320, sample_fps: float = 4.0, max_frames: int = 1200,
+                pool=None, ffmpeg: str = "ffmpeg", ffprobe: str = "ffprobe",
+                on_progress: Optional[Callable[[float], None]] = None):
+    """Decode and score a clip; returns (fps actually sampled, sharpness array, descriptors array)"""
+    info = probe(video_path, ffprobe)
+    duration = info["duration"]
+    if duration and duration * sample_fps > max_frames:
+        sample_fps = max_frames / duration
+    width = min(score_width, info["width"]) // 2 * 2
+    height = max(2, round(width * info["height"] / info["width"]) // 2 * 2)
+    expected = duration * sample_fps if duration else None
+
+    sharpness, descriptors = [], []
+    pending = deque()
+    workers = getattr(pool, "_max_workers", 1) if pool is not None else 0
+
+    def collect(result):
+        s, d = result
+        sharpness.extend(s)
+        descriptors.extend(d)
+        if on_progress is not None and expected:
+            on_progress(min(1.0, len(sharpness) / expected))
+
+    batch = []
+
+    def flush():
+        frames = np.stack(batch)
+        batch.clear()
+        if pool is None:
+            collect(score_batch(frames))
+            return
+        pending.append(pool.submit(score_batch, frames))
+        # 解码与打分并行；未完成的批次数有上限，内存不随视频长度增长
+        while len(pending) > 2 * workers:
+            collect(pending.popleft().result())
+
+    for index, frame in iter_frames(video_path, width, height, sample_fps, ffmpeg):
+        if index >= max_frames:
+            break
+        batch.append(frame)
+        if len(batch) == _BATCH:
+            flush()
+    if batch:
+        flush()
+    while pending:
+        collect(pending.popleft().result())
+    if not sharpness:
+        return sample_fps, np.zeros(0), np.zeros((0, 0), dtype=np.float32)
+    return sample_fps, np.array(sharpness), np.stack(descriptors)
+
+
+def extract_keyframes(video_path, out_dir, count: int = 1, score_width: int = 320, sample_fps: float = 4.0,
+                      max_frames: int = 1200, min_difference: float = 0.1, blur_quantile: float = 0.5,
+                      quality: int = 2, pool=None, ffmpeg: str = "ffmpeg", ffprobe: str = "ffprobe",
+                      on_progress: Optional[Callable[[float], None]] = None) -> List[dict]:
+    """Score the clip and write the selected frames to out_dir.
+
+    Returns [{'path', 'time', 'sharpness'}], best first; empty if no frame has any detail.
+    """
+    fps, sharpness, descriptors = score_video(video_path, score_width, sample_fps, max_frames, pool,
+                                              ffmpeg, ffprobe, on_progress)
+    picked = select_keyframes(sharpness, descriptors, count, min_difference, blur_quantile)
+    logger.info(f"视频关键帧：打分 {len(sharpness)} 帧（{fps:.2f} fps），选出 {len(picked)} 帧")
+    os.makedirs(out_dir, exist_ok=True)
+    frames = []
+    for rank, i in enumerate(picked, 1):
+        timestamp = i / fps
+        path = extract_frame(video_path, timestamp, os.path.join(out_dir, f"keyframe_{rank:02d}.jpg"), quality,
+                             ffmpeg)
+        frames.append({"path": path, "time": round(timestamp, 3), "sharpness": round(float(sharpness[i]), 2)})
+    return frames
+
+
+# ------------------------------------------------------------- worker pool
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process pool for score_batch (None when VIDEO_SCORE_WORKERS is 0: score in the calling thread)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            from config import Config
+            if not Config.VIDEO_SCORE_WORKERS:
+                return None
+            # spawn：gunicorn worker 内有多个线程，fork 子进程不安全
+            _pool = ProcessPoolExecutor(max_workers=Config.VIDEO_SCORE_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Pick the sharpest distinct keyframes of a video")
+    ap.add_argument("video")
+    ap.add_argument("--out", required=True, help="Directory for the extracted JPEG frames")
+    ap.add_argument("--count", type=int, default=4)
+    ap.add_argument("--fps", type=float, default=4.0, help="Frames scored per second of video")
+    ap.add_argument("--width", type=int, default=320, help="Scoring resolution (width)")
+    ap.add_argument("--min-difference", type=float, default=0.1)
+    ap.add_argument("--blur-quantile", type=float, default=0.5)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    pool = None
+    if args.workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+    try:
+        frames = extract_keyframes(args.video, args.out, count=args.count, score_width=args.width,
+                                   sample_fps=args.fps, min_difference=args.min_difference,
+                                   blur_quantile=args.blur_quantile, pool=pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    for frame in frames:
+        print(f"{frame['time']:>9.3f}s  sharpness {frame['sharpness']:>10.2f}  {frame['path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
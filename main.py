@@ -1,4 +1,5 @@
 import datetime
+import importlib
 import mimetypes
 from flask import Flask, logging
 from flask_cors import CORS
@@ -8,6 +9,7 @@ import logging
 import jwt
 from config import Config
 from pathlib import Path
+from utils.logs import setup_logging
 import ssl
 
 # 配置MIME类型
@@ -30,23 +32,80 @@ if not log_dir_path.exists():
     logging.warning(f"日志目录不存在，已自动创建：{log_dir_path.absolute()}")
     
     
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(Config.LOG_DIR / 'app.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+# 日志经队列由后台线程写入（见 utils.logs），记录带 task_id / user，app.log 按大小 / 时间轮转
+setup_logging(
+    Config.LOG_DIR,
+    level=Config.LOG_LEVEL,
+    fmt=Config.LOG_FORMAT,
+    max_bytes=Config.LOG_MAX_BYTES,
+    backup_count=Config.LOG_BACKUP_COUNT,
+    rotate_interval=Config.LOG_ROTATE_INTERVAL,
+    queue_size=Config.LOG_QUEUE_SIZE,
+    block_timeout=Config.LOG_BLOCK_TIMEOUT,
 )
 
 logger = logging.getLogger(__name__)
-    
-def create_app():
-    
+
+
+# 角色 -> 需要注册的蓝图（模块路径, 蓝图变量名）；按需导入，未启用的角色不产生导入开销
+ROLE_BLUEPRINTS = {
+    'auth': [('routes.login', 'login_bp')],
+    'viewer': [('routes.viewer', 'viewer_bp')],
+    'storage': [('routes.manager', 'storage_bp')],   # 只读：模型列表 / 模型下载
+    'manager': [('routes.manager', 'manager_bp')],   # 写操作：删除 / 撤销删除 / 重命名
+    'inference': [('routes.sharp', 'sharp_bp'), ('routes.uploads', 'uploads_bp')],     # 上传 + 重建任务
+    'dispatch': [('routes.sharp', 'sharp_bp'), ('routes.uploads', 'uploads_bp'),
+                 ('routes.dispatch', 'dispatch_bp')],  # 上传 + 分派给远程 GPU worker
+    'worker': [('routes.worker', 'worker_bp')],      # GPU worker：接收分派的任务
+}
+
+
+def _register_role(app, role):
+    """注册单个角色的蓝图，并执行该角色的一次性初始化"""
+    for module_name, bp_name in ROLE_BLUEPRINTS[role]:
+        bp = getattr(importlib.import_module(module_name), bp_name)
+        if bp.name not in app.blueprints:
+            app.register_blueprint(bp)
+
+    if role == 'auth':
+        # 用户表初始化：应用工厂中显式执行一次（原为 db.db 导入副作用）
+        from db.db import init_db
+        init_db()
+    elif role == 'manager':
+        from routes.manager import init_manager
+        init_manager(app)
+    elif role == 'dispatch':
+        from routes.sharp import init_dispatcher
+        init_dispatcher(app)
+    elif role == 'worker':
+        from routes.worker import init_worker
+        init_worker(app)
+
+    if role in ('inference', 'dispatch'):
+        # 断点续传上传会话存储 + 过期会话清理
+        from routes.uploads import init_uploads
+        init_uploads(app)
+
+
+def create_app(roles=None):
+    """创建Flask应用工厂函数
+
+    Args:
+        roles: 启用的角色集合，如 "auth,viewer,storage" 或 ['inference', 'storage']；
+               dispatch 与 inference 互斥（上传后分派给远程 worker / 本机重建）；
+               为 None 时依次读取环境变量 QS_APP_ROLES、Config.APP_ROLES，
+               都未设置则按 Config.USE_GPU_SERVER 推导（兼容旧的两套部署）。
+    """
     # 初始化配置
     Config.init_dirs()    
     
-    """创建Flask应用工厂函数"""
+    roles = Config.resolve_roles(roles)
+    unknown = roles - set(ROLE_BLUEPRINTS)
+    if unknown:
+        raise ValueError(f"未知的应用角色: {sorted(unknown)}")
+    if {'dispatch', 'inference'} <= roles:
+        raise ValueError("dispatch 与 inference 角色不能同时启用")
+
     # 初始化Flask应用
     app = Flask(__name__, 
                 static_folder='static',
@@ -59,26 +118,26 @@ def create_app():
     app.config['TEMPLATES_DIR'] = Config.TEMPLATE_DIR
     app.config['DATA_DIR'] = Config.DATA_DIR
     app.config['LOG_DIR'] = Config.LOG_DIR
+    app.config['APP_ROLES'] = roles
     
     
     # 启用CORS
     CORS(app)
     
-    # 导入并注册路由
-    if not Config.USE_GPU_SERVER : #* 启用业务服务器 */
-        
-        from routes.login import login_bp
-        from routes.viewer import viewer_bp
-        app.register_blueprint(viewer_bp)
-        app.register_blueprint(login_bp)
-        
-    else :  #* 启用 GPU 服务*/
-        from routes.manager import manager_bp
-        from routes.sharp import sharp_bp
-        
-        app.register_blueprint(sharp_bp)
-        app.register_blueprint(manager_bp)
-    
+    if Config.METRICS_ENABLED:
+        from routes.metrics import init_metrics
+        init_metrics(app)
+
+    if Config.PROFILING_ENABLED:
+        from routes.profiling import init_profiling
+        init_profiling(app)
+
+    # 导入并注册路由（固定顺序，保证注册结果与传入顺序无关）
+    for role in ROLE_BLUEPRINTS:
+        if role in roles:
+            _register_role(app, role)
+
+    logger.info(f"应用角色: {', '.join(r for r in ROLE_BLUEPRINTS if r in roles)}")
     
     return app
 
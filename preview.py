@@ -0,0 +1,235 @@
+"""CPU preview thumbnails for converted (Scheme-B) gaussian PLY files.
+
+A preview is a small PNG rendered by projecting the top-K most important
+gaussians (sigmoid(opacity) * splat area) through a pinhole camera at the origin
+looking down +z, the camera sharp predict reconstructs from.  Each gaussian is
+splatted as an isotropic footprint; overlapping splats are blended by weight
+(opacity * falloff, nearer splats weigh more) with np.bincount, so rendering is
+fully vectorized and takes well under a second for the default K.
+
+Previews are cached next to the model as `<model base>.preview.png` and are
+rendered in a process pool (`submit_preview`) so task completion never waits
+for them.  A model version (path + mtime) is rendered at most once at a time
+per process, and a version whose render failed is not retried until the model
+changes.
+
+Usage
+    python preview.py model.ply [--out model.preview.png] [--size 256]
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from convert import parse_ply_header
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SUFFIX = ".preview.png"
+SH_C0 = 0.28209479177387814
+BACKGROUND = (0.94, 0.94, 0.95)
+_FIELDS = ("x", "y", "z", "f_dc_0", "f_dc_1", "f_dc_2", "opacity", "scale_0", "scale_1", "scale_2")
+_NP_TYPES = {"float": "f4", "float32": "f4", "double": "f8", "float64": "f8", "uchar": "u1", "uint8": "u1",
+             "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4", "short": "i2", "ushort": "u2",
+             "char": "i1", "int8": "i1", "int16": "i2", "uint16": "u2"}
+
+
+def preview_path(model_path) -> str:
+    """DATA_DIR/u/folder/model.ply -> DATA_DIR/u/folder/model.preview.png"""
+    return os.path.splitext(str(model_path))[0] + PREVIEW_SUFFIX
+
+
+def load_gaussians(path: Path) -> dict[str, np.ndarray]:
+    """Read the columns needed for rendering with a structured numpy dtype"""
+    header = parse_ply_header(path)
+    endian = "<" if header.format == "binary_little_endian" else ">"
+    dtype = np.dtype([(name, endian + _NP_TYPES[t]) for t, name in header.vertex_properties])
+    with path.open("rb") as f:
+        f.seek(header.data_start_offset)
+        rows = np.fromfile(f, dtype=dtype, count=header.vertex_count)
+    missing = [name for name in _FIELDS if name not in dtype.names]
+    if missing:
+        raise ValueError(f"PLY lacks gaussian properties: {missing}")
+    return {name: rows[name].astype(np.float32) for name in _FIELDS}
+
+
+def render(columns: dict[str, np.ndarray], size: int = 256, top_k: int = 60000) -> np.ndarray:
+    """Render a size x size RGB uint8 image"""
+    with np.errstate(over="ignore", invalid="ignore"):
+        opacity = 1.0 / (1.0 + np.exp(-columns["opacity"]))
+        radius = np.exp((columns["scale_0"] + columns["scale_1"] + columns["scale_2"]) / 3.0)
+    x, y, z = columns["x"], columns["y"], columns["z"]
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(z) & np.isfinite(radius) & (z > 1e-3)
+    idx = np.flatnonzero(valid)
+    image = np.empty((size, size, 3), dtype=np.float32)
+    image[:] = BACKGROUND
+    if idx.size == 0:
+        return (image * 255).astype(np.uint8)
+
+    # 重要度：不透明度 × 投影面积，只保留前 K 个
+    importance = opacity[idx] * (radius[idx] / z[idx]) ** 2
+    if idx.size > top_k:
+        idx = idx[np.argpartition(importance, -top_k)[-top_k:]]
+
+    u = x[idx] / z[idx]
+    v = y[idx] / z[idx]
+    # 视野按投影坐标的 2%~98% 分位数自适应，留 5% 边距
+    lo = np.percentile(np.stack([u, v]), 2, axis=1)
+    hi = np.percentile(np.stack([u, v]), 98, axis=1)
+    span = float(max(hi[0] - lo[0], hi[1] - lo[1], 1e-6)) * 1.1
+    center = (lo + hi) / 2.0
+    focal = size / span
+    px = (u - center[0]) * focal + size / 2.0
+    py = (v - center[1]) * focal + size / 2.0
+    pr = np.clip(radius[idx] / z[idx] * focal, 0.5, 3.0)
+
+    rgb = np.clip(0.5 + SH_C0 * np.stack([columns[f"f_dc_{i}"][idx] for i in range(3)], axis=1), 0.0, 1.0)
+    depth_weight = 1.0 / np.maximum(z[idx], 1e-3) ** 2
+    base_weight = opacity[idx] * depth_weight / depth_weight.max()
+
+    accum = np.zeros((size * size, 3), dtype=np.float64)
+    weight = np.zeros(size * size, dtype=np.float64)
+    for dy in range(-3, 4):
+        for dx in range(-3, 4):
+            cx = np.floor(px).astype(np.int64) + dx
+            cy = np.floor(py).astype(np.int64) + dy
+            d2 = (cx + 0.5 - px) ** 2 + (cy + 0.5 - py) ** 2
+            w = base_weight * np.exp(-0.5 * d2 / pr ** 2)
+            keep = (cx >= 0) & (cx < size) & (cy >= 0) & (cy < size) & (d2 <= (2.5 * pr) ** 2)
+            flat = cy[keep] * size + cx[keep]
+            wk = w[keep]
+            weight += np.bincount(flat, weights=wk, minlength=size * size)
+            for c in range(3):
+                accum[:, c] += np.bincount(flat, weights=wk * rgb[keep, c], minlength=size * size)
+
+    covered = weight > 0
+    color = np.zeros_like(accum)
+    color[covered] = accum[covered] / weight[covered, None]
+    # 覆盖度：权重归一化后按指数饱和，与背景混合
+    scale = np.percentile(weight[covered], 90) if covered.any() else 1.0
+    alpha = (1.0 - np.exp(-3.0 * weight / max(scale, 1e-12)))[:, None]
+    out = color * alpha + np.array(BACKGROUND) * (1.0 - alpha)
+    return (np.clip(out.reshape(size, size, 3), 0.0, 1.0) * 255 + 0.5).astype(np.uint8)
+
+
+def write_png(path, image: np.ndarray) -> None:
+    """Minimal 8-bit RGB PNG encoder (zlib only)"""
+    height, width, _ = image.shape
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)], axis=1)
+    png = (b"\x89PNG\r\n\x1a\n"
+           + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+           + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+           + chunk(b"IEND", b""))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(png)
+    os.replace(tmp, path)
+
+
+def render_preview(model_path, out_path=None, size: int = 256, top_k: int = 60000) -> str:
+    """Render model_path to out_path (default preview_path(model_path)); returns the PNG path"""
+    out_path = str(out_path or preview_path(model_path))
+    write_png(out_path, render(load_gaussians(Path(model_path)), size=size, top_k=top_k))
+    return out_path
+
+
+# ------------------------------------------------------------- worker pool
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            from config import Config
+            # spawn：gunicorn worker 内有多个线程，fork 子进程不安全
+            _pool = ProcessPoolExecutor(max_workers=Config.PREVIEW_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+# 模型路径 -> (mtime_ns, future)：同一版本的模型只提交一次渲染
+_pending = {}
+# 模型路径 -> 渲染失败的 mtime_ns：模型改写前不再重试
+_failed = {}
+_FAILED_MAX = 1024
+_state_lock = threading.Lock()
+
+
+def submit_preview(model_path, on_done: Optional[Callable[[str], None]] = None, retry_failed: bool = True):
+    """Render the preview in the process pool; on_done(png_path) runs in the parent when it succeeds.
+
+    Returns the future of the render already running for this model version if
+    there is one (on_done is then not added), or None when retry_failed is False
+    and this version failed before.  Raises FileNotFoundError if the model is gone.
+    """
+    from config import Config
+
+    model_path = str(model_path)
+    version = os.stat(model_path).st_mtime_ns
+    with _state_lock:
+        pending = _pending.get(model_path)
+        if pending is not None and pending[0] == version:
+            return pending[1]
+        if not retry_failed and _failed.get(model_path) == version:
+            return None
+        future = _get_pool().submit(render_preview, model_path, None, Config.PREVIEW_SIZE, Config.PREVIEW_TOP_K)
+        _pending[model_path] = (version, future)
+
+    def done(f):
+        error = None
+        try:
+            png = f.result()
+        except Exception as e:
+            error = e
+        with _state_lock:
+            if _pending.get(model_path, (None, None))[1] is f:
+                del _pending[model_path]
+            _failed.pop(model_path, None)
+            if error is not None:
+                if len(_failed) >= _FAILED_MAX:
+                    _failed.pop(next(iter(_failed)))
+                _failed[model_path] = version
+        if error is not None:
+            logger.error(f"生成预览图失败: {model_path}", exc_info=error)
+            return
+        if on_done is not None:
+            try:
+                on_done(png)
+            except Exception:
+                logger.exception('预览图回调失败')
+
+    future.add_done_callback(done)
+    return future
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Render a preview PNG for a Scheme-B PLY")
+    ap.add_argument("model", type=Path)
+    ap.add_argument("--out", type=Path, default=None)
+    ap.add_argument("--size", type=int, default=256)
+    ap.add_argument("--top-k", type=int, default=60000)
+    args = ap.parse_args(argv)
+    print(render_preview(args.model, args.out, size=args.size, top_k=args.top_k))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,10 @@
+import hmac
 from functools import wraps
 from flask import g
 import jwt
-from flask import request, jsonify
+from flask import request
 from config import Config
+from error_code.JsonError import json_response
 def login_required(f):
     """登录装饰器"""
     @wraps(f)
@@ -10,7 +12,7 @@ def login_required(f):
         # 从header获取token
         token = request.headers.get('token', '') or request.cookies.get('token') or request.args.get('token')
         if not token:
-            return jsonify({'code': 501, 'msg': '缺少登录凭证', 'data': {}})
+            return json_response(code=501, msg='缺少登录凭证')
         
         try:
             # 验证JWT token
@@ -19,7 +21,18 @@ def login_required(f):
             g.user_id = payload.get('user_id')
             g.username = payload.get('user_name')
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'code': 502, 'msg': 'token无效或已过期', 'data': {}})
+            return json_response(code=502, msg='token无效或已过期')
         
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+
+def worker_token_required(f):
+    """业务服务器与 GPU worker 之间的接口鉴权（共享令牌）"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.headers.get('X-Worker-Token', '')
+        if not token or not hmac.compare_digest(token, Config.WORKER_TOKEN):
+            return json_response(code=503, msg='worker凭证无效'), 403
+        return f(*args, **kwargs)
+    return decorated_function
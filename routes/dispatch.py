@@ -0,0 +1,75 @@
+from flask import Blueprint, request, send_file, current_app
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from . import worker_token_required
+from error_code.JsonError import json_response
+from routes import sharp
+
+# 业务服务器一侧的 GPU worker 接口（dispatch 角色），协议见 utils/dispatcher.py
+dispatch_bp = Blueprint('dispatch', __name__)
+
+
+@dispatch_bp.route('/dispatch/workers/heartbeat', methods=['POST'])
+@worker_token_required
+def worker_heartbeat():
+    """GPU worker 注册 / 心跳，上报当前负载"""
+    data = request.get_json(silent=True) or {}
+    worker_id = data.get('worker_id')
+    url = data.get('url')
+    if not worker_id or not url:
+        return json_response(code=601, msg='参数缺失', data={}), 400
+
+    sharp.dispatcher.registry.heartbeat(worker_id, url, data.get('load', 0), data.get('capacity', 1))
+    return json_response(code=0, msg='ok', data={})
+
+
+@dispatch_bp.route('/dispatch/jobs/<job_id>/input')
+@worker_token_required
+def job_input(job_id):
+    """worker 拉取任务输入图片"""
+    job = sharp.dispatcher.store.get(job_id)
+    if not job or not os.path.isfile(job['image_path']):
+        return json_response(code=602, msg='任务不存在', data={}), 404
+    return send_file(job['image_path'])
+
+
+@dispatch_bp.route('/dispatch/jobs/<job_id>/status', methods=['POST'])
+@worker_token_required
+def job_status(job_id):
+    """worker 上报任务进度"""
+    data = request.get_json(silent=True) or {}
+    stage_status = {'training': sharp.TaskStatus.TRAINING, 'processing': sharp.TaskStatus.PROCESSING}
+    status = stage_status.get(data.get('status'), sharp.TaskStatus.PROCESSING)
+    # attempt 来自任务描述中的 URL：任务重新排队后，旧 worker 的上报被忽略
+    sharp.dispatcher.report_status(job_id, status, data.get('message', ''), data.get('progress', 0),
+                                   request.args.get('attempt', type=int))
+    return json_response(code=0, msg='ok', data={})
+
+
+@dispatch_bp.route('/dispatch/jobs/<job_id>/result', methods=['POST'])
+@worker_token_required
+def job_result(job_id):
+    """worker 回传重建结果（可选附带模型文件及其分块索引），写入存储并注册模型"""
+    try:
+        result = json.loads(request.form.get('result') or '{}')
+    except ValueError:
+        return json_response(code=603, msg='结果格式错误', data={}), 400
+
+    model = request.files.get('model')
+    tiles = request.files.get('tiles')
+    save = model.save if model is not None else None
+    try:
+        found = sharp.dispatcher.complete(job_id, result, model.filename if model is not None else '', save,
+                                          request.args.get('attempt', type=int),
+                                          save_tiles=tiles.save if tiles is not None else None)
+    except Exception:
+        current_app.logger.exception('保存分派任务结果失败')
+        return json_response(code=604, msg='服务器内部错误', data={}), 500
+
+    if not found:
+        return json_response(code=602, msg='任务不存在', data={}), 404
+    return json_response(code=0, msg='ok', data={})
@@ -1,7 +1,7 @@
 import random
 import string
-import requests
 from flask import Blueprint, jsonify, request, session, redirect, url_for, request
+import logging
 import os
 import sys
 
@@ -13,6 +13,8 @@ from db.db import *
 from error_code.JsonError import json_response
 from config import Config
 
+logger = logging.getLogger(__name__)
+
 # 创建登录蓝图
 login_bp = Blueprint('login', __name__)
 
@@ -25,6 +27,8 @@ def get_wx_openid(code):
     url = f"https://api.weixin.qq.com/sns/jscode2session?appid={appid}&secret={appsecret}&js_code={code}&grant_type=authorization_code"
     
     try:
+        import requests  # 延迟导入，仅微信登录时才需要
+
         # 核心：Flask中发送GET请求并解析JSON
         res = requests.get(url)
         res_data = res.json()  # 解析返回的JSON数据
@@ -81,7 +85,7 @@ def check_login():
     
     # 全局异常捕获
     except Exception as e:
-        print(f"接口异常：{str(e)}")
+        logger.exception(f"接口异常：{str(e)}")
         return json_response(code=204, msg='服务器内部错误，请稍后重试', data={})
     
 # ========== 可选：新增用户接口（用于测试） ==========
@@ -119,7 +123,7 @@ def register():
         return json_response(code=0, msg='注册成功', data={})
 
     except Exception as e:
-        print(f"注册接口异常：{str(e)}")
+        logger.exception(f"注册接口异常：{str(e)}")
         return json_response(code=207, msg='服务器内部错误', data={})
         
         
@@ -165,7 +169,7 @@ def login_api():
         })
 
     except Exception as e:
-        print(f"登录接口异常：{str(e)}")
+        logger.exception(f"登录接口异常：{str(e)}")
         return json_response(code=211, msg='服务器内部错误', data={})
 
 
@@ -226,7 +230,7 @@ def wx_login_api():
         })
 
     except Exception as e:
-        print(f"登录接口异常：{str(e)}")
+        logger.exception(f"登录接口异常：{str(e)}")
         return json_response(code=211, msg='服务器内部错误', data={})
 
 @login_bp.route('/logout', methods=['POST'])
@@ -241,13 +245,13 @@ def logout():
         if token:
             user_id = verify_jwt(token)
             if user_id:
-                print(f"用户{user_id}登出成功")
+                logger.info(f"用户{user_id}登出成功")
 
         # 3. 返回成功（前端需自行删除本地token）
         return json_response(code=200, msg='登出成功，请清除本地token', data={})
     
     except Exception as e:
-        print(f"登出接口异常：{str(e)}")
+        logger.exception(f"登出接口异常：{str(e)}")
         return json_response(code=212, msg='服务器内部错误', data={})
     
 
@@ -1,21 +1,37 @@
-from flask import Blueprint, render_template, jsonify, request, send_file, current_app, g
+from flask import Blueprint, render_template, jsonify, request, send_file, current_app, g, make_response
 import os
 import sys
+import urllib.parse
+import zlib
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import shutil
 from datetime import datetime
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from werkzeug.utils import secure_filename
 from . import login_required
+from config import Config
+from utils import tiering
 from utils.storage import StorageManager
+from utils.metrics import BYTES_SERVED
 from error_code.JsonError import json_response
 
 # 创建蓝图
+# storage_bp：只读接口（模型列表、模型下载），可随副本存储部署在业务服务器，省去跨机代理
+# manager_bp：写接口（删除、重命名、批量操作），部署在主存储所在的服务器
+storage_bp = Blueprint('storage', __name__)
 manager_bp = Blueprint('manager', __name__)
 
+trash_reaper = None
+cold_tierer = None
 
-@manager_bp.route('/manager/list/')
+
+def _is_primary():
+    """本进程部署了 manager 角色（主存储）；只读副本（storage 角色单独部署）不写索引、不恢复冷存储模型"""
+    return 'manager' in (current_app.config.get('APP_ROLES') or ())
+
+
+@storage_bp.route('/manager/list/')
 @login_required
 def list_models():
     # 可以获取其他用户信息
@@ -25,8 +41,18 @@ def list_models():
     sm = StorageManager(data_dir)
     try:
         models = sm.list_models(username)
+        # 转换时记录在索引中的模型信息，客户端无需下载模型即可获得大小、点数和包围盒
+        meta_keys = ('size', 'vertices', 'tiles', 'bbox', 'centroid', 'opacity', 'scale', 'tier')
+        items = []
+        for m in models:
+            item = dict({'path': m['relpath'], 'url': m['url']}, **{k: m[k] for k in meta_keys if k in m})
+            if m.get('preview'):
+                # v 参数随预览图重新生成而变化，配合长缓存
+                item['preview'] = (f"/manager/preview/{urllib.parse.quote(m['relpath'])}"
+                                   f"?v={m.get('preview_time') or ''}")
+            items.append(item)
         return json_response(code=0, msg='获取模型列表成功', data={
-            'models': [{ 'path': m['relpath'], 'url': m['url']} for m in models]
+            'models': items
             }
         )  
 
@@ -38,10 +64,296 @@ def list_models():
 
 
 
+@storage_bp.route('/manager/usage')
+@login_required
+def user_usage():
+    """当前用户的存储占用与配额（读取 usage.json，不遍历目录）"""
+    username = g.username
+
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    usage = StorageManager(data_dir).usage.read(username)
+    return json_response(code=0, msg='获取存储占用成功', data={
+        'bytes': usage['bytes'],
+        'files': usage['files'],
+        'quotaBytes': Config.USER_QUOTA_BYTES,
+        'quotaFiles': Config.USER_QUOTA_FILES,
+    })
+
+
+@storage_bp.route('/manager/preview/<path:model_name>')
+@login_required
+def serve_preview(model_name):
+    """模型预览图（PNG，长缓存）；尚未生成时提交渲染并返回 202，渲染失败或无法渲染时返回 404"""
+    from preview import preview_path
+
+    username = g.username
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    sm = StorageManager(data_dir)
+    try:
+        model_path = sm.get_full_path(username, urllib.parse.unquote(model_name))
+    except ValueError:
+        return json_response(code=302, msg='非法的文件路径', data={}), 400
+
+    png = preview_path(model_path)
+    if os.path.isfile(png):
+        response = make_response(send_file(png, mimetype='image/png', max_age=Config.PREVIEW_MAX_AGE))
+        # 预览图按用户鉴权，只允许浏览器缓存；URL 中的 v 参数变化时才会重新请求
+        response.headers['Cache-Control'] = f'private, max-age={Config.PREVIEW_MAX_AGE}, immutable'
+        return response
+
+    if Config.PREVIEW_ENABLED and os.path.isfile(model_path) and _is_primary():
+        from routes.sharp import submit_model_preview
+        # 正在渲染时不重复提交；这一版本的模型渲染失败过则不再重试，直接返回 404
+        rel_model = os.path.relpath(model_path, sm.user_dir(username)).replace('\\', '/')
+        if submit_model_preview(data_dir, username, rel_model, retry_failed=False) is not None:
+            return json_response(code=317, msg='预览图正在生成', data={}), 202
+    return json_response(code=317, msg='预览图不存在', data={}), 404
+
+
+def _parse_tile_ids(spec, tile_count):
+    """'0,3-5' -> sorted unique tile ids; raises ValueError on bad or out-of-range ids"""
+    ids = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        if first < 0 or last >= tile_count or first > last:
+            raise ValueError(part)
+        ids.update(range(first, last + 1))
+    if not ids:
+        raise ValueError(spec)
+    return sorted(ids)
+
+
+@storage_bp.route('/manager/tiles/<path:model_name>')
+@login_required
+def serve_tiles(model_name):
+    """模型分块索引（tiles.json）；带 ids=0,3-5 时返回这些分块的顶点数据（按块顺序拼接，不含 PLY 头）
+
+    客户端也可以直接用索引中的 data_offset + first * row_size 对 /sharp/<模型> 发 Range 请求。
+    """
+    from convert import tiles_path
+
+    username = g.username
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    sm = StorageManager(data_dir)
+    try:
+        model_path = sm.get_full_path(username, urllib.parse.unquote(model_name))
+    except ValueError:
+        return json_response(code=302, msg='非法的文件路径', data={}), 400
+
+    index_file = tiles_path(model_path)
+    if not os.path.isfile(index_file):
+        return json_response(code=318, msg='模型分块索引不存在', data={}), 404
+
+    spec = request.args.get('ids')
+    relpath = os.path.relpath(model_path, sm.user_dir(username)).replace('\\', '/')
+    if not spec:
+        # 打开模型时先取分块索引：在这里记录访问时间，分块请求本身不再读索引
+        entry = sm.get_model(username, relpath)
+        if entry is None:
+            return json_response(code=318, msg='模型分块索引不存在', data={}), 404
+        if _is_primary():
+            tiering.touch_model(sm, username, entry, Config.ACCESS_TOUCH_INTERVAL)
+        response = make_response(send_file(index_file, mimetype='application/json'))
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    import json
+    with open(index_file, encoding='utf-8') as f:
+        index = json.load(f)
+    tiles = index['tiles']
+    try:
+        ids = _parse_tile_ids(spec, len(tiles))
+    except ValueError:
+        return json_response(code=319, msg='分块编号无效', data={}), 400
+    cold = False
+    if not os.path.isfile(model_path):
+        # 冷存储中的模型需要随机读取：主存储先解压恢复；只读副本不恢复，按顺序解压跳到各分块
+        try:
+            if not tiering.is_cold(sm.get_model(username, relpath)):
+                return json_response(code=318, msg='模型分块索引不存在', data={}), 404
+            if Config.COLD_REHYDRATE and _is_primary():
+                tiering.thaw_model(sm, Config.COLD_DIR, username, relpath)
+            elif os.path.isfile(tiering.cold_path(Config.COLD_DIR, username, relpath)):
+                cold = True
+            else:
+                raise FileNotFoundError(relpath)
+        except FileNotFoundError:
+            return json_response(code=303, msg='模型文件不存在', data={}), 404
+
+    # 相邻分块的行是连续的，合并成尽量少的连续字节区间
+    row_size = index['row_size']
+    ranges = []
+    for tile_id in ids:
+        start = index['data_offset'] + tiles[tile_id][6] * row_size
+        length = tiles[tile_id][7] * row_size
+        if ranges and ranges[-1][0] + ranges[-1][1] == start:
+            ranges[-1][1] += length
+        else:
+            ranges.append([start, length])
+    total = sum(length for _start, length in ranges)
+
+    def generate():
+        # 区间按偏移量递增，冷存储的 gzip 流只需向前 seek
+        with (tiering.open_cold(Config.COLD_DIR, username, relpath) if cold else open(model_path, 'rb')) as f:
+            for start, length in ranges:
+                f.seek(start)
+                while length > 0:
+                    chunk = f.read(min(length, 1024 * 1024))
+                    if not chunk:
+                        return
+                    length -= len(chunk)
+                    yield chunk
+
+    response = current_app.response_class(generate(), mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(total)
+    response.headers['X-Row-Size'] = str(row_size)
+    response.headers['X-Vertex-Count'] = str(total // row_size)
+    response.headers['Access-Control-Expose-Headers'] = 'Content-Length, X-Row-Size, X-Vertex-Count'
+    BYTES_SERVED.inc(total)
+    return response
+
+
+@storage_bp.route('/sharp/<path:filename>')
+@login_required
+def serve_model(filename):
+    
+    username = g.username
+    decoded_filename = urllib.parse.unquote(filename)
+
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    sm = StorageManager(data_dir)
+    models_dir = sm.ensure_user(username)
+
+    try:
+        # 规范化路径，防止路径穿越攻击
+        user_file_path = sm.get_full_path(username, decoded_filename)
+
+        # Ensure requested file is inside the user's models directory
+        if not user_file_path.startswith(models_dir + os.sep) and os.path.basename(user_file_path) != decoded_filename:
+            current_app.logger.warning(f"Attempt to access file outside user dir: {user_file_path}")
+            return json_response(code=302, msg='非法的文件路径', data={}), 400
+
+        relpath = os.path.relpath(user_file_path, models_dir).replace('\\', '/')
+
+        # 先看热存储中的文件：命中时只有主存储记录访问时间才查索引，未命中才按冷存储处理
+        if os.path.isfile(user_file_path):
+            if _is_primary() and Config.ACCESS_TOUCH_INTERVAL:
+                tiering.touch_model(sm, username, sm.get_model(username, relpath), Config.ACCESS_TOUCH_INTERVAL)
+        else:
+            entry = sm.get_model(username, relpath)
+            if not tiering.is_cold(entry):
+                return json_response(code=303, msg='模型文件不存在', data={}), 404
+            if not Config.COLD_REHYDRATE or not _is_primary():
+                # 冷存储副本是压缩的，原始大小只能取自冻结时登记的索引
+                return _stream_cold(username, relpath, entry.get('size'))
+            # 首次访问：解压回原位置（访问时间随之更新），之后按普通文件返回并支持 Range
+            tiering.thaw_model(sm, Config.COLD_DIR, username, relpath)
+
+        if os.path.isfile(user_file_path):
+            # 返回文件内容（send_file 会处理 mime-type）
+            
+            # 1. 获取文件大小（字节数）：取自已打开的文件，重新转换 / 裁剪改写模型后索引中的 size 可能过期
+            f = open(user_file_path, 'rb')
+            # 响应返回之前出错（包括 416）时文件不会交给 WSGI 服务器，在这里关闭
+            try:
+                st = os.fstat(f.fileno())
+                current_app.logger.debug(f"Serving model file: {user_file_path}, size: {st.st_size} bytes")
+            
+                # 2. 用make_response包装send_file，手动添加响应头
+                #    传入文件对象时 send_file 不知道长度，Content-Length 与 Range（206，如按分块索引拉取部分顶点）自行处理
+                etag = f"{st.st_mtime}-{st.st_size}-{zlib.adler32(user_file_path.encode()) & 0xFFFFFFFF}"
+                response = make_response(send_file(f, download_name=os.path.basename(user_file_path), conditional=False,
+                                                   etag=etag, last_modified=st.st_mtime))
+            
+                # 3. 添加Content-Length头（前端读取文件总大小的关键）
+                response.content_length = st.st_size
+                response = response.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+            except BaseException:
+                f.close()
+                raise
+            
+            # 4. 核心：允许前端跨域读取Content-Length头（必加，否则前端拿不到）
+            response.headers['Access-Control-Expose-Headers'] = 'Content-Length, Content-Range, Accept-Ranges'
+            BYTES_SERVED.inc(response.content_length or 0)
+            
+            # ========== 可选优化：添加文件下载相关头 ==========
+            # 可选：指定文件下载的MIME类型（send_file会自动识别，可补充）
+            response.headers['Content-Type'] = 'application/octet-stream'
+            # 可选：强制浏览器下载（如果需要），注释掉则浏览器会尝试预览
+            # response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(user_file_path)}"'
+            
+            return response
+            
+            
+            #return send_file(user_file_path)
+        
+        else:
+            return json_response(code=303, msg='模型文件不存在', data={}), 404
+    except FileNotFoundError:
+        # 索引中有记录但文件已不存在
+        return json_response(code=303, msg='模型文件不存在', data={}), 404
+    except RequestedRangeNotSatisfiable:
+        raise
+    except Exception as e:
+        import traceback
+        tb = traceback.format_exc()
+        current_app.logger.error('Error serving model file: %s', tb)
+        if current_app.debug:
+            return json_response(code=304, msg='服务器内部错误', data={'error': str(e), 'trace': tb}), 500
+        else:
+            return json_response(code=305, msg='服务器内部错误', data={}), 500
+
+
+def _thaw_cold(sm, username, relpath):
+    """索引标记为冷存储的模型解压回原位置并返回路径；不是冷存储模型返回 None"""
+    if not tiering.is_cold(sm.get_model(username, relpath)):
+        return None
+    return tiering.thaw_model(sm, Config.COLD_DIR, username, relpath)
+
+
+def _stream_cold(username, relpath, size):
+    """不恢复到热存储，直接流式解压返回整个模型（不支持 Range）"""
+    body = tiering.iter_cold(Config.COLD_DIR, username, relpath)
+    response = current_app.response_class(body, mimetype='application/octet-stream')
+    if size is not None:
+        response.headers['Content-Length'] = str(size)
+    response.headers['Accept-Ranges'] = 'none'
+    response.headers['Access-Control-Expose-Headers'] = 'Content-Length, Content-Range, Accept-Ranges'
+    BYTES_SERVED.inc(size or 0)
+    return response
+
+
+def init_manager(app):
+    """manager 角色：启动回收站清理、存储统计校正和冷存储分层线程（多个 worker 进程间由文件锁保证只有一个在执行）"""
+    global trash_reaper, cold_tierer
+    from utils.reaper import TrashReaper
+
+    data_dir = app.config.get('DATA_DIR', Config.DATA_DIR)
+    trash_reaper = TrashReaper(data_dir, StorageManager.TRASH_NAME,
+                               undo_window=Config.TRASH_UNDO_WINDOW, interval=Config.TRASH_REAP_INTERVAL,
+                               bytes_per_sec=Config.TRASH_REAP_BYTES_PER_SEC,
+                               files_per_sec=Config.TRASH_REAP_FILES_PER_SEC, cold_dir=Config.COLD_DIR)
+    trash_reaper.start()
+    if Config.COLD_TIER_ENABLED:
+        cold_tierer = tiering.ColdTierer(data_dir, Config.COLD_DIR, after_days=Config.COLD_AFTER_DAYS,
+                                         interval=Config.COLD_SCAN_INTERVAL, bytes_per_sec=Config.COLD_BYTES_PER_SEC,
+                                         level=Config.COLD_COMPRESS_LEVEL)
+        cold_tierer.start()
+    if Config.USAGE_RECONCILE_INTERVAL:
+        from utils.usage import start_reconciler
+        start_reconciler(data_dir, Config.USAGE_RECONCILE_INTERVAL)
+    return trash_reaper
+
+
 @manager_bp.route('/manager/delete/<path:model_name>', methods=['POST'])
 @login_required
 def delete_model(model_name):
-    """删除指定的3D模型"""
+    """删除指定的3D模型：所在文件夹移入回收站（原子重命名），索引记录一次性移除，空间由后台线程回收"""
     user_name = g.username
     
     data_dir = current_app.config.get('DATA_DIR', 'data')
@@ -53,59 +365,74 @@ def delete_model(model_name):
     # 防止路径穿越
     if not model_path.startswith(user_dir + os.sep) and os.path.basename(model_path) != model_name:
         return json_response(code=306, msg='非法的文件路径', data={}), 400
+    # 索引、用量文件和预览图等附属文件不能单独删除（附属文件随模型一起删除）
+    try:
+        sm.user_relpath(user_name, model_name)
+    except ValueError:
+        return json_response(code=306, msg='非法的文件路径', data={}), 400
 
-    if os.path.isfile(model_path):
+    # 冷存储中的模型文件不在原位置，按文件处理（整个文件夹移入回收站，冷存储副本由回收站清理时删除）
+    cold = not os.path.lexists(model_path) and tiering.is_cold(
+        sm.get_model(user_name, os.path.relpath(model_path, user_dir).replace('\\', '/')))
+
+    if os.path.isfile(model_path) or cold:
         # If it's a file, remove its containing folder (so image folder + models)
         folder = os.path.dirname(model_path)
+        # 位于用户根目录下的文件只删除该文件本身
+        target = model_path if folder == user_dir else folder
         try:
-            if os.path.isdir(folder):
-                # remove the entire folder containing this file
-                shutil.rmtree(folder)
-                # remove any indexed models under this folder
-                try:
-                    models = sm.list_models(user_name)
-                    prefix = os.path.relpath(folder, user_dir).replace('\\', '/')
-                    if not prefix.endswith('/'):
-                        prefix = prefix + '/'
-                    for m in models:
-                        if m['relpath'].startswith(prefix):
-                            sm.remove_model(user_name, m['relpath'])
-                except Exception:
-                    current_app.logger.exception('从索引移除模型失败')
-                return json_response(code=0, msg='模型所在文件夹已删除', data={})
-            else:
-                # containing folder does not exist (file likely missing) — ensure xml record removed
-                try:
-                    sm.remove_model(user_name, model_name)
-                except Exception:
-                    current_app.logger.exception('从索引移除模型失败')
-                return json_response(code=0, msg='模型文件不存在，已从索引移除记录', data={})
-                
+            trash_id = sm.trash_path(user_name, os.path.relpath(target, user_dir))
+            return json_response(code=0, msg='模型所在文件夹已删除', data={
+                'trashId': trash_id, 'undoSeconds': Config.TRASH_UNDO_WINDOW})
+        except ValueError:
+            return json_response(code=306, msg='非法的文件路径', data={}), 400
         except Exception as e:
             current_app.logger.exception('删除文件/文件夹失败')
             return json_response(code=307, msg='服务器内部错误', data={})
 
     elif os.path.isdir(model_path):
         try:
-            shutil.rmtree(model_path)
-            # remove any indexed models under this folder
-            try:
-                models = sm.list_models(user_name)
-                prefix = model_name.rstrip('/') + '/'
-                for m in models:
-                    if m['relpath'].startswith(prefix):
-                        sm.remove_model(user_name, m['relpath'])
-            except Exception:
-                current_app.logger.exception('从索引移除模型失败')
-            return json_response(code=0, msg='模型删除成功', data={})
-            
+            trash_id = sm.trash_path(user_name, os.path.relpath(model_path, user_dir))
+            return json_response(code=0, msg='模型删除成功', data={
+                'trashId': trash_id, 'undoSeconds': Config.TRASH_UNDO_WINDOW})
+        except ValueError:
+            return json_response(code=306, msg='非法的文件路径', data={}), 400
         except Exception as e:
             current_app.logger.exception('删除目录失败')
             return json_response(code=308, msg='服务器内部错误', data={})
     else:
+        # 文件已不存在：确保索引记录被移除
+        try:
+            if sm.remove_models_under(user_name, model_name):
+                return json_response(code=0, msg='模型文件不存在，已从索引移除记录', data={})
+        except Exception:
+            current_app.logger.exception('从索引移除模型失败')
         return json_response(code=309, msg='模型不存在', data={}), 404
 
 
+@manager_bp.route('/manager/restore/<trash_id>', methods=['POST'])
+@login_required
+def restore_model(trash_id):
+    """撤销删除：在 TRASH_UNDO_WINDOW 内把回收站中的文件夹移回原位置并恢复索引记录"""
+    user_name = g.username
+
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    sm = StorageManager(data_dir)
+    try:
+        relpath = sm.restore_trash(user_name, trash_id, max_age=Config.TRASH_UNDO_WINDOW)
+        return json_response(code=0, msg='已撤销删除', data={'path': relpath})
+
+    except FileNotFoundError:
+        return json_response(code=314, msg='删除记录不存在或已过期', data={}), 404
+
+    except FileExistsError:
+        return json_response(code=315, msg='原位置已存在同名文件夹', data={}), 409
+
+    except Exception as e:
+        current_app.logger.exception('撤销删除失败')
+        return json_response(code=316, msg='服务器内部错误', data={}), 500
+
+
 @manager_bp.route('/manager/rename', methods=['POST'])
 @login_required
 def rename_model():
@@ -123,6 +450,8 @@ def rename_model():
     sm = StorageManager(data_dir)
     try:
         # old_name is relpath; new_name is base name without extension
+        # 冷存储中的模型先恢复，改名只处理原位置的文件
+        _thaw_cold(sm, user_name, old_name)
         new_rel = sm.rename_model(user_name, old_name, new_name)
         return json_response(code=0, msg='重命名成功', data={'new_name': new_rel})
         
@@ -137,4 +466,80 @@ def rename_model():
     
     except Exception as e:
         current_app.logger.exception('重命名失败')
-        return json_response(code=313, msg='服务器内部错误', data={}), 500
\ No newline at end of file
+        return json_response(code=313, msg='服务器内部错误', data={}), 500
+
+
+def _thaw_for_batch(sm, username, ops):
+    """批量改名 / 移动前恢复涉及的冷存储模型（冷存储副本按原路径存放，不能跟随移动）"""
+    cold = [m['relpath'] for m in sm.list_models(username) if tiering.is_cold(m)]
+    if not cold:
+        return
+    for op in ops:
+        if not isinstance(op, dict) or op.get('op') not in ('rename', 'move') or not isinstance(op.get('path'), str):
+            continue
+        prefix = op['path'].strip('/')
+        for relpath in cold:
+            if relpath == prefix or relpath.startswith(prefix + '/'):
+                try:
+                    tiering.thaw_model(sm, Config.COLD_DIR, username, relpath)
+                except (OSError, ValueError):
+                    # 恢复失败的模型在校验时按源文件不存在处理
+                    current_app.logger.exception(f"冷存储模型恢复失败: {relpath}")
+
+
+def _batch_error(e):
+    if isinstance(e, FileExistsError):
+        return 311, str(e)
+    if isinstance(e, FileNotFoundError):
+        return 309, str(e)
+    if isinstance(e, ValueError):
+        return 306, str(e)
+    return 307, '服务器内部错误'
+
+
+@manager_bp.route('/manager/batch', methods=['POST'])
+@login_required
+def batch_models():
+    """批量删除 / 重命名 / 移动：先校验全部路径，再逐项执行文件操作，索引只写一次。
+
+    请求 JSON：{"ops": [{"op": "delete", "path": "a/a.ply"},
+                        {"op": "rename", "path": "b/b.ply", "name": "新名称"},
+                        {"op": "move", "path": "c", "to": "相册1"}]}
+    按顺序返回每一项的结果（code 与单项接口一致），有失败项时 code=321。
+    """
+    user_name = g.username
+
+    data = request.get_json(silent=True) or {}
+    ops = data.get('ops')
+    if not isinstance(ops, list) or not ops:
+        return json_response(code=320, msg='参数缺失', data={}), 400
+    if len(ops) > Config.MANAGER_BATCH_MAX_OPS:
+        return json_response(code=320, msg=f"单次最多 {Config.MANAGER_BATCH_MAX_OPS} 项操作", data={}), 400
+
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    sm = StorageManager(data_dir)
+    try:
+        _thaw_for_batch(sm, user_name, ops)
+        results = sm.apply_batch(user_name, ops)
+    except Exception:
+        current_app.logger.exception('批量操作失败')
+        return json_response(code=322, msg='服务器内部错误', data={}), 500
+
+    items = []
+    for op, result in zip(ops, results):
+        item = {'op': op.get('op'), 'path': op.get('path')} if isinstance(op, dict) else {'op': None, 'path': None}
+        if result['ok']:
+            item['code'] = 0
+            if 'trashId' in result:
+                item['trashId'] = result['trashId']
+            else:
+                item['newPath'] = result['path']
+        else:
+            item['code'], item['msg'] = _batch_error(result['error'])
+        items.append(item)
+    failed = sum(1 for item in items if item['code'])
+    data = {'results': items, 'succeeded': len(items) - failed, 'failed': failed,
+            'undoSeconds': Config.TRASH_UNDO_WINDOW}
+    if failed:
+        return json_response(code=321, msg='部分操作失败', data=data)
+    return json_response(code=0, msg='批量操作成功', data=data)
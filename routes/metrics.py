@@ -0,0 +1,47 @@
+from flask import Blueprint, Response, request, g
+import hmac
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils import metrics
+
+# Prometheus 指标接口（所有角色通用）
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def init_metrics(app):
+    """注册 /metrics 以及按路由统计请求耗时的钩子"""
+    app.register_blueprint(metrics_bp)
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = getattr(g, '_metrics_start', None)
+        if start is not None:
+            # 使用路由规则而非原始路径作为标签，避免模型路径导致标签爆炸
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            metrics.REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - start)
+        return response
+
+
+def _authorized():
+    """Authorization: Bearer <METRICS_TOKEN>；未配置 token 时拒绝访问（/metrics 经兜底路由对外可见）"""
+    if not Config.METRICS_TOKEN:
+        return False
+    auth = request.headers.get('Authorization', '')
+    return hmac.compare_digest(auth, f"Bearer {Config.METRICS_TOKEN}")
+
+
+@metrics_bp.route('/metrics')
+def metrics_page():
+    if not _authorized():
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    return Response(metrics.collect(), mimetype='text/plain; version=0.0.4; charset=utf-8')
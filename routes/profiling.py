@@ -0,0 +1,110 @@
+from flask import Blueprint, Response, request, g, send_file
+import hmac
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from error_code.JsonError import json_response
+from utils import profiling
+
+# 按请求开启的 cProfile（管理员签名请求头或按比例抽样），结果写入 PROFILING_DIR
+profiling_bp = Blueprint('profiling', __name__)
+
+
+def init_profiling(app):
+    """注册 /debug/profiles 以及按请求开关 cProfile 的钩子；PROFILING_ENABLED 关闭时不调用，无任何开销"""
+    import cProfile
+
+    app.register_blueprint(profiling_bp)
+
+    @app.before_request
+    def _start_profile():
+        if request.path.startswith('/debug/profiles'):
+            return
+        if profiling.verify_token(Config.PROFILING_SECRET, request.headers.get(profiling.PROFILE_HEADER)):
+            trigger = 'header'
+        elif Config.PROFILING_SAMPLE_RATE and random.random() < Config.PROFILING_SAMPLE_RATE:
+            trigger = 'sample'
+        else:
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 同一解释器中已有其他 profiler 在运行（如另一个线程的请求），跳过本次
+            return
+        g._profile = (profiler, trigger, time.perf_counter())
+
+    @app.after_request
+    def _save_profile(response):
+        state = g.pop('_profile', None)
+        if state is None:
+            return response
+        profiler, trigger, start = state
+        profiler.disable()
+        duration_ms = (time.perf_counter() - start) * 1000
+        info = {
+            'route': request.url_rule.rule if request.url_rule is not None else None,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'trigger': trigger,
+            'username': getattr(g, 'username', None),
+        }
+        try:
+            name = profiling.save_profile(str(Config.PROFILING_DIR), profiler, info, Config.PROFILING_MAX_FILES)
+            response.headers['X-Profile-Name'] = name
+        except OSError:
+            app.logger.exception('保存请求 profile 失败')
+        return response
+
+    @app.teardown_request
+    def _stop_profile(_exc):
+        # 未走到 after_request 的请求（如响应生成前断开）也要停掉 profiler
+        state = g.pop('_profile', None)
+        if state is not None:
+            state[0].disable()
+
+
+def _authorized():
+    """与 /metrics 相同：Authorization: Bearer <PROFILING_SECRET>"""
+    if not Config.PROFILING_SECRET:
+        return False
+    auth = request.headers.get('Authorization', '')
+    return hmac.compare_digest(auth, f"Bearer {Config.PROFILING_SECRET}")
+
+
+@profiling_bp.route('/debug/profiles')
+def list_profiles():
+    if not _authorized():
+        return json_response(code=621, msg='无权访问', data={}), 403
+    limit = request.args.get('limit', 50, type=int)
+    return json_response(code=0, msg='获取 profile 列表成功', data={
+        'profiles': profiling.list_profiles(str(Config.PROFILING_DIR), limit)
+    })
+
+
+@profiling_bp.route('/debug/profiles/<name>')
+def get_profile(name):
+    """?format=prof 下载 pstats 文件，?format=json 返回描述与函数耗时表，默认返回文本报告"""
+    if not _authorized():
+        return json_response(code=621, msg='无权访问', data={}), 403
+    fmt = request.args.get('format', 'text')
+    try:
+        path = profiling.profile_path(str(Config.PROFILING_DIR), name, '.json' if fmt == 'json' else '.prof')
+    except ValueError:
+        return json_response(code=622, msg='profile 不存在', data={}), 404
+    if not os.path.isfile(path):
+        return json_response(code=622, msg='profile 不存在', data={}), 404
+    if fmt in ('prof', 'json'):
+        return send_file(path, as_attachment=(fmt == 'prof'), download_name=os.path.basename(path))
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls', 'ncalls', 'time'):
+        sort = 'cumulative'
+    return Response(profiling.render_text(path, sort, request.args.get('limit', 40, type=int)),
+                    mimetype='text/plain; charset=utf-8')
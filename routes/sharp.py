@@ -6,6 +6,7 @@ import urllib.parse
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import uuid
+import logging
 import threading
 import time
 import shutil
@@ -13,29 +14,45 @@ from datetime import datetime
 from werkzeug.utils import secure_filename
 from . import login_required
 from config import Config
-from trainer_image import ImageModelTrainer
-from convert import convert as ply_convert
 from pathlib import Path
 from utils.storage import StorageManager
+from utils.metrics import STAGE_SECONDS, TASKS_TOTAL, QUEUE_DEPTH
+from utils import tracing
 from error_code.JsonError import json_response
 
+logger = logging.getLogger(__name__)
+
 # 创建蓝图
 sharp_bp = Blueprint('sharp', __name__)
 
 # 存储任务状态的全局字典
 sharp_tasks = {}
 
+# 分派模式（dispatch 角色）下的任务分派器，由 init_dispatcher 创建；为 None 时在本机执行重建
+dispatcher = None
+
+# 本机重建任务队列（GPU 槽位），首次提交时创建
+sharp_queue = None
+
 class TaskStatus:
     """任务状态跟踪"""
     UPLOADING = "uploading"
     UPLOADED = "uploaded"
+    QUEUED = "queued"
     PROCESSING = "processing"
     TRAINING = "training"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    FINISHED = (COMPLETED, FAILED, CANCELLED)
 
 def update_task_status(task_id, status, message="", progress=0, result=None):
     """更新任务状态"""
+    previous = sharp_tasks.get(task_id, {}).get('status')
+    if status in TaskStatus.FINISHED and previous not in TaskStatus.FINISHED:
+        TASKS_TOTAL.labels(status).inc()
+
     if task_id not in sharp_tasks:
         sharp_tasks[task_id] = {
             "status": status,
@@ -54,6 +71,83 @@ def update_task_status(task_id, status, message="", progress=0, result=None):
             "updated_at": time.time()
         })
 
+    # 分派模式下任务状态需要在各 gunicorn worker 之间共享，同步写入任务存储
+    if dispatcher is not None and dispatcher.store.exists(task_id):
+        dispatcher.store.update(task_id, status=status, message=message, progress=progress, result=result)
+
+
+def get_task(task_id):
+    """读取任务状态：分派任务以共享任务存储为准"""
+    if dispatcher is not None:
+        job = dispatcher.store.get(task_id)
+        if job is not None:
+            return job
+    return sharp_tasks.get(task_id)
+
+
+def _discard_upload(data_dir, username, rel_folder):
+    """删除没有产生模型的任务上传的图片文件夹，并释放其存储统计"""
+    shutil.rmtree(os.path.join(data_dir, username, rel_folder), ignore_errors=True)
+    StorageManager(data_dir).update_usage(username, rel_folder)
+
+
+def _expire_task(task_id):
+    # 排队超时的任务不会再执行：与取消一样删除上传的图片文件夹
+    task = sharp_tasks.get(task_id, {})
+    if task.get('username') and task.get('rel_folder'):
+        _discard_upload(task.get('data_dir', Config.DATA_DIR), task['username'], task['rel_folder'])
+    update_task_status(task_id, TaskStatus.FAILED, "排队超时，请稍后重试", 100)
+
+
+def new_fair_scheduler(user_max_running=0):
+    from utils.jobqueue import FairScheduler
+    return FairScheduler(Config.SHARP_LANE_WEIGHTS, Config.SHARP_USER_WEIGHTS, user_max_running)
+
+
+def choose_lane(username, requested=None):
+    """客户端可指定 lane（interactive / bulk）；否则按该用户已排队的任务数自动判断"""
+    if requested in Config.SHARP_LANE_WEIGHTS:
+        return requested
+    if dispatcher is not None:
+        queued = dispatcher.queued_for(username)
+    else:
+        queued = get_sharp_queue().queued_for(username)
+    return 'bulk' if Config.SHARP_BULK_THRESHOLD and queued >= Config.SHARP_BULK_THRESHOLD else 'interactive'
+
+
+def get_sharp_queue():
+    global sharp_queue
+    if sharp_queue is None:
+        from utils.jobqueue import JobQueue
+        sharp_queue = JobQueue(Config.SHARP_MAX_CONCURRENT, Config.SHARP_QUEUE_TIMEOUT or None, on_expire=_expire_task,
+                               scheduler=new_fair_scheduler(Config.SHARP_USER_MAX_RUNNING))
+        QUEUE_DEPTH.set_function(sharp_queue.depth)
+    return sharp_queue
+
+
+def init_dispatcher(app):
+    """dispatch 角色：创建任务分派器，上传的图片改由远程 GPU worker 重建"""
+    global dispatcher
+    from utils.dispatcher import Dispatcher
+
+    data_dir = app.config.get('DATA_DIR', 'data')
+    dispatcher = Dispatcher(
+        data_dir, Config.DISPATCH_DIR, Config.DISPATCHER_URL, Config.WORKER_TOKEN,
+        on_status=lambda task_id, status, message, progress: update_task_status(task_id, status, message, progress),
+        on_complete=lambda task_id, username, rel_folder, result: finish_sharp_task(task_id, data_dir, username, rel_folder, result),
+        heartbeat_ttl=Config.WORKER_HEARTBEAT_TTL,
+        retry_interval=Config.DISPATCH_RETRY_INTERVAL,
+        scheduler=new_fair_scheduler(),
+    )
+    if Config.DISPATCH_LOOPBACK_WORKERS:
+        from utils.dispatcher import LoopbackWorker
+        dispatcher.add_worker(LoopbackWorker(dispatcher, Config.WORKER_SCRATCH_DIR,
+                                             capacity=Config.DISPATCH_LOOPBACK_WORKERS))
+    # 接管已退出进程留下的排队任务、worker 下线后无人处理的任务；之后每个心跳周期检查一次
+    dispatcher.recover()
+    dispatcher.start_monitor()
+    return dispatcher
+
 # 允许的扩展名
 
 
@@ -111,6 +205,10 @@ def upload_image():
     
     original_name = request.form.get('originalName', '')
 
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    if not StorageManager(data_dir).usage.check_quota(username, request.content_length or 0):
+        return json_response(code=409, msg='存储空间已满，请删除部分模型后重试'), 507
+
     try:
         
         # create task
@@ -119,18 +217,14 @@ def upload_image():
         
         
         # save uploaded image into its own folder (username/<image_folder>/image.jpg)
-        data_dir = current_app.config.get('DATA_DIR', 'data')
         sm = StorageManager(data_dir)
-        rel_folder, filename_saved, save_path = sm.save_image(username, file, original_name)
-        update_task_status(task_id, TaskStatus.PROCESSING, "正在处理图片...", 10)
-       
-
-        # start background processing thread
-        t = threading.Thread(target=_run_sharp_task, args=(task_id, data_dir, save_path, username, rel_folder), daemon=True)
-        t.start()
+        with STAGE_SECONDS.time('upload'), tracing.span('upload', task_id, username=username) as span_attrs:
+            rel_folder, filename_saved, save_path = sm.save_image(username, file, original_name)
+            span_attrs.update(folder=rel_folder, bytes=os.path.getsize(save_path))
+        submit_image_task(task_id, data_dir, username, rel_folder, save_path, request.form.get('lane'))
         
         #从状态字典中获取任务结果
-        task = sharp_tasks.get(task_id)
+        task = get_task(task_id)
         if not task:
             return json_response(code=405, msg='任务不存在')
     
@@ -142,101 +236,195 @@ def upload_image():
         return json_response(code=404, msg='服务器错误: ' + str(e)), 500
 
 
-def _run_sharp_task(task_id, data_dir,image_path, username, rel_folder):
-    
-    if Config.USE_GPU_SERVER : 
-        update_task_status(task_id, TaskStatus.TRAINING, "正在重建...", 80)
-    
-        trainer = ImageModelTrainer()
-        sm = StorageManager(data_dir)
-        # image_path is the saved image file; sharp predict expects an input directory
-        image_dir = os.path.dirname(image_path)
-        # output directory should be the same image folder so generated ply sits alongside the image
-        user_dir = os.path.join(data_dir, username)
-        out_dir = os.path.join(user_dir, rel_folder)
-        os.makedirs(out_dir, exist_ok=True)
+def submit_image_task(task_id, data_dir, username, rel_folder, save_path, lane=None):
+    """已保存的图片进入重建：分派给远程 GPU worker，或进入本机任务队列"""
+    update_task_status(task_id, TaskStatus.QUEUED, "排队中...", 10)
+    # 记录任务归属（取消任务时校验用户）、上传位置（取消 / 超时时删除）和入队时间
+    sharp_tasks[task_id].update({'username': username, 'rel_folder': rel_folder, 'data_dir': data_dir,
+                                 'enqueued_at': time.time()})
 
-        # call trainer with input directory and output directory
-        training_result = trainer.train(image_dir, out_dir)
-        if not training_result.get('success'):
-            update_task_status(task_id, TaskStatus.FAILED, f"重建失败: {training_result.get('message')}", training_result.get('log', []))
-            return
+    lane = choose_lane(username, lane)
+    if dispatcher is not None:
+        # 分派给远程 GPU worker（无空闲 worker 时按公平顺序排队重试）
+        dispatcher.submit(task_id, username, rel_folder, save_path, lane=lane)
+    else:
+        # 进入本机任务队列，按用户公平轮转占用 GPU 槽位
+        get_sharp_queue().submit(task_id, _run_sharp_task, task_id, data_dir, save_path, username, rel_folder,
+                                 user=username, lane=lane)
 
-        update_task_status(task_id, TaskStatus.PROCESSING, "正在处理数据...", 10)
-        out_dir = training_result.get('output_dir')
 
-        # 查找输出目录中的 ply / ply.gz / splat 文件
-        result_file = None
+# 视频关键帧提取线程池（ffmpeg 解码 + 进程池打分），首次提交时创建
+video_executor = None
+
+
+def submit_video_task(task_id, data_dir, username, rel_folder, video_path, lane=None):
+    """视频先提取关键帧（不占用 GPU 槽位），选出的画面再逐张进入重建"""
+    global video_executor
+    if video_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        video_executor = ThreadPoolExecutor(max_workers=Config.VIDEO_MAX_CONCURRENT, thread_name_prefix='keyframes')
+    update_task_status(task_id, TaskStatus.PROCESSING, "正在提取关键帧...", 2)
+    sharp_tasks[task_id].update({'username': username, 'rel_folder': rel_folder})
+    video_executor.submit(_run_video_task, task_id, data_dir, username, rel_folder, video_path, lane)
+
+
+def _run_video_task(task_id, data_dir, username, rel_folder, video_path, lane=None):
+    with tracing.bind_task(task_id, username):
         try:
-            for fname in os.listdir(out_dir):
-                if fname.lower().endswith(('.ply', '.splat')):
-                    result_file = fname
-                    break
+            submitted = _run_video_task_bound(task_id, data_dir, username, rel_folder, video_path, lane)
         except Exception:
-            result_file = None
-
-        if result_file:
-            # 1) attempt conversion using convert.py (if available)
-            try:
-                teaser_full = os.path.join(out_dir, result_file)
-                # determine output filename: base + _convert + ext
-                base, ext = os.path.splitext(result_file)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                converted_name = f"{base}_{timestamp}{ext}"
-                converted_full = os.path.join(out_dir, converted_name)
-                #target_full = os.path.join(data_dir, Config.Target_File)
-
-                print(f"input file : {teaser_full}")
-                print(f"output file: {converted_full}")
-                ply_convert(Path(teaser_full), Path(converted_full))
-                
-                # remove intermediate teaser file
-                try:
-                    os.remove(teaser_full)
-                except Exception:
-                    current_app.logger.exception('删除中间文件失败')
-                
-                # 尝试将转换后的文件重命名为与输出文件夹同名（保留扩展名），避免覆盖已有文件
-                try:
-                    folder_name = os.path.basename(out_dir.rstrip(os.sep))
-                    new_name = f"{folder_name}{ext}"
-                    new_full = os.path.join(out_dir, new_name)
-
-                    if os.path.abspath(converted_full) != os.path.abspath(new_full):
-                        # 若目标名已存在，则在其后追加时间戳以避免覆盖
-                        if os.path.exists(new_full):
-                            ts2 = datetime.now().strftime('%Y%m%d_%H%M%S')
-                            new_name = f"{folder_name}_{ts2}{ext}"
-                            new_full = os.path.join(out_dir, new_name)
-                        os.replace(converted_full, new_full)
-                        converted_name = new_name
-                        converted_full = new_full
-                except Exception:
-                    current_app.logger.exception('重命名转换文件失败')
-
-                # register converted file (use final converted_name)
-                rel_converted = os.path.join(rel_folder, converted_name).replace('\\', '/')
-                encoded_filename = urllib.parse.quote(rel_converted, safe='')
-                
-                try:
-                    viewer_link = f"{Config.CLOUD_SERVER}/viewer?model={encoded_filename}"
-                    sm.add_model(username, rel_converted, viewer_link)
-                    update_task_status(task_id, TaskStatus.COMPLETED, "已完成", 100, result=viewer_link)
-                
-                except Exception:
-                    current_app.logger.exception('注册转换后模型失败')
-                    update_task_status(task_id, TaskStatus.FAILED, "保存失败", 100)
-                
-            
-                
-            except Exception as e:
-                # conversion failed; still register original result and finish
-                current_app.logger.exception('PLY 转换失败')
-                rel = os.path.join(rel_folder, result_file).replace('\\', '/')
-                update_task_status(task_id, TaskStatus.COMPLETED, f"完成（转换失败: {e}", 100, result=rel)
+            logger.exception('视频关键帧提取失败')
+            submitted = bool(sharp_tasks.get(task_id, {}).get('keyframe_tasks'))
+            if not submitted:
+                update_task_status(task_id, TaskStatus.FAILED, "视频解析失败", 100)
+        if not submitted and rel_folder:
+            # 没有可用的关键帧：视频文件夹不会产生模型，直接删除
+            _discard_upload(data_dir, username, rel_folder)
+
+
+def _run_video_task_bound(task_id, data_dir, username, rel_folder, video_path, lane):
+    """提取关键帧并提交重建；返回是否已提交"""
+    from keyframes import extract_keyframes, get_pool
+
+    def on_progress(fraction):
+        progress = 2 + int(fraction * 8)
+        if progress != sharp_tasks.get(task_id, {}).get('progress'):
+            update_task_status(task_id, TaskStatus.PROCESSING, f"正在提取关键帧... {int(fraction * 100)}%", progress)
+
+    folder = os.path.dirname(video_path)
+    out_dir = os.path.join(folder, '.keyframes')
+    with STAGE_SECONDS.time('keyframes'), tracing.span('keyframes', task_id, video=os.path.basename(video_path)) as span_attrs:
+        frames = extract_keyframes(
+            video_path, out_dir, count=Config.VIDEO_KEYFRAMES, score_width=Config.VIDEO_SCORE_WIDTH,
+            sample_fps=Config.VIDEO_SAMPLE_FPS, max_frames=Config.VIDEO_MAX_FRAMES,
+            min_difference=Config.VIDEO_MIN_DIFFERENCE, blur_quantile=Config.VIDEO_BLUR_QUANTILE,
+            quality=Config.VIDEO_FRAME_QUALITY, pool=get_pool(), ffmpeg=Config.FFMPEG_PATH,
+            ffprobe=Config.FFPROBE_PATH, on_progress=on_progress)
+        span_attrs['frames'] = len(frames)
+    if not frames:
+        update_task_status(task_id, TaskStatus.FAILED, "视频中没有足够清晰的画面", 100)
+        return False
+
+    # 视频只用于提取关键帧：最佳画面放回视频所在文件夹（与上传单张图片相同的布局）并沿用视频的任务 id，
+    # 其余关键帧各自新建图片文件夹和任务
+    sm = StorageManager(data_dir)
+    base = os.path.splitext(os.path.basename(video_path))[0]
+    os.remove(video_path)
+    task_ids = []
+    for rank, frame in enumerate(frames, 1):
+        name = f"{base}.jpg" if rank == 1 else f"{base}_{rank}.jpg"
+        if rank == 1:
+            frame_folder, frame_path = rel_folder, os.path.join(folder, name)
+            os.replace(frame['path'], frame_path)
         else:
-            # 若没有找到直接的模型文件，仍返回输出目录供人工查看
-            update_task_status(task_id, TaskStatus.COMPLETED, "完成（未找到明确的模型文件，输出在目录）", 100, result=os.path.basename(out_dir))
+            frame_folder, _name, frame_path = sm.save_upload(username, frame['path'], name)
+        frame_task = task_id if rank == 1 else str(uuid.uuid4())
+        submit_image_task(frame_task, data_dir, username, frame_folder, frame_path, lane)
+        task_ids.append(frame_task)
+        sharp_tasks[task_id]['keyframe_tasks'] = list(task_ids)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    sm.update_usage(username, rel_folder)
+    logger.info(f"视频 {os.path.basename(video_path)} 生成 {len(task_ids)} 个重建任务: {task_ids}")
+    return True
+
+
+def submit_model_preview(data_dir, username, rel_model, retry_failed=True):
+    """在进程池中渲染预览图（不阻塞任务完成），完成后登记到模型索引
+
+    同一版本的模型正在渲染时返回已有的 future；retry_failed=False 时渲染失败过的版本返回 None。
+    """
+    from preview import submit_preview
+
+    sm = StorageManager(data_dir)
+
+    def on_done(png_path):
+        rel_preview = os.path.relpath(png_path, sm.user_dir(username)).replace('\\', '/')
+        sm.update_model(username, rel_model, preview=rel_preview, preview_time=int(time.time()))
+        sm.update_usage(username, rel_preview)
+
+    try:
+        return submit_preview(sm.get_full_path(username, rel_model), on_done, retry_failed)
+    except Exception:
+        logger.exception('提交预览图渲染失败')
+        return None
+
+
+def finish_sharp_task(task_id, data_dir, username, rel_folder, result):
+    """根据重建结果（sharp_pipeline.reconstruct 的返回值）注册模型并更新任务状态
+
+    result['model_file'] 必须位于 DATA_DIR/username/rel_folder 下。
+    """
+    if result.get('cancelled'):
+        # 取消的任务不会产生模型，删除本次上传的图片文件夹
+        _discard_upload(data_dir, username, rel_folder)
+        update_task_status(task_id, TaskStatus.CANCELLED, "已取消", 100)
+        return
+
+    # 重建 / 转换在文件夹中产生的模型文件计入用户存储统计
+    StorageManager(data_dir).update_usage(username, rel_folder)
+
+    if not result.get('success'):
+        update_task_status(task_id, TaskStatus.FAILED, f"重建失败: {result.get('message')}", 100)
+        return
+
+    model_file = result.get('model_file')
+    if not model_file:
+        # 若没有找到直接的模型文件，仍返回输出目录供人工查看
+        update_task_status(task_id, TaskStatus.COMPLETED, result.get('message'), 100, result=os.path.basename(rel_folder))
+        return
+
+    rel_model = os.path.join(rel_folder, os.path.basename(model_file)).replace('\\', '/')
+    if not result.get('converted'):
+        # conversion failed; return original result without registering it
+        update_task_status(task_id, TaskStatus.COMPLETED, result.get('message'), 100, result=rel_model)
+        return
+
+    # register converted file
+    encoded_filename = urllib.parse.quote(rel_model, safe='')
+    try:
+        viewer_link = f"{Config.CLOUD_SERVER}/viewer?model={encoded_filename}"
+        with STAGE_SECONDS.time('register'), tracing.span('register', task_id, model=rel_model):
+            StorageManager(data_dir).add_model(username, rel_model, viewer_link, metadata=result.get('metadata'))
+        update_task_status(task_id, TaskStatus.COMPLETED, "已完成", 100, result=viewer_link)
+        if Config.PREVIEW_ENABLED:
+            submit_model_preview(data_dir, username, rel_model)
+        task = get_task(task_id) or {}
+        if task.get('created_at'):
+            STAGE_SECONDS.labels('total').observe(time.time() - task['created_at'])
+    except Exception:
+        logger.exception('注册转换后模型失败')
+        update_task_status(task_id, TaskStatus.FAILED, "保存失败", 100)
+
+
+def _run_sharp_task(task_id, data_dir,image_path, username, rel_folder, cancel_event=None):
+    # 本线程内的日志与 trace span 都关联到该任务
+    with tracing.bind_task(task_id, username):
+        _run_sharp_task_bound(task_id, data_dir, image_path, username, rel_folder, cancel_event)
+
+
+def _run_sharp_task_bound(task_id, data_dir,image_path, username, rel_folder, cancel_event=None):
+    
+    if Config.USE_GPU_SERVER : 
+        from sharp_pipeline import reconstruct
+
+        enqueued_at = sharp_tasks.get(task_id, {}).get('enqueued_at')
+        if enqueued_at:
+            now = time.time()
+            STAGE_SECONDS.labels('queue_wait').observe(now - enqueued_at)
+            tracing.record_span(task_id, 'queue_wait', enqueued_at, now)
+
+        # image_path is the saved image file; sharp predict expects an input directory
+        image_dir = os.path.dirname(image_path)
+        # output directory should be the same image folder so generated ply sits alongside the image
+        out_dir = os.path.join(data_dir, username, rel_folder)
+
+        stage_status = {'training': TaskStatus.TRAINING, 'processing': TaskStatus.PROCESSING}
+        result = reconstruct(
+            image_dir, out_dir,
+            on_stage=lambda stage, message, progress: update_task_status(task_id, stage_status[stage], message, progress),
+            cancel_event=cancel_event,
+        )
+        finish_sharp_task(task_id, data_dir, username, rel_folder, result)
     
     else:
         
@@ -254,86 +442,89 @@ def _run_sharp_task(task_id, data_dir,image_path, username, rel_folder):
         
         viewer_link = f"{Config.CLOUD_SERVER}/viewer?model={encoded_filename}"
         update_task_status(task_id, TaskStatus.COMPLETED, "已完成", 100, viewer_link)
-        print(viewer_link)
+        logger.info(f"模拟重建完成: {viewer_link}")
   
 
 @sharp_bp.route('/sharp/status/<task_id>')
 @login_required
 def sharp_status(task_id):
-    task = sharp_tasks.get(task_id)
+    task = get_task(task_id)
     if not task:
         return json_response(code=405, msg='任务不存在')
     
     task_status = task.get('status')
-    if task_status in ['completed', 'failed']:
-        del sharp_tasks[task_id]  # 删除指定id的任务
+    keyframe_tasks = sharp_tasks.get(task_id, {}).get('keyframe_tasks')
+    if task_status in TaskStatus.FINISHED:
+        sharp_tasks.pop(task_id, None)  # 删除指定id的任务
+        if dispatcher is not None:
+            dispatcher.store.delete(task_id)
 
-    return json_response(code=0, msg='获取任务状态成功', data={'task': {
+    data = {'task': {
         'status': task.get('status'),
         'progress': task.get('progress', 0),
         'message': task.get('message', ''),
         'result': task.get('result')
-    }})
-
+    }}
+    if keyframe_tasks:
+        # 视频任务：每个关键帧一个重建任务（第一个即本任务）
+        data['task']['keyframeTasks'] = keyframe_tasks
+    if task_status == TaskStatus.QUEUED and dispatcher is None and sharp_queue is not None:
+        # 排队位置（按公平调度的当前顺序估算）
+        data['task']['queuePosition'] = sharp_queue.position(task_id)
+    return json_response(code=0, msg='获取任务状态成功', data=data)
 
 
-@sharp_bp.route('/sharp/<path:filename>')
+@sharp_bp.route('/sharp/cancel/<task_id>', methods=['POST'])
 @login_required
-def serve_model(filename):
-    
-    username = g.username
-    decoded_filename = urllib.parse.unquote(filename)
+def sharp_cancel(task_id):
+    """取消重建任务：排队中的任务直接移除，执行中的任务终止其整个进程组"""
+    task = get_task(task_id)
+    if not task:
+        return json_response(code=405, msg='任务不存在')
+    if task.get('username') != g.username:
+        return json_response(code=406, msg='无权操作该任务'), 403
+    if task.get('status') in TaskStatus.FINISHED:
+        return json_response(code=407, msg='任务已结束')
 
-    data_dir = current_app.config.get('DATA_DIR', 'data')
-    sm = StorageManager(data_dir)
-    models_dir = sm.ensure_user(username)
+    if dispatcher is not None and dispatcher.store.exists(task_id):
+        state = dispatcher.cancel(task_id)
+    else:
+        state = get_sharp_queue().cancel(task_id)
 
-    try:
-        # 规范化路径，防止路径穿越攻击
-        user_file_path = sm.get_full_path(username, decoded_filename)
-        print(user_file_path)
-
-        # Ensure requested file is inside the user's models directory
-        if not user_file_path.startswith(models_dir + os.sep) and os.path.basename(user_file_path) != decoded_filename:
-            current_app.logger.warning(f"Attempt to access file outside user dir: {user_file_path}")
-            return json_response(code=302, msg='非法的文件路径', data={}), 400
-
-        if os.path.isfile(user_file_path):
-            # 返回文件内容（send_file 会处理 mime-type）
-            
-            # 1. 获取文件大小（字节数）
-            file_size = os.path.getsize(user_file_path)
-            current_app.logger.info(f"Serving model file: {user_file_path}, size: {file_size} bytes")
-            
-            # 2. 用make_response包装send_file，手动添加响应头
-            response = make_response(send_file(user_file_path))
-            
-            # 3. 添加Content-Length头（前端读取文件总大小的关键）
-            response.headers['Content-Length'] = str(file_size)
-            
-            # 4. 核心：允许前端跨域读取Content-Length头（必加，否则前端拿不到）
-            response.headers['Access-Control-Expose-Headers'] = 'Content-Length'
-            
-            # ========== 可选优化：添加文件下载相关头 ==========
-            # 可选：指定文件下载的MIME类型（send_file会自动识别，可补充）
-            response.headers['Content-Type'] = 'application/octet-stream'
-            # 可选：强制浏览器下载（如果需要），注释掉则浏览器会尝试预览
-            # response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(user_file_path)}"'
-            
-            return response
-            
-            
-            #return send_file(user_file_path)
-        
-        else:
-            return json_response(code=303, msg='模型文件不存在', data={}), 404
-    except Exception as e:
-        import traceback
-        tb = traceback.format_exc()
-        current_app.logger.error('Error serving model file: %s', tb)
-        if current_app.debug:
-            return json_response(code=304, msg='服务器内部错误', data={'error': str(e), 'trace': tb}), 500
-        else:
-            return json_response(code=305, msg='服务器内部错误', data={}), 500
-            
-            
+    if state == 'queued':
+        data_dir = current_app.config.get('DATA_DIR', 'data')
+        finish_sharp_task(task_id, data_dir, task['username'], task['rel_folder'], {'success': False, 'cancelled': True})
+    elif state == 'running':
+        update_task_status(task_id, task.get('status'), "正在取消...", task.get('progress', 0))
+    else:
+        return json_response(code=407, msg='任务已结束')
+
+    return json_response(code=0, msg='已取消' if state == 'queued' else '正在取消', data={'taskId': task_id})
+
+
+@sharp_bp.route('/sharp/trace/<task_id>')
+@login_required
+def sharp_trace(task_id):
+    """任务时间线：各阶段 span（上传、排队、conda 激活、推理、转换、注册等）"""
+    spans = tracing.read_trace(task_id)
+    if not spans:
+        return json_response(code=408, msg='trace不存在'), 404
+
+    # 归属以任务记录为准；任务结束后记录已删除，改用 span 上记录的用户。无法确定归属时按不存在处理
+    task = get_task(task_id)
+    if task is not None and task.get('username'):
+        owners = {task['username']}
+    else:
+        owners = {s.get('user') or s.get('attrs', {}).get('username') for s in spans} - {None}
+    if len(owners) != 1:
+        return json_response(code=408, msg='trace不存在'), 404
+    if owners.pop() != g.username:
+        return json_response(code=406, msg='无权操作该任务'), 403
+
+    start = spans[0]['start']
+    end = max(s['end'] for s in spans)
+    return json_response(code=0, msg='获取任务trace成功', data={
+        'taskId': task_id,
+        'duration': round(end - start, 3),
+        'spans': [dict(s, offset=round(s['start'] - start, 3)) for s in spans],
+    })
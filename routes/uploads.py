@@ -0,0 +1,180 @@
+from flask import Blueprint, request, current_app, g
+import os
+import sys
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from . import login_required
+from config import Config
+from utils.storage import StorageManager
+from utils.uploads import OffsetMismatch, UploadCollector, UploadStore
+from error_code.JsonError import json_response
+
+# 断点续传上传（tus 风格，协议见 utils.uploads）：与 sharp_bp 部署在同一角色（inference / dispatch）
+uploads_bp = Blueprint('uploads', __name__)
+
+upload_store = None
+upload_collector = None
+
+
+def init_uploads(app):
+    """创建上传会话存储，并启动过期会话清理线程（多个 worker 进程间由文件锁保证只有一个在执行）"""
+    global upload_store, upload_collector
+    upload_store = UploadStore(Config.UPLOAD_DIR, Config.UPLOAD_VIDEO_CHUNK_SIZE)
+    if Config.UPLOAD_SESSION_TTL:
+        upload_collector = UploadCollector(upload_store, Config.UPLOAD_SESSION_TTL, Config.UPLOAD_GC_INTERVAL)
+        upload_collector.start()
+    return upload_store
+
+
+def _upload_kind(filename):
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if ext in Config.ALLOWED_IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in Config.ALLOWED_VIDEO_EXTENSIONS:
+        return 'video'
+    return None
+
+
+def _session_response(info, msg, **data):
+    """会话状态同时放在响应体和 tus 的 Upload-Offset / Upload-Length 头中"""
+    response = json_response(code=0, msg=msg, data=dict({
+        'uploadId': info['uploadId'], 'offset': info['offset'], 'size': info['size'],
+        'chunkSize': Config.UPLOAD_MAX_CHUNK_SIZE}, **data))
+    response.headers['Upload-Offset'] = str(info['offset'])
+    response.headers['Upload-Length'] = str(info['size'])
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['Access-Control-Expose-Headers'] = 'Upload-Offset, Upload-Length'
+    return response
+
+
+@uploads_bp.route('/sharp/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    """创建上传会话。接受 JSON 或表单：{ filename 或 originalName, size, lane }"""
+    username = g.username
+
+    data = request.get_json(silent=True) or request.form
+    filename = os.path.basename(str(data.get('originalName') or data.get('filename') or ''))
+    try:
+        size = int(data.get('size') or request.headers.get('Upload-Length'))
+    except (TypeError, ValueError):
+        size = 0
+    if not filename or filename.startswith('.') or size <= 0:
+        return json_response(code=410, msg='参数缺失'), 400
+
+    kind = _upload_kind(filename)
+    if kind is None:
+        return json_response(code=403, msg='不支持的文件类型'), 400
+    limit = Config.MAX_VIDEO_CONTENT_LENGTH if kind == 'video' else Config.MAX_IMAGE__CONTENT_LENGTH
+    if size > limit:
+        return json_response(code=411, msg=f"文件过大，最大 {limit // 1024 // 1024} MB"), 413
+
+    open_sessions = upload_store.sessions(username)
+    if len(open_sessions) >= Config.UPLOAD_MAX_SESSIONS:
+        return json_response(code=412, msg='进行中的上传过多，请稍后重试'), 429
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    # 进行中的会话按声明的总大小预占配额，否则多个会话合计可以远超配额
+    if not StorageManager(data_dir).usage.check_quota(username, size + upload_store.reserved_bytes(username),
+                                                      incoming_files=len(open_sessions) + 1):
+        return json_response(code=409, msg='存储空间已满，请删除部分模型后重试'), 507
+
+    try:
+        info = upload_store.create(username, filename, size, kind=kind, lane=data.get('lane'))
+    except OSError:
+        current_app.logger.exception('创建上传会话失败')
+        return json_response(code=417, msg='服务器内部错误'), 500
+    return _session_response(info, '上传会话已创建', expiresIn=Config.UPLOAD_SESSION_TTL), 201
+
+
+@uploads_bp.route('/sharp/uploads/<upload_id>', methods=['GET', 'HEAD'])
+@login_required
+def upload_status(upload_id):
+    """查询已收到的字节数（断线重连后从该偏移量继续上传）"""
+    try:
+        info = upload_store.info(g.username, upload_id)
+    except FileNotFoundError:
+        return json_response(code=413, msg='上传会话不存在或已过期'), 404
+    return _session_response(info, '获取上传进度成功')
+
+
+@uploads_bp.route('/sharp/uploads/<upload_id>', methods=['PATCH', 'PUT'])
+@login_required
+def append_upload(upload_id):
+    """追加一个分片：请求头 Upload-Offset 为分片起始位置，请求体为原始字节"""
+    username = g.username
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return json_response(code=410, msg='缺少 Upload-Offset 请求头'), 400
+    length = request.content_length
+    if length is not None and length > Config.UPLOAD_MAX_CHUNK_SIZE:
+        return json_response(code=415, msg=f"分片过大，最大 {Config.UPLOAD_MAX_CHUNK_SIZE} 字节"), 413
+
+    try:
+        upload_store.append(username, upload_id, offset, request.stream, length)
+        info = upload_store.info(username, upload_id)
+    except FileNotFoundError:
+        return json_response(code=413, msg='上传会话不存在或已过期'), 404
+    except OffsetMismatch as e:
+        response = json_response(code=414, msg=str(e), data={'offset': e.offset})
+        response.headers['Upload-Offset'] = str(e.offset)
+        response.headers['Access-Control-Expose-Headers'] = 'Upload-Offset, Upload-Length'
+        return response, 409
+    except ValueError as e:
+        return json_response(code=415, msg=str(e)), 400
+    except OSError:
+        current_app.logger.exception('写入上传分片失败')
+        return json_response(code=417, msg='服务器内部错误'), 500
+    return _session_response(info, '分片上传成功')
+
+
+@uploads_bp.route('/sharp/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    """全部分片收到后：文件移入新的文件夹，图片进入重建队列，视频先提取关键帧"""
+    from routes.sharp import submit_image_task, submit_video_task
+
+    username = g.username
+    data_dir = current_app.config.get('DATA_DIR', 'data')
+    sm = StorageManager(data_dir)
+    try:
+        info = upload_store.info(username, upload_id)
+        if not sm.usage.check_quota(username, info['size']):
+            # 会话保留，清理空间后可重新提交
+            return json_response(code=409, msg='存储空间已满，请删除部分模型后重试'), 507
+        info, data_path = upload_store.finish(username, upload_id)
+    except FileNotFoundError:
+        return json_response(code=413, msg='上传会话不存在或已过期'), 404
+    except ValueError as e:
+        return json_response(code=416, msg=str(e), data={'offset': info['offset'], 'size': info['size']}), 409
+
+    try:
+        rel_folder, _filename, save_path = sm.save_upload(username, data_path, info['filename'])
+    except OSError:
+        current_app.logger.exception('保存上传文件失败')
+        upload_store.release(username, upload_id)
+        return json_response(code=417, msg='服务器内部错误'), 500
+    upload_store.remove(username, upload_id)
+
+    task_id = str(uuid.uuid4())
+    if info.get('kind') == 'video':
+        # 视频先提取关键帧，最佳画面沿用该任务 id 进入重建
+        submit_video_task(task_id, data_dir, username, rel_folder, save_path, info.get('lane'))
+    else:
+        submit_image_task(task_id, data_dir, username, rel_folder, save_path, info.get('lane'))
+    return json_response(code=0, msg='上传成功', data={'taskId': task_id, 'result': None})
+
+
+@uploads_bp.route('/sharp/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    """放弃上传，立即删除已收到的数据"""
+    try:
+        upload_store.info(g.username, upload_id)
+    except FileNotFoundError:
+        return json_response(code=413, msg='上传会话不存在或已过期'), 404
+    upload_store.remove(g.username, upload_id)
+    return json_response(code=0, msg='上传已取消')
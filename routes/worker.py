@@ -0,0 +1,83 @@
+from flask import Blueprint, request
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from . import worker_token_required
+from config import Config
+from error_code.JsonError import json_response
+
+logger = logging.getLogger(__name__)
+
+# GPU 服务器一侧的任务接收接口（worker 角色），协议见 utils/dispatcher.py
+worker_bp = Blueprint('worker', __name__)
+
+# 本进程的 GpuWorker，由 init_worker 创建
+gpu_worker = None
+
+
+def _worker_id():
+    return Config.WORKER_ID or f"{socket.gethostname()}:{Config.PORT}"
+
+
+def _heartbeat_loop():
+    import requests
+
+    url = f"{Config.DISPATCHER_URL.rstrip('/')}/dispatch/workers/heartbeat"
+    while True:
+        try:
+            requests.post(url, timeout=10, headers={'X-Worker-Token': Config.WORKER_TOKEN}, json={
+                'worker_id': gpu_worker.worker_id,
+                'url': Config.WORKER_PUBLIC_URL,
+                'load': gpu_worker.load,
+                'capacity': gpu_worker.capacity,
+            })
+        except requests.RequestException as e:
+            logger.warning(f"向业务服务器发送心跳失败: {e}")
+        time.sleep(Config.WORKER_HEARTBEAT_INTERVAL)
+
+
+def init_worker(app):
+    """worker 角色：创建 GpuWorker 并开始向业务服务器发送心跳"""
+    global gpu_worker
+    from utils.dispatcher import GpuWorker, HttpTransport
+
+    gpu_worker = GpuWorker(HttpTransport(Config.WORKER_TOKEN), Config.WORKER_SCRATCH_DIR,
+                           capacity=Config.WORKER_CAPACITY, worker_id=_worker_id())
+    threading.Thread(target=_heartbeat_loop, daemon=True).start()
+    return gpu_worker
+
+
+@worker_bp.route('/worker/jobs', methods=['POST'])
+@worker_token_required
+def accept_job():
+    """接收业务服务器推送的任务描述"""
+    descriptor = request.get_json(silent=True) or {}
+    required = ('job_id', 'rel_folder', 'image_name', 'input_url', 'status_url', 'result_url')
+    if any(not descriptor.get(k) for k in required):
+        return json_response(code=611, msg='任务描述不完整', data={}), 400
+
+    if not gpu_worker.submit(descriptor):
+        return json_response(code=612, msg='worker 已满载', data=gpu_worker.status()), 503
+    return json_response(code=0, msg='已接收', data=gpu_worker.status()), 202
+
+
+@worker_bp.route('/worker/jobs/<job_id>/cancel', methods=['POST'])
+@worker_token_required
+def cancel_job(job_id):
+    """取消正在执行的任务，结果仍通过 result 接口回传（cancelled=True）"""
+    if not gpu_worker.cancel(job_id):
+        return json_response(code=613, msg='任务不存在', data={}), 404
+    return json_response(code=0, msg='正在取消', data={})
+
+
+@worker_bp.route('/worker/status')
+@worker_token_required
+def worker_status():
+    """当前负载"""
+    return json_response(code=0, msg='ok', data=dict(gpu_worker.status(), worker_id=gpu_worker.worker_id))
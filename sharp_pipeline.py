@@ -0,0 +1,204 @@
+"""Sharp 重建流水线：sharp predict -> 查找输出模型 -> convert（Scheme-B）-> 按文件夹名重命名
+
+本地任务（routes/sharp.py）和远程 GPU worker（routes/worker.py）共用这一份实现，
+调用方只负责任务状态和模型注册。
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from utils import tracing
+from utils.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# sharp predict 可能产出的模型文件
+MODEL_EXTENSIONS = ('.ply', '.splat')
+# 转换时写在模型旁边的分块索引（convert.TILES_SUFFIX）
+TILES_SUFFIX = '.tiles.json'
+
+# 任务进度区间：重建阶段按 sharp 输出的进度线性映射，之后为转换阶段
+TRAIN_PROGRESS_START = 20
+TRAIN_PROGRESS_END = 80
+
+
+@contextmanager
+def timed_stage(name, **attrs):
+    """流水线阶段：同时记录耗时直方图和当前任务的 trace span"""
+    with STAGE_SECONDS.time(name), tracing.span(name, **attrs) as span_attrs:
+        yield span_attrs
+
+
+def find_result_file(out_dir):
+    """返回输出目录中第一个模型文件名，没有则返回 None"""
+    try:
+        for fname in os.listdir(out_dir):
+            if fname.lower().endswith(MODEL_EXTENSIONS):
+                return fname
+    except OSError:
+        return None
+    return None
+
+
+def publish_name(out_dir, converted_full, ext):
+    """将转换后的文件重命名为与输出文件夹同名（保留扩展名），目标已存在时追加时间戳"""
+    folder_name = os.path.basename(str(out_dir).rstrip(os.sep))
+    new_name = f"{folder_name}{ext}"
+    new_full = os.path.join(out_dir, new_name)
+
+    if os.path.abspath(converted_full) == os.path.abspath(new_full):
+        return converted_full
+    if os.path.exists(new_full):
+        ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+        new_full = os.path.join(out_dir, f"{folder_name}_{ts}{ext}")
+    os.replace(converted_full, new_full)
+    # 分块索引随模型改名
+    old_tiles = os.path.splitext(converted_full)[0] + TILES_SUFFIX
+    if os.path.exists(old_tiles):
+        os.replace(old_tiles, os.path.splitext(new_full)[0] + TILES_SUFFIX)
+    return new_full
+
+
+def _prune_options(config):
+    """Config.PRUNE_* -> convert.PruneOptions（未启用时为 None）"""
+    if not config.PRUNE_ENABLED:
+        return None
+    from convert import PruneOptions
+    return PruneOptions(min_opacity=config.PRUNE_MIN_OPACITY, min_scale=config.PRUNE_MIN_SCALE,
+                        max_scale=config.PRUNE_MAX_SCALE, outlier_k=config.PRUNE_OUTLIER_K,
+                        outlier_std=config.PRUNE_OUTLIER_STD, outlier_method=config.PRUNE_OUTLIER_METHOD)
+
+
+def remove_partial_outputs(out_dir):
+    """删除被中断的重建留下的模型文件（保留输入图片）"""
+    try:
+        names = os.listdir(out_dir)
+    except OSError:
+        return
+    for fname in names:
+        if fname.lower().endswith(MODEL_EXTENSIONS + (TILES_SUFFIX,)):
+            try:
+                os.remove(os.path.join(out_dir, fname))
+            except OSError:
+                logger.exception('删除中断的输出文件失败')
+
+
+def reconstruct(image_dir, out_dir, trainer=None, on_stage=None, cancel_event=None):
+    """对 image_dir 中的图片执行重建，模型写入 out_dir
+
+    Args:
+        image_dir: sharp predict 的输入目录
+        out_dir: 输出目录（通常即图片所在文件夹）
+        trainer: ImageModelTrainer 实例，默认新建
+        on_stage: 可选回调 on_stage(stage, message, progress)，stage 为 'training' / 'processing'
+        cancel_event: 可选 threading.Event，置位后终止重建（sharp predict 超时同样会终止）
+
+    Returns:
+        dict:
+          success     重建是否成功
+          message     结果说明
+          log         训练日志尾部
+          model_file  最终模型文件的绝对路径（转换失败时为原始输出；未找到模型时为 None）
+          converted   是否已转换为 Scheme-B
+          metadata    转换时统计的模型信息（顶点数、文件大小、包围盒等，见 convert.model_metadata；
+                      启用裁剪时含 pruned 各规则删除数），仅转换成功时存在
+          cancelled / timed_out  被取消 / 超时（此时 success 为 False）
+    """
+    # 重依赖（NumPy 等）在首次执行任务时才导入，缩短 worker 启动时间
+    from trainer_image import ImageModelTrainer
+    from convert import convert as ply_convert
+    from config import Config
+
+    def stage(name, message, progress):
+        if on_stage is not None:
+            on_stage(name, message, progress)
+
+    trainer = trainer or ImageModelTrainer()
+    os.makedirs(out_dir, exist_ok=True)
+
+    # 重建阶段进度映射到 20% ~ 80%，仅在整数百分比变化时上报
+    reported = {'progress': None}
+
+    def on_progress(fraction, _line):
+        progress = TRAIN_PROGRESS_START + int(fraction * (TRAIN_PROGRESS_END - TRAIN_PROGRESS_START))
+        if progress != reported['progress']:
+            reported['progress'] = progress
+            stage('training', f"正在重建... {int(fraction * 100)}%", progress)
+
+    stage('training', "正在重建...", TRAIN_PROGRESS_START)
+    with timed_stage('predict', input_dir=str(image_dir)):
+        training_result = trainer.train(image_dir, out_dir, progress_callback=on_progress, cancel_event=cancel_event)
+    if not training_result.get('success'):
+        if training_result.get('cancelled') or training_result.get('timed_out'):
+            remove_partial_outputs(out_dir)
+        return {
+            'success': False,
+            'message': training_result.get('message'),
+            'log': training_result.get('log', []),
+            'model_file': None,
+            'converted': False,
+            'cancelled': bool(training_result.get('cancelled')),
+            'timed_out': bool(training_result.get('timed_out')),
+        }
+
+    if cancel_event is not None and cancel_event.is_set():
+        # 重建刚好完成时收到取消：不再转换
+        remove_partial_outputs(out_dir)
+        return {'success': False, 'message': '重建已取消', 'log': training_result.get('log', []),
+                'model_file': None, 'converted': False, 'cancelled': True, 'timed_out': False}
+
+    stage('processing', "正在处理数据...", 90)
+    out_dir = training_result.get('output_dir')
+    result = {
+        'success': True,
+        'message': '已完成',
+        'log': training_result.get('log', []),
+        'model_file': None,
+        'converted': False,
+    }
+
+    result_file = find_result_file(out_dir)
+    if not result_file:
+        result['message'] = "完成（未找到明确的模型文件，输出在目录）"
+        return result
+
+    teaser_full = os.path.join(out_dir, result_file)
+    base, ext = os.path.splitext(result_file)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    converted_full = os.path.join(out_dir, f"{base}_{timestamp}{ext}")
+
+    try:
+        logger.info(f"input file : {teaser_full}")
+        logger.info(f"output file: {converted_full}")
+        with timed_stage('convert', source=os.path.basename(teaser_full)) as span_attrs:
+            metadata = ply_convert(Path(teaser_full), Path(converted_full), tile_size=Config.TILE_TARGET_GAUSSIANS,
+                                   prune=_prune_options(Config))
+            span_attrs['bytes'] = metadata.get('file_size')
+            if 'pruned' in metadata:
+                span_attrs['pruned'] = sum(metadata['pruned'].values())
+                logger.info(f"裁剪高斯: {metadata['pruned']}，保留 {metadata.get('vertex_count')}")
+    except Exception as e:
+        # 转换失败：保留原始输出，仍视为完成
+        logger.exception('PLY 转换失败')
+        result['message'] = f"完成（转换失败: {e}"
+        result['model_file'] = teaser_full
+        return result
+
+    # remove intermediate teaser file
+    try:
+        os.remove(teaser_full)
+    except OSError:
+        logger.exception('删除中间文件失败')
+
+    try:
+        converted_full = publish_name(out_dir, converted_full, ext)
+    except OSError:
+        logger.exception('重命名转换文件失败')
+
+    result['model_file'] = converted_full
+    result['converted'] = True
+    result['metadata'] = metadata
+    return result
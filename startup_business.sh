@@ -41,6 +41,7 @@ HOST="0.0.0.0"                                 # 外部可访问
 PORT="8090"                                   # 服务端口
 WORKERS="4"                                    # 工作进程数
 TIMEOUT="100"                                  # 超时时间
+APP_ROLES="auth,viewer,storage"                # 应用角色（业务服务器：登录、查看器、只读存储副本）
 
 
 
@@ -128,8 +129,8 @@ start_service() {
     }
 
     # 启动Gunicorn（后台运行+标签）
-    log_print "启动服务... 监听 ${HOST}:${PORT}，Gunicorn路径：${GUNICORN_PATH}"
-    ${GUNICORN_PATH} \
+    log_print "启动服务... 监听 ${HOST}:${PORT}，角色：${APP_ROLES}，Gunicorn路径：${GUNICORN_PATH}"
+    QS_APP_ROLES="${APP_ROLES}" ${GUNICORN_PATH} \
         --workers ${WORKERS} \
         --bind ${HOST}:${PORT} \
         --timeout ${TIMEOUT} \
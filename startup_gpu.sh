@@ -39,6 +39,7 @@ HOST="0.0.0.0"                                 # 外部可访问
 PORT="21000"                                   # 服务端口
 WORKERS="1"                                    # 工作进程数
 TIMEOUT="300"                                  # 超时时间
+APP_ROLES="inference,storage,manager"          # 应用角色（GPU 服务器：重建任务 + 主存储读写）
 
 
 
@@ -125,8 +126,8 @@ start_service() {
     }
 
     # 启动Gunicorn（后台运行+标签）
-    log_print "启动服务... 监听 ${HOST}:${PORT}，Gunicorn路径：${GUNICORN_PATH}"
-    ${GUNICORN_PATH} \
+    log_print "启动服务... 监听 ${HOST}:${PORT}，角色：${APP_ROLES}，Gunicorn路径：${GUNICORN_PATH}"
+    QS_APP_ROLES="${APP_ROLES}" ${GUNICORN_PATH} \
         --workers ${WORKERS} \
         --bind ${HOST}:${PORT} \
         --timeout ${TIMEOUT} \
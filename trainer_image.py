@@ -2,14 +2,52 @@ import subprocess
 import sys
 import json
 from pathlib import Path
+import codecs
 import logging
+import re
+import selectors
+import signal
 import time
 import os
+from collections import deque
 
 # 导入你的Config配置（确保Config里包含修正后的conda和环境配置）
 from config import Config
+from utils import tracing
+from utils.logs import SampledLogger
+from utils.metrics import ACTIVE_SUBPROCESSES
 
 logger = logging.getLogger(__name__)
+# sharp 子进程输出单独一个 logger，可单独调整级别
+output_logger = logging.getLogger(f'{__name__}.output')
+
+# 子进程输出轮询间隔（秒）
+_POLL_INTERVAL = 0.5
+
+# conda 环境激活完成后由 shell 输出的标记行，用于拆分 conda 激活与 sharp 推理的耗时
+_CONDA_READY_MARKER = '__qs_trace__ conda_ready'
+
+_LINE_SPLIT = re.compile(r'\r\n|\r|\n')
+# tqdm / 百分比进度，如 " 45%|████▌ | 9/20"、"progress: 45.5%"
+_PERCENT_RE = re.compile(r'(\d{1,3}(?:\.\d+)?)\s*%')
+# 计数进度，如 "9/20 [00:03<00:04"、"step 9/20"
+_COUNT_RE = re.compile(r'(?<![\d/.])(\d+)\s*/\s*(\d+)(?![\d/.])')
+
+
+def parse_progress(line):
+    """从 sharp 输出的一行中解析进度，返回 0~1 的小数，无法解析返回 None"""
+    m = _PERCENT_RE.search(line)
+    if m:
+        value = float(m.group(1))
+        if 0 <= value <= 100:
+            return round(value / 100.0, 4)
+    m = _COUNT_RE.search(line)
+    if m:
+        done, total = int(m.group(1)), int(m.group(2))
+        if 0 < total and done <= total:
+            return round(done / total, 4)
+    return None
+
 
 class ImageModelTrainer:
     """高斯溅射模型训练器（适配conda虚拟环境+环境变量）"""
@@ -22,6 +60,9 @@ class ImageModelTrainer:
 
     def _build_conda_command(self, cmd_list):
         """构建带conda激活+环境变量的完整命令"""
+        if not Config.SHARP_USE_CONDA:
+            # 不激活 conda（如压测时使用 bench/stub_sharp.py），直接执行命令
+            return " ".join(cmd_list)
         # 1. 拼接环境变量export命令
         #env_commands = [f"export {k}='{v}'" for k, v in self.gs_exports.items()]
         # 2. Conda激活命令（系统级conda）
@@ -30,11 +71,114 @@ class ImageModelTrainer:
         cd_cmd = f"cd {self.gs_repo_path}"
         # 4. 拼接最终命令（用&&保证前一步成功才执行后一步）
         #full_cmd = " && ".join(env_commands + [activate_cmd, cd_cmd] + [" ".join(cmd_list)])
-        full_cmd = " && ".join([activate_cmd, cd_cmd] + [" ".join(cmd_list)])
+        full_cmd = " && ".join([activate_cmd, f"echo '{_CONDA_READY_MARKER}'", cd_cmd] + [" ".join(cmd_list)])
         return full_cmd
 
-    def train(self, input_dir, output_dir):
-        """训练高斯溅射模型（适配conda环境+环境变量）"""
+    def _stream_output(self, process, training_log, progress_callback=None, deadline=None, cancel_event=None,
+                       marks=None):
+        """非阻塞读取子进程输出，直到管道关闭且进程退出
+
+        返回 None 表示正常读完；超过 deadline（time.monotonic）返回 'timeout'，
+        cancel_event 被置位返回 'cancelled'，此时子进程仍在运行，由调用方终止。
+        marks: 可选 dict，读到 conda 就绪标记时写入 marks['conda_ready'] = time.time()
+
+        - 按 \\n / \\r 切行（tqdm 进度条用 \\r 刷新），每行进入有界的 training_log
+        - 日志按 TRAIN_LOG_RATE_LINES / TRAIN_LOG_RATE_WINDOW 限速转发，超出部分按 TRAIN_LOG_SAMPLE_EVERY 抽样
+        - 能解析出进度的行回调 progress_callback(fraction, line)，fraction 取值 0~1
+        """
+        fd = process.stdout.fileno()
+        os.set_blocking(fd, False)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        limiter = SampledLogger(output_logger, Config.TRAIN_LOG_RATE_LINES, Config.TRAIN_LOG_RATE_WINDOW,
+                                Config.TRAIN_LOG_SAMPLE_EVERY)
+        last_progress = None
+        pending = ''
+        stop_reason = None
+
+        def handle_line(line):
+            nonlocal last_progress
+            line = line.strip()
+            if not line:
+                return
+            if line == _CONDA_READY_MARKER:
+                if marks is not None:
+                    marks['conda_ready'] = time.time()
+                return
+            training_log.append(line)
+            fraction = parse_progress(line)
+            if fraction is not None:
+                # 进度行只在进度变化时回调，不写入日志文件
+                if fraction != last_progress and progress_callback is not None:
+                    progress_callback(fraction, line)
+                last_progress = fraction
+                return
+            limiter.log(f"重建日志: {line}")
+
+        with selectors.DefaultSelector() as sel:
+            sel.register(fd, selectors.EVENT_READ)
+            eof = False
+            while not eof:
+                if cancel_event is not None and cancel_event.is_set():
+                    stop_reason = 'cancelled'
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    stop_reason = 'timeout'
+                    break
+                if not sel.select(timeout=_POLL_INTERVAL):
+                    if process.poll() is not None:
+                        # 进程已退出但管道仍被孙进程持有：不再等待
+                        break
+                    continue
+                try:
+                    chunk = os.read(fd, 65536)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    eof = True
+                text = pending + decoder.decode(chunk, final=eof)
+                lines = _LINE_SPLIT.split(text)
+                pending = lines.pop()
+                for line in lines:
+                    handle_line(line)
+        handle_line(pending)
+        limiter.flush()
+        return stop_reason
+
+    @staticmethod
+    def _kill_process_group(process, grace=None):
+        """终止子进程所在的整个进程组（bash -> conda -> sharp 及其子进程）
+
+        先发 SIGTERM，等待 grace 秒后对仍存活的进程发 SIGKILL。
+        进程以 start_new_session=True 启动，进程组号即子进程 pid。
+        """
+        grace = Config.SHARP_KILL_GRACE if grace is None else grace
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            # 进程组长退出后，残留的孙进程仍属于该进程组
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+    def train(self, input_dir, output_dir, progress_callback=None, timeout=None, cancel_event=None):
+        """训练高斯溅射模型（适配conda环境+环境变量）
+
+        Args:
+            progress_callback: 可选，callback(fraction, line)，从 sharp 输出中解析出进度时调用
+            timeout: 重建阶段的墙钟时间上限（秒），默认 Config.SHARP_PREDICT_TIMEOUT，None/0 表示不限
+            cancel_event: 可选 threading.Event，置位后终止重建进程组
+
+        超时或取消时返回的结果中 'timed_out' / 'cancelled' 为 True。
+        """
+        timeout = Config.SHARP_PREDICT_TIMEOUT if timeout is None else timeout
+        process = None
         try:
            
             # 校验输入路径
@@ -56,7 +200,7 @@ class ImageModelTrainer:
             # 构建基础训练命令（使用 sharp CLI）
             # 使用独立的词元避免在 shell 中出现解析问题
             base_train_cmd = [
-                "sharp", "predict",
+                Config.SHARP_COMMAND, "predict",
                 '-i', str(input_dir),
                 '-o', str(output_dir),
             ]
@@ -72,35 +216,56 @@ class ImageModelTrainer:
                 executable="/bin/bash",  # 核心新增：指定bash执行
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,  # 将stderr重定向到stdout，统一捕获
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                cwd=self.gs_repo_path,  # 工作目录设为高斯溅射项目根目录
-                env=os.environ.copy()  # 继承当前环境变量
+                bufsize=0,  # 原始字节流，由 _stream_output 非阻塞读取并解码
+                cwd=self.gs_repo_path if Config.SHARP_USE_CONDA else None,  # 工作目录设为高斯溅射项目根目录
+                env=os.environ.copy(),  # 继承当前环境变量
+                start_new_session=True  # 独立进程组，超时/取消时整组终止
             )
+            ACTIVE_SUBPROCESSES.inc()
             
-            # 实时监控训练输出
-            training_log = []
+            # 实时监控训练输出：只保留日志尾部，限速转发到日志文件，解析进度
+            training_log = deque(maxlen=Config.TRAIN_LOG_TAIL_LINES)
             start_time = time.time()
+            deadline = time.monotonic() + timeout if timeout else None
             logger.info(f"启动重建，输出目录: {output_dir}")
-            
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    output_strip = output.strip()
-                    training_log.append(output_strip)
-                    logger.info(f"重建日志 [{time.strftime('%H:%M:%S')}]: {output_strip}")
+            marks = {}
+            stop_reason = self._stream_output(process, training_log, progress_callback, deadline, cancel_event, marks)
+
+            if stop_reason is not None:
+                self._kill_process_group(process)
+                elapsed_time = time.time() - start_time
+                tracing.record_span(None, 'sharp_predict', marks.get('conda_ready', start_time), time.time(),
+                                    stop_reason, pid=process.pid)
+                if stop_reason == 'timeout':
+                    error_msg = f"重建超时（超过 {timeout} 秒），已终止"
+                else:
+                    error_msg = "重建已取消"
+                logger.warning(f"{error_msg}，耗时: {elapsed_time:.2f}秒")
+                return {
+                    'success': False,
+                    'timed_out': stop_reason == 'timeout',
+                    'cancelled': stop_reason == 'cancelled',
+                    'message': error_msg,
+                    'log': list(training_log)[-10:],
+                    'elapsed_time': round(elapsed_time, 2),
+                }
             
             # 等待进程结束并获取返回码
             return_code = process.wait()
-            elapsed_time = time.time() - start_time
+            end_time = time.time()
+            elapsed_time = end_time - start_time
+
+            # 子进程阶段耗时：conda 激活 / sharp predict（未输出标记时整段计为 sharp predict）
+            conda_ready = marks.get('conda_ready')
+            if conda_ready:
+                tracing.record_span(None, 'conda_activate', start_time, conda_ready, pid=process.pid)
+            tracing.record_span(None, 'sharp_predict', conda_ready or start_time, end_time,
+                                'ok' if return_code == 0 else 'error', pid=process.pid, returncode=return_code)
             logger.info(f"重建进程结束，返回码: {return_code}，耗时: {elapsed_time:.2f}秒")
             
             # 检查重建是否成功
             if return_code != 0:
-                error_msg = f"重建进程返回非0码: {return_code}，最后10行日志: {training_log[-10:]}"
+                error_msg = f"重建进程返回非0码: {return_code}，最后10行日志: {list(training_log)[-10:]}"
                 logger.error(error_msg)
                 raise Exception(error_msg)
             
@@ -109,7 +274,7 @@ class ImageModelTrainer:
             return {
                 'success': True,
                 'output_dir': str(output_dir.absolute()),
-                'log': training_log[-10:],  # 返回最后10行日志
+                'log': list(training_log)[-10:],  # 返回最后10行日志
                 'elapsed_time': round(elapsed_time, 2),
                 'message': '模型重建完成'
             }
@@ -120,5 +285,15 @@ class ImageModelTrainer:
             return {
                 'success': False,
                 'message': error_msg,
-                'log': training_log[-10:] if 'training_log' in locals() else []
-            }
\ No newline at end of file
+                'log': list(training_log)[-10:] if 'training_log' in locals() else []
+            }
+
+        finally:
+            if process is not None:
+                ACTIVE_SUBPROCESSES.dec()
+                # 清理进程组中残留的孙进程（如 sharp 派生的后台进程），关闭管道
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+                process.stdout.close()
\ No newline at end of file
@@ -0,0 +1,642 @@
+"""Business-tier -> GPU worker job dispatch.
+
+Protocol (all JSON over HTTP, authenticated with the shared `X-Worker-Token` header):
+
+  GPU worker                                     business tier (dispatch role)
+  ----------                                     -----------------------------
+  POST /dispatch/workers/heartbeat  ---------->  WorkerRegistry (id, url, load, capacity)
+                                    <----------  POST /worker/jobs  {job descriptor}
+  GET  /dispatch/jobs/<id>/input    ---------->  uploaded image
+  POST /dispatch/jobs/<id>/status   ---------->  task progress
+  POST /dispatch/jobs/<id>/result   ---------->  model file (+ tiles.json) + result -> add_model
+
+The business tier owns storage and task state; a worker only needs the descriptor
+URLs, a scratch directory and the sharp toolchain.  `LoopbackWorker` runs the same
+worker code in-process (no HTTP) for tests and single-host setups.
+
+Jobs are persisted as JSON files under `Config.DISPATCH_DIR/jobs` and workers in
+`workers.json`, so every gunicorn worker of the business tier sees the same state.
+Jobs waiting for a free worker are only queued in the memory of the process that
+accepted them; `Dispatcher.recover` re-queues them when that process is gone, and
+re-queues dispatched jobs whose worker dropped out of the registry.  Each process
+holds an flock on `owners/<token>.lock` for its lifetime, so a job's owner is dead
+exactly when that lock can be taken (pid reuse does not matter).  A re-queued job
+gets a new attempt number, and status / results of an older attempt are ignored.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from utils import tracing
+from utils.jobqueue import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+WORKER_TOKEN_HEADER = 'X-Worker-Token'
+
+# 与 routes.sharp.TaskStatus.FINISHED 一致：已结束的任务不再恢复
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+def _write_json_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _file_lock(path):
+    with open(path, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class JobStore:
+    """One JSON file per job: DISPATCH_DIR/jobs/<job_id>.json"""
+
+    def __init__(self, root):
+        self.root = os.path.join(str(root), 'jobs')
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.root, f"{os.path.basename(job_id)}.json")
+
+    def exists(self, job_id):
+        return os.path.exists(self._path(job_id))
+
+    def ids(self):
+        return [name[:-len('.json')] for name in os.listdir(self.root) if name.endswith('.json')]
+
+    def create(self, job):
+        _write_json_atomic(self._path(job['job_id']), job)
+
+    def get(self, job_id):
+        try:
+            with open(self._path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def update(self, job_id, expect=None, **fields):
+        """Merge fields into the job; with expect={field: value} only if the job still matches (else None)"""
+        path = self._path(job_id)
+        with _file_lock(path + '.lock'):
+            job = self.get(job_id)
+            if job is None:
+                return None
+            if expect and any(job.get(k) != v for k, v in expect.items()):
+                return None
+            job.update(fields)
+            job['updated_at'] = time.time()
+            _write_json_atomic(path, job)
+        return job
+
+    def delete(self, job_id):
+        for path in (self._path(job_id), self._path(job_id) + '.lock'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class WorkerRegistry:
+    """Registered GPU workers and their last reported load (DISPATCH_DIR/workers.json)"""
+
+    def __init__(self, root, ttl):
+        self.path = os.path.join(str(root), 'workers.json')
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def heartbeat(self, worker_id, url, load, capacity):
+        with _file_lock(self.path + '.lock'):
+            workers = self._load()
+            workers[worker_id] = {
+                'url': url.rstrip('/'),
+                'load': int(load),
+                'capacity': max(1, int(capacity)),
+                'last_seen': time.time(),
+            }
+            _write_json_atomic(self.path, workers)
+
+    def bump(self, worker_id, delta=1):
+        """Optimistically account a dispatched job until the next heartbeat"""
+        with _file_lock(self.path + '.lock'):
+            workers = self._load()
+            if worker_id in workers:
+                workers[worker_id]['load'] += delta
+                _write_json_atomic(self.path, workers)
+
+    def alive(self):
+        now = time.time()
+        return {wid: w for wid, w in self._load().items() if now - w['last_seen'] <= self.ttl}
+
+
+class HttpWorkerClient:
+    """Business-tier handle for a remote GPU worker"""
+
+    def __init__(self, worker_id, url, token, load=0, capacity=1, registry=None):
+        self.worker_id = worker_id
+        self.url = url
+        self.token = token
+        self.load = load
+        self.capacity = capacity
+        self.registry = registry
+
+    def status(self):
+        return {'load': self.load, 'capacity': self.capacity}
+
+    def submit(self, descriptor):
+        import requests
+
+        res = requests.post(f"{self.url}/worker/jobs", json=descriptor,
+                            headers={WORKER_TOKEN_HEADER: self.token}, timeout=10)
+        if res.status_code != 202:
+            return False
+        if self.registry is not None:
+            self.registry.bump(self.worker_id)
+        return True
+
+    def cancel(self, job_id):
+        import requests
+
+        res = requests.post(f"{self.url}/worker/jobs/{job_id}/cancel",
+                            headers={WORKER_TOKEN_HEADER: self.token}, timeout=10)
+        return res.status_code == 200
+
+
+# ---------------------------------------------------------------- worker side
+
+
+class HttpTransport:
+    """Worker-side transport: pull inputs / push status and results over HTTP"""
+
+    def __init__(self, token):
+        self.headers = {WORKER_TOKEN_HEADER: token}
+
+    def fetch_input(self, descriptor, dest_path):
+        import requests
+
+        with requests.get(descriptor['input_url'], headers=self.headers, stream=True, timeout=60) as res:
+            res.raise_for_status()
+            with open(dest_path, 'wb') as f:
+                for chunk in res.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+
+    def push_status(self, descriptor, status, message, progress):
+        import requests
+
+        try:
+            requests.post(descriptor['status_url'], headers=self.headers, timeout=10,
+                          json={'status': status, 'message': message, 'progress': progress})
+        except requests.RequestException:
+            logger.warning(f"上报任务进度失败: {descriptor['job_id']}")
+
+    def push_result(self, descriptor, result, model_path, tiles_path=None):
+        import requests
+
+        payload = {'result': json.dumps(result, ensure_ascii=False)}
+        if model_path:
+            with ExitStack() as stack:
+                files = {'model': (os.path.basename(model_path), stack.enter_context(open(model_path, 'rb')))}
+                if tiles_path:
+                    files['tiles'] = (os.path.basename(tiles_path), stack.enter_context(open(tiles_path, 'rb')))
+                res = requests.post(descriptor['result_url'], headers=self.headers, timeout=600,
+                                    data=payload, files=files)
+        else:
+            res = requests.post(descriptor['result_url'], headers=self.headers, timeout=60, data=payload)
+        res.raise_for_status()
+
+
+class LoopbackTransport:
+    """Worker-side transport that talks to an in-process Dispatcher directly"""
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+
+    def fetch_input(self, descriptor, dest_path):
+        job = self.dispatcher.store.get(descriptor['job_id'])
+        shutil.copyfile(job['image_path'], dest_path)
+
+    def push_status(self, descriptor, status, message, progress):
+        self.dispatcher.report_status(descriptor['job_id'], status, message, progress, descriptor.get('attempt'))
+
+    def push_result(self, descriptor, result, model_path, tiles_path=None):
+        save = (lambda dest: shutil.copyfile(model_path, dest)) if model_path else None
+        save_tiles = (lambda dest: shutil.copyfile(tiles_path, dest)) if tiles_path else None
+        self.dispatcher.complete(descriptor['job_id'], result, os.path.basename(model_path or ''), save,
+                                 descriptor.get('attempt'), save_tiles=save_tiles)
+
+
+class GpuWorker:
+    """Runs dispatched jobs: pull input -> sharp_pipeline.reconstruct -> push result
+
+    Args:
+        transport: HttpTransport or LoopbackTransport
+        scratch_dir: local working directory, one sub-folder per job
+        capacity: max concurrent jobs
+        reconstruct_fn: defaults to sharp_pipeline.reconstruct (ImageModelTrainer + convert)
+    """
+
+    def __init__(self, transport, scratch_dir, capacity=1, reconstruct_fn=None, worker_id='loopback'):
+        self.transport = transport
+        self.scratch_dir = str(scratch_dir)
+        self.capacity = max(1, int(capacity))
+        self.reconstruct_fn = reconstruct_fn
+        self.worker_id = worker_id
+        self._active = 0
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+
+    @property
+    def load(self):
+        return self._active
+
+    def status(self):
+        return {'load': self._active, 'capacity': self.capacity}
+
+    def submit(self, descriptor):
+        """Accept a job if a slot is free; returns False when full"""
+        with self._lock:
+            if self._active >= self.capacity:
+                return False
+            self._active += 1
+            self._cancel_events[descriptor['job_id']] = threading.Event()
+        threading.Thread(target=self._run, args=(descriptor,), daemon=True).start()
+        return True
+
+    def cancel(self, job_id):
+        """Signal a running job to stop (kills its process group); False if unknown"""
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def _run(self, descriptor):
+        with tracing.bind_task(descriptor['job_id'], descriptor.get('username')):
+            self._run_bound(descriptor)
+
+    def _run_bound(self, descriptor):
+        job_dir = os.path.join(self.scratch_dir, os.path.basename(descriptor['job_id']))
+        # 与本地任务保持一致：图片和输出位于同名文件夹，转换后的模型以文件夹命名
+        work_dir = os.path.join(job_dir, os.path.basename(descriptor['rel_folder']))
+        try:
+            os.makedirs(work_dir, exist_ok=True)
+            with tracing.span('fetch_input', worker=self.worker_id):
+                self.transport.fetch_input(descriptor, os.path.join(work_dir, os.path.basename(descriptor['image_name'])))
+
+            reconstruct_fn = self.reconstruct_fn
+            if reconstruct_fn is None:
+                from sharp_pipeline import reconstruct as reconstruct_fn
+
+            result = reconstruct_fn(
+                work_dir, work_dir,
+                on_stage=lambda stage, message, progress: self.transport.push_status(descriptor, stage, message, progress),
+                cancel_event=self._cancel_events[descriptor['job_id']],
+            )
+        except Exception as e:
+            logger.exception(f"执行分派任务失败: {descriptor['job_id']}")
+            result = {'success': False, 'message': str(e), 'log': [], 'model_file': None, 'converted': False}
+
+        model_path = result.pop('model_file', None)
+        # 分块索引随模型一起回传，任务目录随后会被删除
+        from sharp_pipeline import TILES_SUFFIX
+        tiles_path = os.path.splitext(model_path)[0] + TILES_SUFFIX if model_path else None
+        if tiles_path and not os.path.isfile(tiles_path):
+            tiles_path = None
+        # worker 侧的 span 随结果回传，由业务服务器写入该任务的 trace
+        if not isinstance(self.transport, LoopbackTransport):
+            result['trace'] = tracing.read_trace(descriptor['job_id'])
+        try:
+            self.transport.push_result(descriptor, result, model_path, tiles_path)
+        except Exception:
+            logger.exception(f"回传任务结果失败: {descriptor['job_id']}")
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            with self._lock:
+                self._active -= 1
+                self._cancel_events.pop(descriptor['job_id'], None)
+
+
+class LoopbackWorker(GpuWorker):
+    """In-process GPU worker attached directly to a Dispatcher (tests / single host)"""
+
+    def __init__(self, dispatcher, scratch_dir, capacity=1, reconstruct_fn=None, worker_id='loopback'):
+        super().__init__(LoopbackTransport(dispatcher), scratch_dir, capacity, reconstruct_fn, worker_id)
+
+
+# ---------------------------------------------------------- business side
+
+
+class Dispatcher:
+    """Stores jobs, picks the least-loaded worker and applies results
+
+    Args:
+        data_dir: DATA_DIR (models are written into DATA_DIR/<user>/<rel_folder>)
+        dispatch_dir: shared state directory (jobs + worker registry)
+        public_url: base URL of this business tier as seen from GPU workers
+        token: shared worker token
+        on_status: callback(task_id, status, message, progress)
+        on_complete: callback(task_id, username, rel_folder, result)
+        heartbeat_ttl: a worker without heartbeat for this long is dropped; also the recover interval
+        scheduler: utils.jobqueue.FairScheduler ordering jobs that wait for a free worker (default FIFO)
+
+    Create it in the serving process (gunicorn runs without --preload): the owner
+    lock taken here marks this process's queued jobs as alive.
+    """
+
+    def __init__(self, data_dir, dispatch_dir, public_url, token, on_status, on_complete,
+                 heartbeat_ttl=30, retry_interval=5, scheduler=None):
+        self.data_dir = str(data_dir)
+        self.public_url = public_url.rstrip('/')
+        self.token = token
+        self.on_status = on_status
+        self.on_complete = on_complete
+        self.retry_interval = retry_interval
+        os.makedirs(str(dispatch_dir), exist_ok=True)
+        self.store = JobStore(dispatch_dir)
+        self.registry = WorkerRegistry(dispatch_dir, heartbeat_ttl)
+        self.local_workers = []
+        self._pending = scheduler if scheduler is not None else FairScheduler()
+        self._pending_lock = threading.Lock()
+        self._retry_thread = None
+        self._monitor_thread = None
+
+        # 本进程存活期间一直持有 owners/<owner>.lock
+        self.owners_dir = os.path.join(str(dispatch_dir), 'owners')
+        os.makedirs(self.owners_dir, exist_ok=True)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._owner_file = open(os.path.join(self.owners_dir, f"{self.owner}.lock"), 'a+')
+        fcntl.flock(self._owner_file, fcntl.LOCK_EX)
+
+    def add_worker(self, worker):
+        """Attach an in-process worker (e.g. LoopbackWorker)"""
+        self.local_workers.append(worker)
+
+    def workers(self):
+        workers = list(self.local_workers)
+        for wid, w in self.registry.alive().items():
+            workers.append(HttpWorkerClient(wid, w['url'], self.token, w['load'], w['capacity'], self.registry))
+        return workers
+
+    def _descriptor(self, job):
+        base = f"{self.public_url}/dispatch/jobs/{job['job_id']}"
+        attempt = job.get('attempt', 0)
+        return {
+            'job_id': job['job_id'],
+            'attempt': attempt,
+            'rel_folder': job['rel_folder'],
+            'username': job['username'],              # 仅用于 worker 日志关联
+            'image_name': os.path.basename(job['image_path']),
+            'input_url': f"{base}/input",
+            'status_url': f"{base}/status?attempt={attempt}",
+            'result_url': f"{base}/result?attempt={attempt}",
+        }
+
+    def submit(self, task_id, username, rel_folder, image_path, lane=None):
+        """Persist the job and push it to a worker (queued in fair order if none is free)"""
+        now = time.time()
+        self.store.create({
+            'job_id': task_id,
+            'username': username,
+            'rel_folder': rel_folder,
+            'image_path': str(image_path),
+            'status': 'uploaded',
+            'message': '等待分配 GPU...',
+            'progress': 10,
+            'result': None,
+            'worker_id': None,
+            'local': False,
+            'lane': lane,
+            'owner': self.owner,
+            'attempt': 0,
+            'created_at': now,
+            'updated_at': now,
+        })
+        with self._pending_lock:
+            waiting = len(self._pending)
+        # 已有任务在等待时直接排队，不越过它们
+        if waiting or not self._dispatch(task_id):
+            with self._pending_lock:
+                self._pending.push(task_id, username, lane)
+            self._ensure_retry_thread()
+
+    def queued_for(self, username):
+        """Jobs of username waiting for a free worker in this process"""
+        with self._pending_lock:
+            return self._pending.queued(username)
+
+    def _dispatch(self, job_id):
+        job = self.store.get(job_id)
+        if job is None or job.get('status') == 'cancelled':
+            return True  # job vanished or was cancelled while queued; nothing to do
+        descriptor = self._descriptor(job)
+
+        candidates = []
+        for w in self.workers():
+            st = w.status()
+            if st['load'] < st['capacity']:
+                candidates.append((st['load'] / st['capacity'], st['load'], w))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+
+        for _ratio, _load, worker in candidates:
+            try:
+                with tracing.span('dispatch', job_id, worker=worker.worker_id) as span_attrs:
+                    accepted = span_attrs['accepted'] = worker.submit(descriptor)
+                if accepted:
+                    self.store.update(job_id, worker_id=worker.worker_id, local=worker in self.local_workers)
+                    logger.info(f"任务 {job_id} 分派到 GPU worker {worker.worker_id}")
+                    return True
+            except Exception:
+                logger.exception(f"分派任务到 {worker.worker_id} 失败")
+        return False
+
+    def _ensure_retry_thread(self):
+        if self._retry_thread is not None and self._retry_thread.is_alive():
+            return
+        self._retry_thread = threading.Thread(target=self._retry_loop, daemon=True)
+        self._retry_thread.start()
+
+    def _retry_loop(self):
+        while True:
+            time.sleep(self.retry_interval)
+            # 按公平顺序分派，第一个分派不出去的任务之后的都继续等待
+            while True:
+                with self._pending_lock:
+                    head = self._pending.peek()
+                if head is None or not self._dispatch(head[0]):
+                    break
+                with self._pending_lock:
+                    if head[0] in self._pending:
+                        # 已交给 worker，不计入本进程的并发
+                        self._pending.done(self._pending.take(head[0]))
+            with self._pending_lock:
+                if not len(self._pending):
+                    self._retry_thread = None
+                    return
+
+    def _owner_alive(self, owner):
+        if owner == self.owner:
+            return True
+        if not owner:
+            return False
+        path = os.path.join(self.owners_dir, f"{os.path.basename(owner)}.lock")
+        try:
+            f = open(path, 'r+')
+        except FileNotFoundError:
+            return False
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            # 拿到锁说明持有者已退出，顺便清理
+            os.remove(path)
+            fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+    def recover(self):
+        """Re-queue jobs nobody will finish; returns the adopted job ids
+
+        A job is adopted when it is not finished and
+          - it never reached a worker and the process that queued it is gone, or
+          - its remote worker dropped out of the registry (no heartbeat for heartbeat_ttl), or
+          - its local (loopback) worker died with the process that owned it.
+        The compare-and-set on the job file makes sure only one process adopts it.
+        """
+        alive_workers = None
+        adopted = []
+        for job_id in self.store.ids():
+            job = self.store.get(job_id)
+            if job is None or job.get('status') in FINISHED_STATUSES:
+                continue
+            worker_id = job.get('worker_id')
+            if worker_id and not job.get('local'):
+                if alive_workers is None:
+                    alive_workers = self.registry.alive()
+                if worker_id in alive_workers:
+                    continue
+            elif self._owner_alive(job.get('owner')):
+                continue
+
+            attempt = job.get('attempt', 0)
+            message = 'GPU worker 已下线，重新等待分配 GPU...' if worker_id else '等待分配 GPU...'
+            if self.store.update(job_id, expect={'owner': job.get('owner'), 'worker_id': worker_id, 'attempt': attempt},
+                                 owner=self.owner, worker_id=None, local=False, attempt=attempt + 1,
+                                 status='uploaded', message=message, progress=10) is None:
+                continue  # 其他进程已接管或任务状态已变化
+            with self._pending_lock:
+                self._pending.push(job_id, job['username'], job.get('lane'))
+            adopted.append(job_id)
+
+        if adopted:
+            logger.warning(f"重新排队 {len(adopted)} 个无人处理的分派任务: {', '.join(adopted)}")
+            self._ensure_retry_thread()
+        return adopted
+
+    def start_monitor(self):
+        """Background thread running recover() every heartbeat_ttl seconds"""
+        if self._monitor_thread is not None and self._monitor_thread.is_alive():
+            return
+        self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._monitor_thread.start()
+
+    def _monitor_loop(self):
+        while True:
+            time.sleep(self.registry.ttl)
+            try:
+                self.recover()
+            except Exception:
+                logger.exception("恢复分派任务失败")
+
+    def _current(self, job, attempt):
+        """False when a worker reports for an attempt the job was since re-queued from"""
+        if attempt is None or int(attempt) == job.get('attempt', 0):
+            return True
+        logger.warning(f"忽略任务 {job['job_id']} 过期的上报（attempt {attempt}，当前 {job.get('attempt', 0)}）")
+        return False
+
+    def cancel(self, job_id):
+        """Returns 'queued' (never reached a worker), 'running' (worker signalled) or None"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if not job.get('worker_id'):
+            with self._pending_lock:
+                if job_id in self._pending:
+                    self._pending.remove(job_id)
+            # 其他进程中的重试线程据此跳过该任务
+            self.store.update(job_id, status='cancelled')
+            return 'queued'
+
+        for worker in self.workers():
+            if worker.worker_id == job['worker_id']:
+                try:
+                    return 'running' if worker.cancel(job_id) else None
+                except Exception:
+                    logger.exception(f"通知 {worker.worker_id} 取消任务失败")
+                    return None
+        return None
+
+    def report_status(self, job_id, status, message, progress, attempt=None):
+        job = self.store.get(job_id)
+        if job is not None and self._current(job, attempt):
+            self.on_status(job_id, status, message, progress)
+
+    def complete(self, job_id, result, model_name, save_model, attempt=None, save_tiles=None):
+        """Store the model returned by a worker and hand the result to on_complete
+
+        save_model(dest_path) writes the model file; None when the worker produced no model.
+        save_tiles(dest_path) writes its tiles.json sidecar; None when the worker sent none.
+        The model is named like a local task's (sharp_pipeline.publish_name), the sidecar follows it.
+        Returns False when the job is unknown or was re-queued since this attempt.
+        """
+        job = self.store.get(job_id)
+        if job is None or not self._current(job, attempt):
+            return False
+        result = dict(result)
+        tracing.write_spans(job_id, result.pop('trace', None))
+        result['model_file'] = None
+        if save_model is not None and model_name:
+            from werkzeug.utils import secure_filename
+            from sharp_pipeline import TILES_SUFFIX, publish_name
+
+            out_dir = os.path.join(self.data_dir, job['username'], job['rel_folder'])
+            os.makedirs(out_dir, exist_ok=True)
+            ext = os.path.splitext(secure_filename(model_name))[1]
+            # 先以临时名写入模型和分块索引，再按本地任务的规则改名发布（分块索引随模型改名）
+            part = os.path.join(out_dir, f".{os.path.basename(job_id)}.part{ext}")
+            part_tiles = os.path.splitext(part)[0] + TILES_SUFFIX
+            try:
+                save_model(part)
+                if save_tiles is not None:
+                    save_tiles(part_tiles)
+                result['model_file'] = publish_name(out_dir, part, ext)
+            except BaseException:
+                for leftover in (part, part_tiles):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                raise
+            if save_tiles is None and (result.get('metadata') or {}).get('tile_count'):
+                # 没有收到分块索引：不登记分块数，否则列表声称有分块而 /manager/tiles 返回 404
+                result['metadata'] = dict(result['metadata'], tile_count=None)
+        self.on_complete(job_id, job['username'], job['rel_folder'], result)
+        return True
@@ -0,0 +1,498 @@
+"""Incremental reconciliation between DATA_DIR and the per-user model indexes.
+
+For every user folder the checker compares what is on disk with models.xml and
+repairs the differences:
+
+    dangling          index entry whose PLY is gone (and has no cold copy)   -> entry removed
+    stale_tier        tier="cold" but the PLY is back in place (interrupted thaw) -> tier cleared
+    unregistered      model file not in the index (conversion fallback
+                      teasers, interrupted registration)                      -> quarantined
+    orphan_folder     folder without any indexed model (failed tasks)         -> quarantined
+    stray_sidecar     .preview.png / .tiles.json without their model          -> quarantined
+    stale_temp        leftovers of interrupted writes (.reconvert / .thaw / .tmp) -> removed
+    cold_orphan       cold-tier copy no index entry or trash manifest refers to -> quarantined
+    corrupt_index     models.xml that does not parse                          -> moved to quarantine and
+                                                                                 rebuilt from disk
+
+Folders modified within FSCK_GRACE_SECONDS are left alone (a task may still be
+writing them).  Quarantined files are moved, not deleted, to
+`DATA_DIR/.quarantine/<run_id>/<user>/<relpath>` with a `manifest.jsonl`
+recording the original location and the reason; runs older than
+FSCK_QUARANTINE_DAYS are purged.
+
+Checkpointing: `DATA_DIR/.fsck/<user>.json` keeps, for every folder found
+clean, its directory mtime and model file names, plus the index mtime/size.  A
+folder whose mtime is unchanged is not listed again; if the index did not
+change either it is skipped entirely.  The state is saved every
+_CHECKPOINT_EVERY folders, so an interrupted run resumes where it stopped and
+a routine run over millions of files only stats the top-level folders.
+
+    python -m utils.fsck --dry-run
+    python -m utils.fsck --user alice --full
+"""
+
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = '.fsck'
+QUARANTINE_DIR = '.quarantine'
+QUARANTINE_COLD = '.cold'  # 隔离区中冷存储副本的子目录（与用户文件夹区分）
+LOCK_NAME = '.fsck.lock'
+MODEL_EXTENSIONS = ('.ply', '.splat')
+SIDECAR_SUFFIXES = ('.preview.png', '.tiles.json')
+_TEMP_MARKERS = ('.reconvert', '.thaw')
+_CHECKPOINT_EVERY = 2000
+
+
+def _is_temp(name):
+    return name.endswith('.tmp') or (name.startswith('.') and any(m in name for m in _TEMP_MARKERS))
+
+
+def _is_model(name):
+    return not name.startswith('.') and name.lower().endswith(MODEL_EXTENSIONS)
+
+
+def _sidecar_base(name):
+    for suffix in SIDECAR_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return None
+
+
+def list_folder(path):
+    """One scandir of an image folder -> {'models': set, 'sidecars': {name: base}, 'temps': {name: mtime}}"""
+    listing = {'models': set(), 'sidecars': {}, 'temps': {}}
+    with os.scandir(path) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            name = entry.name
+            if _is_temp(name):
+                listing['temps'][name] = entry.stat().st_mtime
+            elif _is_model(name):
+                listing['models'].add(name)
+            elif _sidecar_base(name) is not None:
+                listing['sidecars'][name] = _sidecar_base(name)
+    return listing
+
+
+def is_scheme_b(path):
+    """True for PLYs written by convert.py (vertex-only Scheme-B layout)"""
+    from pathlib import Path
+    from convert import parse_ply_header, target_schema_scheme_b
+    try:
+        header = parse_ply_header(Path(path))
+    except (OSError, ValueError, UnicodeDecodeError):
+        return False
+    return header.vertex_properties == target_schema_scheme_b()
+
+
+class Fsck:
+    """Checks and repairs users under data_dir
+
+    Args:
+        data_dir: DATA_DIR
+        cold_dir: COLD_DIR (None = no cold tier)
+        grace: seconds a folder must be untouched before it is repaired
+        quarantine_days: days quarantined files are kept
+        dry_run: only report what would be done
+        full: ignore the checkpoint state and list every folder
+    """
+
+    def __init__(self, data_dir, cold_dir=None, grace=2 * 24 * 3600, quarantine_days=30, dry_run=False,
+                 full=False):
+        from utils.storage import StorageManager
+
+        self.data_dir = str(data_dir)
+        self.cold_dir = str(cold_dir) if cold_dir else None
+        self.grace = grace
+        self.quarantine_days = quarantine_days
+        self.dry_run = dry_run
+        self.full = full
+        self.sm = StorageManager(self.data_dir)
+        self.run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+        self.report = Counter()
+        self.actions = []
+
+    # -------------------------------------------------------------- helpers
+
+    def _act(self, kind, username, relpath, fn=None):
+        self.report[kind] += 1
+        self.actions.append({'action': kind, 'user': username, 'path': relpath})
+        if self.dry_run:
+            logger.info(f"[dry-run] {kind}: {username}/{relpath}")
+            return
+        logger.info(f"{kind}: {username}/{relpath}")
+        if fn is not None:
+            fn()
+
+    def _quarantine_root(self):
+        return os.path.join(self.data_dir, QUARANTINE_DIR, self.run_id)
+
+    def _quarantine(self, username, src, relpath, reason):
+        """Move src to the quarantine under username/relpath and record it in the run's manifest"""
+        dst = os.path.join(self._quarantine_root(), username, relpath)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.move(src, dst)
+        with open(os.path.join(self._quarantine_root(), 'manifest.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'user': username, 'path': relpath, 'source': src, 'reason': reason,
+                                'time': time.time()}, ensure_ascii=False) + '\n')
+
+    def _state_path(self, username):
+        return os.path.join(self.data_dir, STATE_DIR, f"{username}.json")
+
+    def _load_state(self, username):
+        if self.full:
+            return {'folders': {}}
+        try:
+            with open(self._state_path(username), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {'folders': {}}
+        state.setdefault('folders', {})
+        return state
+
+    def _save_state(self, username, state):
+        if self.dry_run:
+            return
+        path = self._state_path(username)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _index_signature(self, username):
+        try:
+            st = os.stat(self.sm.index_path(username))
+        except FileNotFoundError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def _cold_exists(self, username, relpath):
+        if not self.cold_dir:
+            return False
+        from utils.tiering import cold_path
+        try:
+            return os.path.isfile(cold_path(self.cold_dir, username, relpath))
+        except ValueError:
+            return False
+
+    def _old_enough(self, mtime):
+        return time.time() - mtime >= self.grace
+
+    # -------------------------------------------------------------- index
+
+    def _read_index(self, username):
+        """(entries, corrupt)"""
+        idx = self.sm.index_path(username)
+        if not os.path.exists(idx):
+            return [], False
+        try:
+            root = ET.parse(idx).getroot()
+        except ET.ParseError:
+            return [], True
+        return [self.sm._entry(m) for m in root.findall('model')], False
+
+    def _rebuild_index(self, username):
+        """Move a corrupt models.xml aside and re-register the converted models (and cold copies) found on disk"""
+        from config import Config
+
+        ud = self.sm.user_dir(username)
+        attribs = []
+        with os.scandir(ud) as it:
+            folders = [e for e in it if e.is_dir(follow_symlinks=False) and not e.name.startswith('.')]
+        for folder in folders:
+            for name in sorted(list_folder(folder.path)['models']):
+                path = os.path.join(folder.path, name)
+                if not is_scheme_b(path):
+                    continue  # 未转换的原始输出不登记，随后按 unregistered 隔离
+                attribs.append(self._adopt_attrs(username, f"{folder.name}/{name}", path, Config.CLOUD_SERVER))
+        attribs.extend(self._adopt_cold(username, Config.CLOUD_SERVER))
+        self.report['adopted'] += len(attribs)
+
+        def rebuild():
+            with self.sm.index_lock(username):
+                self._quarantine(username, self.sm.index_path(username), self.sm.INDEX_NAME, 'corrupt_index')
+                self.sm.ensure_user(username)
+                self.sm.restore_models(username, attribs)
+
+        self._act('corrupt_index', username, self.sm.INDEX_NAME, rebuild)
+
+    def _adopt_attrs(self, username, relpath, path, server):
+        from pathlib import Path
+        from convert import parse_ply_header, tiles_path
+
+        st = os.stat(path)
+        metadata = {'vertex_count': parse_ply_header(Path(path)).vertex_count, 'file_size': st.st_size}
+        try:
+            with open(tiles_path(path), encoding='utf-8') as f:
+                metadata['tile_count'] = len(json.load(f)['tiles'])
+        except (OSError, ValueError, KeyError):
+            pass
+        attrs = {
+            'path': relpath,
+            'url': f"{server}/viewer?model={urllib.parse.quote(relpath, safe='')}",
+            'time': datetime.fromtimestamp(st.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        attrs.update(self.sm._metadata_attrs(metadata))
+        return attrs
+
+    def _cold_files(self, username):
+        """{relpath: cold file} of the user's cold-tier copies"""
+        from utils.tiering import COLD_SUFFIX
+        if not self.cold_dir:
+            return {}
+        base = os.path.join(self.cold_dir, username)
+        found = {}
+        for dirpath, _dirnames, filenames in os.walk(base):
+            for name in filenames:
+                if name.endswith(COLD_SUFFIX):
+                    full = os.path.join(dirpath, name)
+                    found[os.path.relpath(full, base)[:-len(COLD_SUFFIX)].replace('\\', '/')] = full
+        return found
+
+    def _adopt_cold(self, username, server):
+        from utils.tiering import COLD_TIER
+        attribs = []
+        for relpath, full in self._cold_files(username).items():
+            attribs.append({
+                'path': relpath,
+                'url': f"{server}/viewer?model={urllib.parse.quote(relpath, safe='')}",
+                'time': datetime.fromtimestamp(os.stat(full).st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                'tier': COLD_TIER,
+                'cold_size': str(os.path.getsize(full)),
+            })
+        return attribs
+
+    # -------------------------------------------------------------- folders
+
+    def _check_entries(self, username, entries, models, dangling):
+        """Index entries of one folder against its model file names; returns the entries' base names"""
+        from utils.tiering import cold_path, is_cold
+
+        names = set()
+        for entry in entries:
+            relpath = entry['relpath']
+            name = os.path.basename(relpath)
+            names.add(name)
+            present = name in models
+            cold = self._cold_exists(username, relpath)
+            if not present and not cold:
+                dangling.append(relpath)
+            elif present and is_cold(entry):
+                # 恢复中断：模型已回到原位置，冷存储副本可能还在
+                def clear(relpath=relpath, cold=cold):
+                    self.sm.update_model(username, relpath, tier=None, cold_size=None)
+                    if cold:
+                        os.remove(cold_path(self.cold_dir, username, relpath))
+                self._act('stale_tier', username, relpath, clear)
+        return names
+
+    def _check_folder(self, username, folder, cached, index_changed, entries, dangling):
+        """Returns the folder's new checkpoint record, or None if it must be looked at again next run"""
+        path = os.path.join(self.sm.user_dir(username), folder)
+        mtime_ns = os.stat(path).st_mtime_ns
+        if cached and cached['m'] == mtime_ns:
+            if not index_changed:
+                self.report['folders_skipped'] += 1
+                return cached
+            # 文件夹未变、索引变了：先用记录的模型文件名比对，一致就不再列目录
+            from utils.tiering import is_cold
+            names = {os.path.basename(e['relpath']) for e in entries}
+            if entries and names == set(cached['models']) and not any(is_cold(e) for e in entries):
+                self.report['folders_compared'] += 1
+                return cached
+
+        self.report['folders_checked'] += 1
+        listing = list_folder(path)
+        models = listing['models']
+        names = self._check_entries(username, entries, models, dangling)
+        if not self._old_enough(mtime_ns / 1e9):
+            return None
+
+        clean = True
+        unregistered = sorted(models - names)
+        if not entries:
+            # 没有任何已登记的模型：失败任务留下的图片文件夹或未登记的原始输出
+            self._act('orphan_folder', username, folder,
+                      lambda: self._quarantine(username, path, folder, 'orphan_folder'))
+            return None
+        for name in unregistered:
+            relpath = f"{folder}/{name}"
+            base = os.path.splitext(name)[0]
+            sidecars = [s for s, b in listing['sidecars'].items() if b == base]
+
+            def move(name=name, relpath=relpath, sidecars=sidecars):
+                self._quarantine(username, os.path.join(path, name), relpath, 'unregistered')
+                for side in sidecars:
+                    self._quarantine(username, os.path.join(path, side), f"{folder}/{side}", 'unregistered')
+            self._act('unregistered', username, relpath, move)
+            clean = False
+        bases = {os.path.splitext(n)[0] for n in models | names}
+        for side, base in listing['sidecars'].items():
+            if base not in bases:
+                self._act('stray_sidecar', username, f"{folder}/{side}",
+                          lambda side=side: self._quarantine(username, os.path.join(path, side),
+                                                             f"{folder}/{side}", 'stray_sidecar'))
+                clean = False
+        for name, mtime in listing['temps'].items():
+            if self._old_enough(mtime):
+                self._act('stale_temp', username, f"{folder}/{name}", lambda name=name: os.remove(os.path.join(path, name)))
+                clean = False
+        if not clean:
+            if not self.dry_run:
+                self.sm.update_usage(username, folder)
+            # 修复改变了文件夹 mtime，下次运行再确认一遍
+            return None
+        return {'m': mtime_ns, 'models': sorted(models)}
+
+    # -------------------------------------------------------------- users
+
+    def check_user(self, username):
+        ud = self.sm.user_dir(username)
+        state = self._load_state(username)
+        entries, corrupt = self._read_index(username)
+        if corrupt:
+            self._rebuild_index(username)
+            entries = [] if self.dry_run else self._read_index(username)[0]
+            state = {'folders': {}}
+        signature = self._index_signature(username)
+        index_changed = state.get('index') != signature
+
+        by_folder = defaultdict(list)
+        for entry in entries:
+            folder, sep, _name = entry['relpath'].rpartition('/')
+            by_folder[folder if sep else ''].append(entry)
+
+        with os.scandir(ud) as it:
+            folders = sorted(e.name for e in it if e.is_dir(follow_symlinks=False) and not e.name.startswith('.'))
+        # 中断写入留下的索引临时文件
+        for name in os.listdir(ud):
+            full = os.path.join(ud, name)
+            if _is_temp(name) and os.path.isfile(full) and self._old_enough(os.stat(full).st_mtime):
+                self._act('stale_temp', username, name, lambda full=full: os.remove(full))
+
+        dangling = []
+        checked = {}
+        for i, folder in enumerate(folders, 1):
+            try:
+                record = self._check_folder(username, folder, state['folders'].get(folder), index_changed,
+                                            by_folder.pop(folder, []), dangling)
+            except FileNotFoundError:
+                continue  # 检查期间被删除或移动
+            if record is not None:
+                checked[folder] = record
+            if i % _CHECKPOINT_EVERY == 0:
+                # 断点：已确认的文件夹下次运行直接跳过（索引签名不变时）
+                self._save_state(username, {'index': state.get('index'), 'folders': dict(state['folders'], **checked)})
+
+        # 文件夹已不存在的索引记录，以及用户根目录下的模型
+        for folder, rest in by_folder.items():
+            root_models = {n for n in os.listdir(ud) if _is_model(n)} if folder == '' else set()
+            for entry in rest:
+                if os.path.basename(entry['relpath']) not in root_models and \
+                        not self._cold_exists(username, entry['relpath']):
+                    dangling.append(entry['relpath'])
+
+        # 删除前再确认一次（改名、移入回收站的过程中会短暂出现这种状态）
+        dangling = [r for r in dangling if not os.path.exists(os.path.join(ud, r))]
+        for relpath in dangling:
+            self._act('dangling', username, relpath)
+        if dangling and not self.dry_run:
+            self.sm.remove_models(username, dangling)
+
+        self._check_cold_orphans(username, entries)
+        self._save_state(username, {'index': self._index_signature(username), 'folders': checked})
+        self.report['users'] += 1
+
+    def _check_cold_orphans(self, username, entries):
+        cold = self._cold_files(username)
+        if not cold:
+            return
+        referenced = {e['relpath'] for e in entries}
+        trash = self.sm.trash_dir(username)
+        if os.path.isdir(trash):
+            for trash_id in os.listdir(trash):
+                try:
+                    manifest = self.sm.read_trash_manifest(username, trash_id.removesuffix('.reaping'))
+                except (OSError, ValueError):
+                    continue
+                referenced.update(m.get('path') for m in manifest.get('models', []))
+        for relpath, full in cold.items():
+            if relpath in referenced or not self._old_enough(os.stat(full).st_mtime):
+                continue
+            self._act('cold_orphan', username, relpath,
+                      lambda relpath=relpath, full=full: self._quarantine(
+                          username, full, f"{QUARANTINE_COLD}/{relpath}.gz", 'cold_orphan'))
+
+    def purge_quarantine(self):
+        """Delete quarantine runs older than quarantine_days"""
+        from utils.reaper import _Throttle, throttled_rmtree
+
+        base = os.path.join(self.data_dir, QUARANTINE_DIR)
+        if not self.quarantine_days or not os.path.isdir(base):
+            return
+        cutoff = time.time() - self.quarantine_days * 86400
+        for name in os.listdir(base):
+            path = os.path.join(base, name)
+            if name != self.run_id and os.path.isdir(path) and os.stat(path).st_mtime < cutoff:
+                self._act('purged', '-', f"{QUARANTINE_DIR}/{name}",
+                          lambda path=path: throttled_rmtree(path, _Throttle(0, 0)))
+
+    def run(self, users=None):
+        """Check users (default: all); returns the report Counter, None if another fsck holds the lock"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(os.path.join(self.data_dir, LOCK_NAME), 'a+') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            for username in users or self.sm.usage.users():
+                try:
+                    self.check_user(username)
+                except OSError:
+                    logger.exception(f"检查用户 {username} 失败")
+                    self.report['failed_users'] += 1
+            self.purge_quarantine()
+        return self.report
+
+
+def main(argv=None):
+    import argparse
+    from config import Config
+
+    ap = argparse.ArgumentParser(description='Reconcile DATA_DIR with the model indexes')
+    ap.add_argument('--data-dir', default=str(Config.DATA_DIR))
+    ap.add_argument('--cold-dir', default=str(Config.COLD_DIR))
+    ap.add_argument('--user', action='append', help='Only these users (repeatable)')
+    ap.add_argument('--grace', type=float, default=Config.FSCK_GRACE_SECONDS,
+                    help='Seconds a folder must be untouched before it is repaired')
+    ap.add_argument('--full', action='store_true', help='Ignore the checkpoint and list every folder')
+    ap.add_argument('--dry-run', action='store_true', help='Only report what would be repaired')
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    fsck = Fsck(args.data_dir, args.cold_dir, grace=args.grace, quarantine_days=Config.FSCK_QUARANTINE_DAYS,
+                dry_run=args.dry_run, full=args.full)
+    started = time.monotonic()
+    report = fsck.run(args.user)
+    if report is None:
+        print('another fsck run holds the lock')
+        return 1
+    print(f"done in {time.monotonic() - started:.1f}s: {dict(report)}")
+    return 1 if report.get('failed_users') else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
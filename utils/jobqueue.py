@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANE = 'interactive'
+
+
+class FairScheduler:
+    """Weighted fair ordering of queued jobs (start-time fair queueing).
+
+    Jobs belong to a flow (user, lane).  A job gets a start tag
+    max(virtual time, finish tag of the previous job of its flow) and a finish
+    tag start + cost / (user weight * lane weight); pop() returns the head of
+    the flow with the smallest start tag and advances the virtual time to it.
+    A user with many queued jobs therefore only delays another user's job by
+    about one job per competing flow, and a flow that was idle re-enters at the
+    current virtual time instead of accumulating credit.
+
+    pop() skips users already running user_max_running jobs (0 = no cap); call
+    done(user) when a popped job finishes.  Not thread-safe: JobQueue and
+    Dispatcher call it under their own locks.
+
+    Args:
+        lane_weights: {lane: weight}; unknown lanes get weight 1
+        user_weights: {user: weight}; unknown users get weight 1
+        user_max_running: per-user concurrency cap (0 = unlimited)
+    """
+
+    def __init__(self, lane_weights=None, user_weights=None, user_max_running=0):
+        self.lane_weights = dict(lane_weights or {DEFAULT_LANE: 1})
+        self.user_weights = dict(user_weights or {})
+        self.user_max_running = user_max_running
+        self.vtime = 0.0
+        self._flows = {}             # (user, lane) -> deque of (job_id, start, finish)
+        self._last_finish = {}       # (user, lane) -> finish tag of the flow's last job
+        self._job_flow = {}          # job_id -> (user, lane)
+        self._running = Counter()    # user -> popped jobs not yet done
+
+    def __len__(self):
+        return len(self._job_flow)
+
+    def __contains__(self, job_id):
+        return job_id in self._job_flow
+
+    def push(self, job_id, user=None, lane=None, cost=1.0):
+        flow = (user, lane or DEFAULT_LANE)
+        weight = self.user_weights.get(user, 1) * self.lane_weights.get(flow[1], 1)
+        start = max(self.vtime, self._last_finish.get(flow, 0.0))
+        finish = start + cost / weight
+        self._last_finish[flow] = finish
+        self._flows.setdefault(flow, deque()).append((job_id, start, finish))
+        self._job_flow[job_id] = flow
+
+    def remove(self, job_id):
+        """Drop a queued job (cancel / expiry); returns False if it is not queued"""
+        flow = self._job_flow.pop(job_id, None)
+        if flow is None:
+            return False
+        queue = self._flows[flow]
+        for item in queue:
+            if item[0] == job_id:
+                queue.remove(item)
+                break
+        if not queue:
+            del self._flows[flow]
+        return True
+
+    def _eligible(self, user):
+        return not self.user_max_running or self._running[user] < self.user_max_running
+
+    def _best_flow(self):
+        best = None
+        for flow, queue in self._flows.items():
+            if self._eligible(flow[0]) and (best is None or queue[0][1:] < self._flows[best][0][1:]):
+                best = flow
+        return best
+
+    def peek(self):
+        """(job_id, user) pop() would return, without removing it"""
+        best = self._best_flow()
+        return None if best is None else (self._flows[best][0][0], best[0])
+
+    def pop(self):
+        """(job_id, user) of the next job to run, None if nothing is queued or every user is at its cap"""
+        head = self.peek()
+        if head is not None:
+            self.take(head[0])
+        return head
+
+    def take(self, job_id):
+        """Dequeue a specific job as if popped (counts as running, advances the virtual time)"""
+        flow = self._job_flow.pop(job_id)
+        queue = self._flows[flow]
+        item = next(item for item in queue if item[0] == job_id)
+        queue.remove(item)
+        if not queue:
+            del self._flows[flow]
+        self.vtime = max(self.vtime, item[1])
+        self._running[flow[0]] += 1
+        # 空闲流的标签已落后于虚拟时间，不再需要保留
+        if len(self._last_finish) > 2 * len(self._flows) + 64:
+            self._last_finish = {f: t for f, t in self._last_finish.items() if t > self.vtime or f in self._flows}
+        return flow[0]
+
+    def done(self, user):
+        if self._running[user] > 0:
+            self._running[user] -= 1
+        if not self._running[user]:
+            del self._running[user]
+
+    def queued(self, user=None):
+        """Number of queued jobs (of one user when given)"""
+        if user is None:
+            return len(self._job_flow)
+        return sum(len(q) for (u, _lane), q in self._flows.items() if u == user)
+
+    def position(self, job_id):
+        """1-based position in the current dispatch order (ignores caps), None if not queued"""
+        flow = self._job_flow.get(job_id)
+        if flow is None:
+            return None
+        tags = next(item[1:] for item in self._flows[flow] if item[0] == job_id)
+        return 1 + sum(1 for q in self._flows.values() for item in q if item[1:] < tags)
+
+
+class JobQueue:
+    """Fixed number of execution slots fed from a weighted fair queue.
+
+    Each job function is called as fn(*args, cancel_event=event); a job that is
+    cancelled while queued never runs, a running job must watch its cancel_event.
+    Jobs submitted without user / lane all share one flow and run in FIFO order.
+
+    Args:
+        slots: number of jobs allowed to run concurrently
+        queue_timeout: seconds a job may wait for a slot (None = unlimited)
+        on_expire: callback(job_id) for jobs dropped after waiting longer than queue_timeout
+        scheduler: FairScheduler deciding the order (default: plain FIFO)
+    """
+
+    def __init__(self, slots=1, queue_timeout=None, on_expire=None, scheduler=None):
+        self.slots = max(1, int(slots))
+        self.queue_timeout = queue_timeout
+        self.on_expire = on_expire
+        self.scheduler = scheduler if scheduler is not None else FairScheduler()
+        self._queued = {}              # job_id -> (fn, args, enqueued_at)
+        self._running = {}             # job_id -> cancel_event
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def _ensure_threads(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.slots:
+            t = threading.Thread(target=self._worker, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, job_id, fn, *args, user=None, lane=None):
+        with self._cond:
+            self._queued[job_id] = (fn, args, time.monotonic())
+            self.scheduler.push(job_id, user, lane)
+            self._ensure_threads()
+            self._cond.notify()
+
+    def cancel(self, job_id):
+        """Returns 'queued' (removed before running), 'running' (cancel signalled) or None"""
+        with self._cond:
+            if self._queued.pop(job_id, None) is not None:
+                self.scheduler.remove(job_id)
+                return 'queued'
+            event = self._running.get(job_id)
+            if event is not None:
+                event.set()
+                return 'running'
+        return None
+
+    def depth(self):
+        with self._cond:
+            return len(self._queued)
+
+    def active(self):
+        with self._cond:
+            return len(self._running)
+
+    def queued_for(self, user):
+        with self._cond:
+            return self.scheduler.queued(user)
+
+    def position(self, job_id):
+        """1-based position in the queue, None if not queued"""
+        with self._cond:
+            return self.scheduler.position(job_id)
+
+    def _next(self):
+        with self._cond:
+            while True:
+                picked = self.scheduler.pop()
+                if picked is not None:
+                    break
+                # 队列为空，或排队的用户都已达到并发上限
+                self._cond.wait()
+            job_id, user = picked
+            fn, args, enqueued_at = self._queued.pop(job_id)
+            expired = self.queue_timeout is not None and time.monotonic() - enqueued_at > self.queue_timeout
+            event = threading.Event()
+            if expired:
+                self.scheduler.done(user)
+                self._cond.notify_all()
+            else:
+                self._running[job_id] = event
+            return job_id, user, fn, args, event, expired
+
+    def _worker(self):
+        while True:
+            job_id, user, fn, args, event, expired = self._next()
+            if expired:
+                logger.warning(f"任务 {job_id} 排队超时，已丢弃")
+                if self.on_expire is not None:
+                    self.on_expire(job_id)
+                continue
+            try:
+                fn(*args, cancel_event=event)
+            except Exception:
+                logger.exception(f"任务 {job_id} 执行异常")
+            finally:
+                with self._cond:
+                    self._running.pop(job_id, None)
+                    self.scheduler.done(user)
+                    self._cond.notify_all()
@@ -0,0 +1,238 @@
+"""Non-blocking logging: request / task threads only enqueue, one thread writes.
+
+`setup_logging()` installs a single `QueueHandler` on the root logger.  The
+calling thread only formats the message and puts the record on a bounded
+queue; a `QueueListener` thread does the file and console I/O.  A slow disk or
+a chatty reconstruction therefore no longer holds a handler lock that request
+threads wait on.
+
+- Records carry `task_id` and `user` (utils.tracing.TaskIdFilter runs in the
+  calling thread, where the ContextVar / flask.g are set).
+- `LOG_FORMAT = 'json'` writes one JSON object per line (time, level, logger,
+  message, task_id, user, pid, thread, exc); 'text' keeps the old layout.
+- `app.log` rotates by size (LOG_MAX_BYTES) and / or time (LOG_ROTATE_INTERVAL),
+  keeping LOG_BACKUP_COUNT files.  Several gunicorn workers share the file: the
+  rollover is done under an flock by whichever worker gets there first, the
+  others notice the new inode and reopen.
+- When the queue is full, records below WARNING are dropped (counted in the
+  qs_log_records_dropped_total counter); WARNING and above wait up to LOG_BLOCK_TIMEOUT
+  seconds for space.
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(task_id)s] %(message)s'
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; extra fields passed as logger.info(..., extra={'fields': {...}}) are merged"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'task_id': getattr(record, 'task_id', '-'),
+            'user': getattr(record, 'user', '-'),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that several processes may write to
+
+    Rolls over when the file exceeds max_bytes or when a rotate_interval
+    boundary (local time, e.g. 86400 = midnight) has passed.  The rollover is
+    done under an flock on `<file>.lock` and only if the file is still the one
+    this process has open; a process that finds a new inode at the path (another
+    worker rotated) just reopens it.
+    """
+
+    _STAT_INTERVAL = 1.0
+
+    def __init__(self, filename, max_bytes=0, backup_count=5, rotate_interval=0, encoding='utf-8'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.rotate_interval = rotate_interval
+        self._next_stat = 0.0
+        self._rollover_at = self._compute_rollover(time.time())
+
+    def _compute_rollover(self, now):
+        if not self.rotate_interval:
+            return float('inf')
+        local = now - time.altzone if time.localtime(now).tm_isdst > 0 else now - time.timezone
+        return now - local % self.rotate_interval + self.rotate_interval
+
+    def _rotated_elsewhere(self):
+        if self.stream is None:
+            return False
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _reopen(self):
+        self.stream.close()
+        self.stream = self._open()
+
+    def shouldRollover(self, record):
+        now = time.time()
+        if now >= self._next_stat:
+            self._next_stat = now + self._STAT_INTERVAL
+            if self._rotated_elsewhere():
+                self._reopen()
+        if now >= self._rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        now = time.time()
+        with open(self.baseFilename + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self._rotated_elsewhere():
+                    self._reopen()
+                else:
+                    super().doRollover()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._rollover_at = self._compute_rollover(now)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller on low-severity records"""
+
+    def __init__(self, log_queue, block_timeout=1.0):
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 在调用线程中合并 msg/args、格式化异常，保留 task_id / user 等属性，交给监听线程的格式化器
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            # 不在这里更新指标：记录日志的线程可能正持有指标锁
+            self.dropped += 1
+
+
+def setup_logging(log_dir, level=logging.INFO, fmt='json', filename='app.log', max_bytes=0, backup_count=5,
+                  rotate_interval=0, queue_size=10000, block_timeout=1.0, console=True):
+    """Route the root logger through a queue to a background writer; returns the QueueListener.
+
+    Safe to call more than once (later calls are ignored).
+    """
+    global _listener
+    from utils.tracing import TaskIdFilter
+
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        os.makedirs(log_dir, exist_ok=True)
+        formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+        file_handler = SharedRotatingFileHandler(os.path.join(str(log_dir), filename), max_bytes, backup_count,
+                                                 rotate_interval)
+        handlers = [file_handler]
+        if console:
+            # 控制台保持易读的文本格式
+            handlers.append(logging.StreamHandler())
+            handlers[-1].setFormatter(logging.Formatter(TEXT_FORMAT))
+        file_handler.setFormatter(formatter)
+
+        queue_handler = DroppingQueueHandler(queue.Queue(queue_size), block_timeout)
+        queue_handler.addFilter(TaskIdFilter())
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+        from utils.metrics import LOG_RECORDS_DROPPED
+        LOG_RECORDS_DROPPED.set_function(lambda: queue_handler.dropped)
+
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+class SampledLogger:
+    """Forwards up to max_lines per window, then every sample_every-th line (0 = none) marked as sampled.
+
+    At the end of a window the number of lines left out is logged, so a chatty
+    subprocess costs a bounded number of records per window.
+    """
+
+    def __init__(self, target, max_lines, window, sample_every=0):
+        self.target = target
+        self.max_lines = max_lines
+        self.window = window
+        self.sample_every = sample_every
+        self.window_start = time.monotonic()
+        self.count = 0
+        self.suppressed = 0
+
+    def log(self, message):
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            self.flush()
+            self.window_start = now
+            self.count = 0
+        if self.count < self.max_lines:
+            self.count += 1
+            self.target.info(message)
+            return
+        self.suppressed += 1
+        if self.sample_every and self.suppressed % self.sample_every == 0:
+            self.target.info(message, extra={'fields': {'sampled': self.sample_every}})
+
+    def flush(self):
+        if self.suppressed:
+            kept = self.suppressed // self.sample_every if self.sample_every else 0
+            self.target.info(f"重建日志：已省略 {self.suppressed - kept} 行（抽样保留 {kept} 行）",
+                             extra={'fields': {'suppressed': self.suppressed - kept}})
+            self.suppressed = 0
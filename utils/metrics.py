@@ -0,0 +1,408 @@
+"""In-process metrics with cross-process aggregation, exported in Prometheus text format.
+
+Every process (gunicorn worker) keeps its own counters / gauges / histograms in
+memory and periodically dumps them to `METRICS_DIR/<pid>-<start>.json`, where
+start is the process start time (so a reused pid never overwrites the dump of an
+exited worker).  `/metrics` merges all dumps:
+
+- counters and histograms of exited processes are folded into `retired.json`
+  and their dumps removed, so totals stay monotonic across worker restarts;
+- counters and histograms are summed over retired.json and the live dumps;
+- gauges are summed over live processes only.
+
+Usage:
+    from utils import metrics
+    STAGE_SECONDS = metrics.histogram('qs_stage_seconds', 'Pipeline stage latency', ['stage'])
+    STAGE_SECONDS.labels('predict').observe(12.3)
+    with STAGE_SECONDS.time('convert'):
+        ...
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 重建流水线各阶段耗时跨度大（秒级到十分钟级）
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+_lock = threading.Lock()
+_metrics = {}          # name -> metric
+_dirty = False
+_flusher = None
+
+RETIRED_NAME = 'retired.json'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_str(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _fmt(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Child:
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        self._metric._add(self._key, amount)
+
+    def dec(self, amount=1):
+        self._metric._add(self._key, -amount)
+
+    def set(self, value):
+        self._metric._set(self._key, value)
+
+    def observe(self, value):
+        self._metric._observe(self._key, value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        if not self.labelnames and self.kind != 'histogram':
+            self._values[()] = 0
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return _Child(self, tuple(str(v) for v in values))
+
+    # 无标签时直接调用
+    def inc(self, amount=1):
+        self._add((), amount)
+
+    def dec(self, amount=1):
+        self._add((), -amount)
+
+    def set(self, value):
+        self._set((), value)
+
+    def observe(self, value):
+        self._observe((), value)
+
+    def _add(self, key, amount):
+        global _dirty
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+            _dirty = True
+        _ensure_flusher()
+
+    def _set(self, key, value):
+        global _dirty
+        with _lock:
+            self._values[key] = value
+            _dirty = True
+        _ensure_flusher()
+
+    def snapshot(self):
+        return [[list(k), v] for k, v in self._values.items()]
+
+
+class _FunctionMetric(_Metric):
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set_function(self, fn):
+        """Value is computed by fn() at snapshot time (unlabelled metrics only; a counter's fn must never decrease)"""
+        self._function = fn
+
+    def snapshot(self):
+        if self._function is not None:
+            try:
+                self._values[()] = self._function()
+            except Exception:
+                logger.exception(f"计算指标 {self.name} 失败")
+        return super().snapshot()
+
+
+class Counter(_FunctionMetric):
+    kind = 'counter'
+
+
+class Gauge(_FunctionMetric):
+    kind = 'gauge'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def _observe(self, key, value):
+        global _dirty
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+            _dirty = True
+        _ensure_flusher()
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe(tuple(str(v) for v in labelvalues), time.perf_counter() - start)
+
+
+def _register(cls, name, *args, **kwargs):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+# ------------------------------------------------------------- persistence
+
+
+def _metrics_dir():
+    from config import Config
+    return str(Config.METRICS_DIR)
+
+
+def _start_time(pid):
+    """Process start time in clock ticks since boot (/proc/<pid>/stat field 22); None if unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # comm 可能含空格和括号，从最后一个 ')' 之后解析
+    return int(stat[stat.rindex(')') + 2:].split()[19])
+
+
+_start = _start_time(os.getpid())
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: {
+                'type': m.kind,
+                'help': m.documentation,
+                'labels': list(m.labelnames),
+                'buckets': [b for b in getattr(m, 'buckets', ()) if b != float('inf')],
+                'values': m.snapshot(),
+            }
+            for name, m in _metrics.items()
+        }
+
+
+def flush():
+    """Dump this process' metrics to METRICS_DIR/<pid>-<start>.json"""
+    global _dirty
+    directory = _metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}-{_start or 0}.json")
+    data = _snapshot()
+    _dirty = False
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'pid': os.getpid(), 'start': _start, 'time': time.time(), 'metrics': data}, f)
+    os.replace(tmp, path)
+
+
+def _flush_loop(interval):
+    while True:
+        time.sleep(interval)
+        if _dirty:
+            try:
+                flush()
+            except OSError:
+                logger.exception('写入指标文件失败')
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        from config import Config
+        _flusher = threading.Thread(target=_flush_loop, args=(Config.METRICS_FLUSH_INTERVAL,), daemon=True)
+        _flusher.start()
+
+
+def _after_fork():
+    # fork 出的 worker 继承了父进程的指标和已失效的 flusher 线程
+    global _flusher, _dirty, _start
+    _flusher = None
+    _start = _start_time(os.getpid())
+    for m in _metrics.values():
+        m._values.clear()
+        if not m.labelnames and m.kind != 'histogram':
+            m._values[()] = 0
+    _dirty = False
+
+
+os.register_at_fork(after_in_child=_after_fork)
+atexit.register(lambda: _dirty and flush())
+
+
+def _pid_alive(pid, start=None):
+    """pid is running and, when start is known, is still the process that wrote the dump"""
+    if start is not None and os.path.isdir('/proc'):
+        return _start_time(pid) == start
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(merged, metrics_dump, gauges=True):
+    """Add one dump's metrics into merged ({name: {type, help, labels, buckets, values: {key: value}}})"""
+    for name, m in metrics_dump.items():
+        if m['type'] == 'gauge' and not gauges:
+            continue
+        target = merged.setdefault(name, {k: m[k] for k in ('type', 'help', 'labels', 'buckets')})
+        values = target.setdefault('values', {})
+        for key, value in m['values']:
+            key = tuple(key)
+            if m['type'] == 'histogram':
+                acc = values.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                acc['buckets'] = [a + b for a, b in zip(acc['buckets'], value['buckets'])]
+                acc['sum'] += value['sum']
+                acc['count'] += value['count']
+            else:
+                values[key] = values.get(key, 0) + value
+
+
+@contextmanager
+def _retired_lock(directory):
+    with open(os.path.join(directory, RETIRED_NAME + '.lock'), 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _retire(directory, retired, dumps):
+    """Fold the counters / histograms of exited processes into retired.json and remove their dumps"""
+    dead = [fname for fname, dump in dumps.items() if not _pid_alive(dump.get('pid', 0), dump.get('start'))]
+    if not dead:
+        return
+    for fname in dead:
+        _merge(retired, dumps.pop(fname)['metrics'], gauges=False)
+    path = os.path.join(directory, RETIRED_NAME)
+    data = {name: dict(m, values=[[list(k), v] for k, v in m['values'].items()]) for name, m in retired.items()}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'pid': 0, 'time': time.time(), 'metrics': data}, f)
+    os.replace(tmp, path)
+    # 先落盘 retired.json 再删除快照：删除失败的快照下次会被重复合并，但计数不会回退
+    for fname in dead:
+        os.remove(os.path.join(directory, fname))
+
+
+def collect():
+    """Merge all process dumps and render Prometheus text exposition"""
+    flush()
+    directory = _metrics_dir()
+    # 读取与合并都在锁内：并发请求不会把同一个已退出进程计入两次
+    with _retired_lock(directory):
+        merged = {}
+        _merge(merged, (_load(os.path.join(directory, RETIRED_NAME)) or {}).get('metrics', {}))
+        dumps = {}
+        for fname in os.listdir(directory):
+            if fname.endswith('.json') and fname != RETIRED_NAME:
+                dump = _load(os.path.join(directory, fname))
+                if dump is not None:
+                    dumps[fname] = dump
+        _retire(directory, merged, dumps)
+
+    for dump in dumps.values():
+        _merge(merged, dump['metrics'])
+
+    lines = []
+    for name in sorted(merged):
+        m = merged[name]
+        lines.append(f"# HELP {name} {m['help']}")
+        lines.append(f"# TYPE {name} {m['type']}")
+        for key, value in sorted(m.get('values', {}).items()):
+            if m['type'] != 'histogram':
+                lines.append(f"{name}{_label_str(m['labels'], key)} {_fmt(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(m['buckets']) + [float('inf')], value['buckets']):
+                cumulative += count
+                le = f'le="{_fmt(bound)}"'
+                lines.append(f"{name}_bucket{_label_str(m['labels'], key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_str(m['labels'], key)} {_fmt(value['sum'])}")
+            lines.append(f"{name}_count{_label_str(m['labels'], key)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+# ------------------------------------------------------- application metrics
+
+STAGE_SECONDS = histogram('qs_sharp_stage_seconds', 'Sharp pipeline stage latency in seconds',
+                          ['stage'], buckets=STAGE_BUCKETS)
+TASKS_TOTAL = counter('qs_sharp_tasks_total', 'Finished sharp tasks by final status', ['status'])
+QUEUE_DEPTH = gauge('qs_sharp_queue_depth', 'Sharp jobs waiting for a GPU slot')
+ACTIVE_SUBPROCESSES = gauge('qs_sharp_active_subprocesses', 'Running sharp predict subprocesses')
+LOG_RECORDS_DROPPED = counter('qs_log_records_dropped_total', 'Log records dropped because the log queue was full')
+BYTES_SERVED = counter('qs_model_bytes_served_total', 'Bytes of model files served by serve_model')
+REQUEST_SECONDS = histogram('qs_http_request_seconds', 'HTTP request latency in seconds',
+                            ['method', 'route', 'status'])
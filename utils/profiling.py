@@ -0,0 +1,155 @@
+"""Opt-in per-request cProfile captures.
+
+A request is profiled when it carries a valid signed `X-Profile` header, or is
+picked by PROFILING_SAMPLE_RATE.  The header value is `<expires>:<hmac>` with
+hmac = HMAC-SHA256(PROFILING_SECRET, str(expires)), so an admin can hand out a
+short-lived token without exposing the secret:
+
+    python -m utils.profiling token --ttl 600
+    curl -H "X-Profile: <token>" -H "token: ..." https://host/manager/list/
+
+Each capture is saved as `PROFILING_DIR/<name>.prof` (pstats, open with
+snakeviz / `python -m pstats`) plus `<name>.json` describing the request
+(route, method, status, duration, trigger) and the top functions by cumulative
+time.  Only the newest PROFILING_MAX_FILES captures are kept.
+
+    python -m utils.profiling list
+    python -m utils.profiling show <name>
+"""
+
+import hashlib
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+
+PROFILE_HEADER = 'X-Profile'
+_NAME_RE = re.compile(r'^[0-9A-Za-z_.-]+$')
+
+
+def sign(secret, expires):
+    return hmac.new(secret.encode('utf-8'), str(int(expires)).encode('ascii'), hashlib.sha256).hexdigest()
+
+
+def make_token(secret, ttl=600):
+    expires = int(time.time() + ttl)
+    return f"{expires}:{sign(secret, expires)}"
+
+
+def verify_token(secret, token):
+    """True if token was made with secret and has not expired"""
+    if not secret or not token:
+        return False
+    expires, _, signature = token.partition(':')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, sign(secret, expires))
+
+
+def _top_functions(stats, limit):
+    rows = []
+    for (filename, line, func), (_cc, ncalls, tottime, cumtime, _callers) in stats.stats.items():
+        rows.append({'function': f"{os.path.basename(filename)}:{line}({func})", 'calls': ncalls,
+                     'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6)})
+    rows.sort(key=lambda r: r['cumtime'], reverse=True)
+    return rows[:limit]
+
+
+def save_profile(directory, profiler, info, max_files=200, top=20):
+    """Write profiler's stats and info (route, method, status, duration_ms, ...); returns the capture name"""
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r'[^0-9A-Za-z]+', '_', info.get('route') or 'unmatched').strip('_') or 'root'
+    name = (f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}_{info.get('method', '')}_{slug}"
+            f"_{int(info.get('duration_ms', 0))}ms")
+    base = os.path.join(directory, name)
+    profiler.dump_stats(base + '.prof')
+    info = dict(info, name=name, time=time.time(), top=_top_functions(pstats.Stats(profiler), top))
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False)
+    _prune(directory, max_files)
+    return name
+
+
+def _prune(directory, max_files):
+    if not max_files:
+        return
+    with os.scandir(directory) as it:
+        captures = sorted((e.stat().st_mtime, e.name[:-5]) for e in it if e.name.endswith('.json'))
+    for _mtime, name in captures[:-max_files]:
+        for ext in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, name + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory, limit=50):
+    """Newest first: the JSON descriptions without the function table"""
+    try:
+        with os.scandir(directory) as it:
+            entries = sorted((e for e in it if e.name.endswith('.json')), key=lambda e: e.stat().st_mtime,
+                             reverse=True)[:limit]
+    except FileNotFoundError:
+        return []
+    result = []
+    for entry in entries:
+        try:
+            with open(entry.path, encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            continue
+        info.pop('top', None)
+        result.append(info)
+    return result
+
+
+def profile_path(directory, name, ext='.prof'):
+    """Path of a capture; raises ValueError for names that are not plain capture names"""
+    if not _NAME_RE.match(name or ''):
+        raise ValueError(name)
+    return os.path.join(directory, name + ext)
+
+
+def render_text(path, sort='cumulative', limit=40):
+    """pstats report of a .prof file as text"""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def main(argv=None):
+    import argparse
+    from config import Config
+
+    ap = argparse.ArgumentParser(description='Request profiling helpers')
+    sub = ap.add_subparsers(dest='command', required=True)
+    tok = sub.add_parser('token', help=f'Mint a signed {PROFILE_HEADER} header value')
+    tok.add_argument('--ttl', type=int, default=600, help='Seconds the token stays valid')
+    ls = sub.add_parser('list', help='Recent captures')
+    ls.add_argument('--limit', type=int, default=20)
+    show = sub.add_parser('show', help='Text report of one capture')
+    show.add_argument('name')
+    show.add_argument('--sort', default='cumulative')
+    show.add_argument('--limit', type=int, default=40)
+    args = ap.parse_args(argv)
+
+    directory = str(Config.PROFILING_DIR)
+    if args.command == 'token':
+        if not Config.PROFILING_SECRET:
+            print('PROFILING_SECRET is not set')
+            return 1
+        print(make_token(Config.PROFILING_SECRET, args.ttl))
+    elif args.command == 'list':
+        for info in list_profiles(directory, args.limit):
+            print(f"{info['name']:<70} {info.get('status')} {info.get('duration_ms'):>9.1f} ms  {info.get('trigger')}")
+    else:
+        print(render_text(profile_path(directory, args.name), args.sort, args.limit))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
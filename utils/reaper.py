@@ -0,0 +1,192 @@
+"""Background reclamation of deleted model folders.
+
+`StorageManager.trash_path` only renames a folder into `DATA_DIR/<user>/.trash/<trash_id>/`;
+the reaper deletes trash entries once they are older than the undo window.
+
+Deletion is throttled (bytes/s and files/s) so reclaiming several multi-hundred-MB
+PLY files does not saturate a slow disk: large files are truncated in chunks
+before being unlinked, which spreads the block freeing over time instead of one
+long unlink.  Across gunicorn workers only the holder of a non-blocking flock
+on `DATA_DIR/.trash_reaper.lock` reaps.  Cold-tier copies of reaped models
+(see utils.tiering) are removed with their trash entry.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REAPING_SUFFIX = '.reaping'
+_TRUNCATE_CHUNK = 64 * 1024 * 1024
+
+
+class _Throttle:
+    """Sleeps so that consumed bytes / files stay under the configured rates (0 = unlimited)"""
+
+    def __init__(self, bytes_per_sec, files_per_sec):
+        self.bytes_per_sec = bytes_per_sec
+        self.files_per_sec = files_per_sec
+        self.start = time.monotonic()
+        self.bytes = 0
+        self.files = 0
+
+    def consume(self, nbytes=0, files=0):
+        self.bytes += nbytes
+        self.files += files
+        due = 0.0
+        if self.bytes_per_sec:
+            due = max(due, self.bytes / self.bytes_per_sec)
+        if self.files_per_sec:
+            due = max(due, self.files / self.files_per_sec)
+        delay = self.start + due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def throttled_rmtree(path, throttle):
+    """Remove a directory tree bottom-up under the throttle; returns bytes reclaimed"""
+    reclaimed = 0
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(full)
+                size = st.st_size
+                # 大文件分段截断后再删除，避免一次性释放大量数据块造成 I/O 尖峰
+                while size > _TRUNCATE_CHUNK and not os.path.islink(full):
+                    size -= _TRUNCATE_CHUNK
+                    os.truncate(full, size)
+                    throttle.consume(nbytes=_TRUNCATE_CHUNK)
+                os.unlink(full)
+                throttle.consume(nbytes=size, files=1)
+                reclaimed += st.st_size
+            except FileNotFoundError:
+                continue
+        for name in dirnames:
+            full = os.path.join(dirpath, name)
+            try:
+                if os.path.islink(full):
+                    os.unlink(full)
+                else:
+                    os.rmdir(full)
+            except FileNotFoundError:
+                continue
+    os.rmdir(path)
+    return reclaimed
+
+
+class TrashReaper:
+    """Deletes trash entries older than undo_window seconds, every interval seconds
+
+    Args:
+        data_dir: DATA_DIR (user dirs below it)
+        trash_name: per-user trash directory name (StorageManager.TRASH_NAME)
+        undo_window: seconds a deleted folder stays restorable
+        interval: seconds between scans
+        bytes_per_sec / files_per_sec: deletion rate limits (0 = unlimited)
+        cold_dir: COLD_DIR, for removing cold copies of reaped models (None = no cold tier)
+    """
+
+    def __init__(self, data_dir, trash_name='.trash', undo_window=600, interval=60,
+                 bytes_per_sec=0, files_per_sec=0, cold_dir=None):
+        self.data_dir = str(data_dir)
+        self.cold_dir = cold_dir
+        self.trash_name = trash_name
+        self.undo_window = undo_window
+        self.interval = interval
+        self.bytes_per_sec = bytes_per_sec
+        self.files_per_sec = files_per_sec
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name='trash-reaper', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('回收站清理失败')
+
+    def _trash_dirs(self):
+        try:
+            with os.scandir(self.data_dir) as it:
+                users = [e.path for e in it if e.is_dir() and not e.name.startswith('.')]
+        except FileNotFoundError:
+            return []
+        return [os.path.join(u, self.trash_name) for u in users if os.path.isdir(os.path.join(u, self.trash_name))]
+
+    def _deleted_at(self, entry):
+        try:
+            with open(os.path.join(entry.path, 'manifest.json'), encoding='utf-8') as f:
+                return json.load(f)['deleted_at']
+        except (OSError, ValueError, KeyError):
+            return entry.stat().st_mtime
+
+    def _cold_copies(self, trash_dir, path):
+        """Cold-tier files of the models listed in a trash entry's manifest"""
+        if not self.cold_dir:
+            return []
+        from utils.tiering import cold_path, is_cold
+        username = os.path.basename(os.path.dirname(trash_dir))
+        try:
+            with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+                models = json.load(f).get('models', [])
+        except (OSError, ValueError):
+            return []
+        copies = []
+        for attrib in models:
+            if is_cold(attrib) and attrib.get('path'):
+                try:
+                    copies.append(cold_path(self.cold_dir, username, attrib['path']))
+                except ValueError:
+                    continue
+        return copies
+
+    def run_once(self):
+        """One scan over all users' trash; returns bytes reclaimed (0 if another process holds the lock)"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(os.path.join(self.data_dir, '.trash_reaper.lock'), 'a+') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            throttle = _Throttle(self.bytes_per_sec, self.files_per_sec)
+            reclaimed = 0
+            now = time.time()
+            for trash_dir in self._trash_dirs():
+                with os.scandir(trash_dir) as it:
+                    entries = [e for e in it if e.is_dir(follow_symlinks=False)]
+                for entry in entries:
+                    path = entry.path
+                    if not entry.name.endswith(REAPING_SUFFIX):
+                        if now - self._deleted_at(entry) < self.undo_window:
+                            continue
+                        # 先改名占用该条目，之后撤销删除不会再找到它
+                        path = path + REAPING_SUFFIX
+                        try:
+                            os.rename(entry.path, path)
+                        except FileNotFoundError:
+                            continue
+                    cold_copies = self._cold_copies(trash_dir, path)
+                    try:
+                        reclaimed += throttled_rmtree(path, throttle)
+                    except OSError:
+                        logger.exception(f"删除回收站条目失败: {path}")
+                        continue
+                    for cold in cold_copies:
+                        try:
+                            reclaimed += os.path.getsize(cold)
+                            os.remove(cold)
+                        except FileNotFoundError:
+                            continue
+            if reclaimed:
+                logger.info(f"回收站清理完成，释放 {reclaimed / 1024 / 1024:.1f} MB")
+            return reclaimed
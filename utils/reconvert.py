@@ -0,0 +1,325 @@
+"""Batch re-conversion of every indexed model with the current converter.
+
+When convert.py changes (CONVERTER_VERSION bumped, tiling or pruning settings
+changed) existing models under DATA_DIR keep their old layout.  This tool walks
+all users' model indexes and re-converts stale `.ply` models in a process pool:
+
+- A model is current when its index entry records `converter` ==
+  CONVERTER_VERSION and a `source` fingerprint (size:mtime_ns:sha1) matching the
+  file.  If only size/mtime differ the file is re-hashed; an unchanged hash just
+  refreshes the fingerprint.  Entries registered by the pipeline carry the
+  current `converter` but no `source` yet: they are hashed once and only get
+  the fingerprint, never a re-conversion.
+- The output is written next to the model under a temporary name and published
+  with os.replace (tiles index first, PLY last), after checking the model was
+  not modified meanwhile.  Index metadata and usage are updated by the parent
+  process; the entry also records the tiles index fingerprint (`tiles_source`,
+  size:mtime_ns, empty without one), so a run interrupted between the two
+  renames finds the new index next to the old PLY and converts the model again.
+- The index is the checkpoint: an interrupted run is resumed by running it
+  again.  Failures are recorded in DATA_DIR/.reconvert_state.json and skipped on
+  later runs (unless --retry-failed) while the file is unchanged.
+- Workers run at nice 10 and limit their reads + writes to --bytes-per-sec in
+  total, so live serving keeps the disk.
+
+    python -m utils.reconvert --dry-run
+    python -m utils.reconvert --workers 4 --bytes-per-sec 100M
+    python -m utils.reconvert --user alice --force --prune
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = '.reconvert_state.json'
+LOCK_NAME = '.reconvert.lock'
+TMP_INFIX = '.reconvert'
+_HASH_CHUNK = 1024 * 1024
+
+_throttle = None
+
+
+def fingerprint(path, sha1=None):
+    """size:mtime_ns[:sha1] of a file"""
+    st = os.stat(path)
+    fp = f"{st.st_size}:{st.st_mtime_ns}"
+    return f"{fp}:{sha1}" if sha1 else fp
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            if _throttle is not None:
+                _throttle.consume(nbytes=len(chunk))
+    return digest.hexdigest()
+
+
+def tiles_fingerprint(path):
+    """size:mtime_ns of the model's tiles index, '' if it has none"""
+    from convert import tiles_path
+    try:
+        return fingerprint(tiles_path(path))
+    except FileNotFoundError:
+        return ''
+
+
+def classify(entry, full_path, version, force=False):
+    """'skip' | 'verify' (re-hash, maybe only refresh the fingerprint; also when none is recorded) | 'convert'"""
+    if force or entry.get('converter') != str(version):
+        return 'convert'
+    # 分块索引与登记的不一致：上次发布在两次替换之间中断，模型与分块索引不再配套
+    if entry.get('tiles_source') is not None and tiles_fingerprint(full_path) != entry['tiles_source']:
+        return 'convert'
+    source = entry.get('source') or ''
+    if source.rsplit(':', 1)[0] == fingerprint(full_path):
+        return 'skip'
+    return 'verify'
+
+
+# ------------------------------------------------------------------ worker
+
+
+def _init_worker(bytes_per_sec):
+    global _throttle
+    from utils.reaper import _Throttle
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+    _throttle = _Throttle(bytes_per_sec, 0)
+
+
+def process_model(job, tile_size, prune):
+    """Runs in a pool worker: verify and/or re-convert one model; returns a result dict for the parent"""
+    from pathlib import Path
+    from convert import convert, tiles_path
+
+    path = job['path']
+    before = fingerprint(path)
+    if job['action'] == 'verify':
+        sha1 = file_sha1(path)
+        recorded = (job.get('source') or '::').split(':')[-1]
+        # 没有指纹：流水线用当前版本的转换器生成后登记，只补记指纹
+        if not job.get('source') or sha1 == recorded:
+            return {'status': 'verified', 'source': f"{before}:{sha1}", 'tiles_source': tiles_fingerprint(path)}
+
+    base, _ext = os.path.splitext(path)
+    folder, name = os.path.split(base)
+    tmp = os.path.join(folder, f".{name}{TMP_INFIX}{os.getpid()}.ply")
+    try:
+        meta = convert(Path(path), Path(tmp), tile_size=tile_size, prune=prune)
+        if _throttle is not None:
+            _throttle.consume(nbytes=int(before.split(':')[0]) + meta['file_size'])
+        # 转换期间模型被改名、删除或覆盖时放弃发布
+        if not os.path.exists(path) or fingerprint(path) != before:
+            return {'status': 'changed'}
+        # 先换分块索引、最后换模型：中途退出时留下的新分块索引与登记的 tiles_source 不符，下次运行会重新转换
+        if os.path.exists(tiles_path(tmp)):
+            os.replace(tiles_path(tmp), tiles_path(path))
+        elif os.path.exists(tiles_path(path)):
+            os.remove(tiles_path(path))
+        os.replace(tmp, path)
+    finally:
+        for leftover in (tmp, tiles_path(tmp)):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return {'status': 'converted', 'metadata': meta, 'source': fingerprint(path, file_sha1(path)),
+            'tiles_source': tiles_fingerprint(path)}
+
+
+# ------------------------------------------------------------------ parent
+
+
+class Reconverter:
+    """Plans and runs one batch over data_dir
+
+    Args:
+        data_dir: DATA_DIR
+        workers: process pool size
+        bytes_per_sec: total read + write budget of all workers (0 = unlimited)
+        tile_size: spatial tile size passed to convert (Config.TILE_TARGET_GAUSSIANS)
+        prune: convert.PruneOptions or None; re-pruning an already pruned model
+            removes a further tail of outliers, so it is opt-in
+    """
+
+    def __init__(self, data_dir, workers=2, bytes_per_sec=0, tile_size=0, prune=None):
+        from utils.storage import StorageManager
+
+        self.data_dir = str(data_dir)
+        self.sm = StorageManager(self.data_dir)
+        self.workers = max(1, workers)
+        self.bytes_per_sec = bytes_per_sec
+        self.tile_size = tile_size
+        self.prune = prune
+        self.state_path = os.path.join(self.data_dir, STATE_NAME)
+        self.state = self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault('failed', {})
+        return state
+
+    def _save_state(self):
+        self.state['updated'] = time.time()
+        tmp = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.state_path)
+
+    def plan(self, users=None, force=False, retry_failed=False):
+        """List of jobs {username, relpath, path, action, source} plus a Counter of skipped reasons"""
+        from convert import CONVERTER_VERSION
+
+        jobs = []
+        skipped = Counter()
+        for username in users or self.sm.usage.users():
+            for entry in self.sm.list_models(username):
+                relpath = entry['relpath']
+                if not relpath.lower().endswith('.ply'):
+                    skipped['not_ply'] += 1
+                    continue
+                try:
+                    path = self.sm.get_full_path(username, relpath)
+                    action = classify(entry, path, CONVERTER_VERSION, force)
+                except (ValueError, OSError):
+                    skipped['missing'] += 1
+                    continue
+                key = f"{username}/{relpath}"
+                failed = self.state['failed'].get(key)
+                if failed and not retry_failed and failed.get('fingerprint') == fingerprint(path):
+                    skipped['failed_before'] += 1
+                    continue
+                if action == 'skip':
+                    skipped['current'] += 1
+                    continue
+                jobs.append({'username': username, 'relpath': relpath, 'path': path,
+                             'action': action, 'source': entry.get('source')})
+        return jobs, skipped
+
+    def _publish(self, job, result):
+        username, relpath = job['username'], job['relpath']
+        # 指纹 size:mtime_ns:sha1 取自当前文件，顺带校正索引中的文件大小
+        attrs = {'source': result['source'], 'size': result['source'].split(':')[0],
+                 'tiles_source': result['tiles_source']}
+        if result['status'] == 'converted':
+            from utils.storage import StorageManager
+            attrs.update(StorageManager._metadata_attrs(result['metadata']))
+            # 不分块转换时删除旧记录中的分块数
+            attrs.setdefault('tiles', None)
+        self.sm.update_model(username, relpath, **attrs)
+        if result['status'] == 'converted':
+            self.sm.update_usage(username, relpath)
+
+    def run(self, jobs):
+        """Process jobs in the pool; returns a Counter of outcomes.  Ctrl-C stops after the running models."""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        outcomes = Counter()
+        if not jobs:
+            return outcomes
+        per_worker = self.bytes_per_sec / self.workers if self.bytes_per_sec else 0
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(per_worker,))
+        futures = {pool.submit(process_model, job, self.tile_size, self.prune): job for job in jobs}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                key = f"{job['username']}/{job['relpath']}"
+                try:
+                    result = future.result()
+                    if result['status'] in ('converted', 'verified'):
+                        self._publish(job, result)
+                    self.state['failed'].pop(key, None)
+                    outcomes[result['status']] += 1
+                except Exception as e:
+                    logger.exception(f"重转换失败: {key}")
+                    try:
+                        fp = fingerprint(job['path'])
+                    except OSError:
+                        fp = None
+                    self.state['failed'][key] = {'error': f"{type(e).__name__}: {e}", 'fingerprint': fp,
+                                                 'time': time.time()}
+                    outcomes['failed'] += 1
+                self._save_state()
+                logger.info(f"[{done}/{len(jobs)}] {key}: {dict(outcomes)}")
+        except KeyboardInterrupt:
+            logger.warning('已中断，重新运行即可从断点继续')
+            pool.shutdown(wait=True, cancel_futures=True)
+            outcomes['interrupted'] = 1
+            return outcomes
+        pool.shutdown(wait=True)
+        return outcomes
+
+
+def _parse_rate(text):
+    """'100M' / '512k' / '0' -> bytes per second"""
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+def main(argv=None):
+    import argparse
+    from config import Config
+
+    ap = argparse.ArgumentParser(description='Re-convert all indexed models with the current converter')
+    ap.add_argument('--data-dir', default=str(Config.DATA_DIR))
+    ap.add_argument('--user', action='append', help='Only these users (repeatable)')
+    ap.add_argument('--workers', type=int, default=Config.RECONVERT_WORKERS)
+    ap.add_argument('--bytes-per-sec', type=_parse_rate, default=Config.RECONVERT_BYTES_PER_SEC,
+                    help='Total disk read + write budget, e.g. 100M (0: unlimited)')
+    ap.add_argument('--tile-size', type=int, default=Config.TILE_TARGET_GAUSSIANS)
+    ap.add_argument('--prune', action='store_true', help='Apply Config.PRUNE_* (even if PRUNE_ENABLED is off)')
+    ap.add_argument('--force', action='store_true', help='Re-convert models that are already current')
+    ap.add_argument('--retry-failed', action='store_true', help='Retry models that failed in earlier runs')
+    ap.add_argument('--dry-run', action='store_true', help='Only report what would be processed')
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    prune = None
+    if args.prune:
+        from convert import PruneOptions
+        prune = PruneOptions(min_opacity=Config.PRUNE_MIN_OPACITY, min_scale=Config.PRUNE_MIN_SCALE,
+                             max_scale=Config.PRUNE_MAX_SCALE, outlier_k=Config.PRUNE_OUTLIER_K,
+                             outlier_std=Config.PRUNE_OUTLIER_STD, outlier_method=Config.PRUNE_OUTLIER_METHOD)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    with open(os.path.join(args.data_dir, LOCK_NAME), 'a+') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print('another reconvert run holds the lock')
+            return 1
+        reconverter = Reconverter(args.data_dir, workers=args.workers, bytes_per_sec=args.bytes_per_sec,
+                                  tile_size=args.tile_size, prune=prune)
+        jobs, skipped = reconverter.plan(args.user, force=args.force, retry_failed=args.retry_failed)
+        actions = Counter(job['action'] for job in jobs)
+        print(f"to convert: {actions['convert']}, to verify: {actions['verify']}, skipped: {dict(skipped)}")
+        if args.dry_run:
+            return 0
+        started = time.monotonic()
+        outcomes = reconverter.run(jobs)
+        print(f"done in {time.monotonic() - started:.1f}s: {dict(outcomes)}")
+    return 1 if outcomes.get('failed') or outcomes.get('interrupted') else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
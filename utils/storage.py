@@ -1,8 +1,29 @@
+import fcntl
 import os
+import json
+import logging
+import threading
+import time
+import urllib.parse
+import uuid
 import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 from werkzeug.utils import secure_filename
 from datetime import datetime
 
+from utils.usage import LOCK_NAME as USAGE_LOCK_NAME, USAGE_NAME, UsageStore
+
+logger = logging.getLogger(__name__)
+
+# 当前线程已持有的索引锁（用户目录 -> 嵌套层数），同一线程内嵌套调用不会自锁
+_held_index_locks = threading.local()
+
+# 已解析的索引：models.xml 路径 -> ((st_ino, st_mtime_ns, st_size), [条目], {relpath: 条目})
+# 索引只经 _write_index 整体替换，inode / mtime 不变即内容不变；下载等热路径不必每次解析整个 models.xml
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+_INDEX_CACHE_USERS = 256
+
 
 class StorageManager:
     """Manage per-user storage layout under DATA_DIR.
@@ -10,19 +31,39 @@ class StorageManager:
     Layout:
       DATA_DIR/username/
         models.xml            -- index of model files (relative paths)
+        models.lock           -- flock held by every models.xml read-modify-write (see index_lock)
+        usage.json            -- byte / file counters (see utils.usage)
         imageFolder1/
             image.jpg
             image.ply
         imageFolder2/
             ...
+        .trash/               -- deleted folders awaiting the reaper (see trash_path)
+            <trash_id>/
+                manifest.json
+                imageFolder3/
 
     Methods operate on paths relative to the user's dir.
     """
 
     INDEX_NAME = 'models.xml'
+    INDEX_LOCK_NAME = 'models.lock'
+    TRASH_NAME = '.trash'
+    MANIFEST_NAME = 'manifest.json'
+    SIDECAR_SUFFIXES = ('.preview.png', '.tiles.json')  # 跟随模型改名 / 移动的文件
+    # /sharp/<名称>/... 是接口路径：用户根目录下的同名文件夹会被接口遮蔽，模型无法下载
+    RESERVED_FOLDER_NAMES = ('uploads', 'images', 'status', 'cancel', 'trace', 'ping')
 
     def __init__(self, data_dir):
         self.data_dir = data_dir
+        self.usage = UsageStore(data_dir, skip_names=(self.TRASH_NAME,))
+
+    def update_usage(self, username, relpath):
+        """Re-measure the image folder containing relpath; accounting errors never fail the caller"""
+        try:
+            self.usage.rescan_folder(username, UsageStore.folder_key(relpath))
+        except OSError:
+            logger.exception('更新存储统计失败')
 
     def user_dir(self, username):
         return os.path.abspath(os.path.join(self.data_dir, username))
@@ -33,76 +74,394 @@ class StorageManager:
         # ensure index exists
         idx = os.path.join(ud, self.INDEX_NAME)
         if not os.path.exists(idx):
-            root = ET.Element('models')
-            tree = ET.ElementTree(root)
-            tree.write(idx, encoding='utf-8', xml_declaration=True)
+            with self.index_lock(username):
+                if not os.path.exists(idx):
+                    root = ET.Element('models')
+                    tree = ET.ElementTree(root)
+                    self._write_index(tree, idx)
         return ud
 
     def index_path(self, username):
         return os.path.join(self.user_dir(username), self.INDEX_NAME)
 
-    def list_models(self, username):
-        """Return list of model entries: dicts with 'relpath' and 'name' and 'url' """
+    @contextmanager
+    def index_lock(self, username):
+        """Per-user flock held across a models.xml read-modify-write.
+
+        Every index writer (pipeline, preview, manager routes, reaper, tierer, fsck)
+        goes through it, in any process or thread; reentrant within a thread.
+        """
+        ud = self.user_dir(username)
+        held = _held_index_locks.__dict__.setdefault('depth', {})
+        if held.get(ud):
+            held[ud] += 1
+            try:
+                yield
+            finally:
+                held[ud] -= 1
+            return
+        os.makedirs(ud, exist_ok=True)
+        with open(os.path.join(ud, self.INDEX_LOCK_NAME), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            held[ud] = 1
+            try:
+                yield
+            finally:
+                held.pop(ud, None)
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write_index(tree, idx):
+        """写临时文件后原子替换，进程中途退出不会留下写了一半的 models.xml"""
+        tmp = f"{idx}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tree.write(tmp, encoding='utf-8', xml_declaration=True)
+        os.replace(tmp, idx)
+
+    @staticmethod
+    def _metadata_attrs(metadata):
+        """convert.model_metadata() result -> index attributes (lists stored comma separated)"""
+        def floats(values):
+            return ','.join(f"{float(v):.6g}" for v in values)
+
+        attrs = {}
+        if metadata.get('vertex_count') is not None:
+            attrs['vertices'] = str(int(metadata['vertex_count']))
+        if metadata.get('file_size') is not None:
+            attrs['size'] = str(int(metadata['file_size']))
+        if metadata.get('tile_count'):
+            attrs['tiles'] = str(int(metadata['tile_count']))
+        if metadata.get('converter_version') is not None:
+            attrs['converter'] = str(metadata['converter_version'])
+        for key in ('bbox', 'centroid'):
+            if metadata.get(key):
+                attrs[key] = floats(metadata[key])
+        for key in ('opacity', 'scale'):
+            if metadata.get(key):
+                attrs[key] = floats(metadata[key][k] for k in ('min', 'mean', 'max'))
+        return attrs
+
+    @staticmethod
+    def _entry(m):
+        path = m.get('path')
+        entry = {
+            'relpath': path,
+            'name': m.get('name') or os.path.basename(path),
+            'url': m.get('url'),
+            'time': m.get('time'),  # 新记录有值，旧记录为None
+        }
+        if m.get('preview'):
+            entry['preview'] = m.get('preview')  # 预览图相对路径
+            entry['preview_time'] = m.get('preview_time')
+        # 转换时记录的模型信息（旧记录没有）
+        if m.get('vertices') is not None:
+            entry['vertices'] = int(m.get('vertices'))
+        if m.get('size') is not None:
+            entry['size'] = int(m.get('size'))
+        if m.get('tiles') is not None:
+            entry['tiles'] = int(m.get('tiles'))  # 分块数，分块索引为 <模型名>.tiles.json
+        if m.get('tier'):
+            entry['tier'] = m.get('tier')  # 'cold'：模型已压缩移入冷存储（见 utils.tiering）
+            entry['cold_size'] = int(m.get('cold_size') or 0)
+        if m.get('accessed'):
+            entry['accessed'] = int(m.get('accessed'))  # 最近访问时间（按天粒度记录）
+        if m.get('converter') is not None:
+            entry['converter'] = m.get('converter')  # 转换器版本（convert.CONVERTER_VERSION）
+            entry['source'] = m.get('source')  # 批量重转换记录的文件指纹 size:mtime_ns:sha1
+        if m.get('tiles_source') is not None:
+            entry['tiles_source'] = m.get('tiles_source')  # 同时记录的分块索引指纹 size:mtime_ns（无分块索引为空）
+        for key in ('bbox', 'centroid'):
+            if m.get(key):
+                entry[key] = [float(v) for v in m.get(key).split(',')]
+        for key in ('opacity', 'scale'):
+            if m.get(key):
+                entry[key] = dict(zip(('min', 'mean', 'max'), (float(v) for v in m.get(key).split(','))))
+        return entry
+
+    def _parsed_index(self, username):
+        """(entries, {relpath: entry}) of the user's index, re-parsed only when models.xml was replaced.
+
+        The cached dicts are shared: callers hand out copies.
+        """
         idx = self.index_path(username)
-        models = []
-        if not os.path.exists(idx):
-            return models
         try:
+            st = os.stat(idx)
+        except FileNotFoundError:
+            return [], {}
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        cached = _index_cache.get(idx)
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+        try:
+            models = [self._entry(m) for m in ET.parse(idx).getroot().findall('model')]
+        except ET.ParseError:
+            # 索引损坏：python -m utils.fsck 可从磁盘重建
+            logger.error(f"模型索引损坏: {idx}")
+            return [], {}
+        except FileNotFoundError:
+            return [], {}
+        by_path = {}
+        for entry in models:
+            by_path.setdefault(entry['relpath'], entry)
+        # stat 与解析之间索引被替换时，缓存的 key 偏旧，下次 stat 不一致会重新解析
+        with _index_cache_lock:
+            if idx not in _index_cache and len(_index_cache) >= _INDEX_CACHE_USERS:
+                _index_cache.pop(next(iter(_index_cache)))
+            _index_cache[idx] = (key, models, by_path)
+        return models, by_path
+
+    def list_models(self, username):
+        """Return list of model entries: dicts with 'relpath', 'name', 'url', 'time'
+        and, for models registered with metadata, 'vertices', 'size', 'tiles', 'bbox', 'centroid', 'opacity', 'scale'
+        """
+        models, _ = self._parsed_index(username)
+        return [dict(entry) for entry in models]
+
+    def get_model(self, username, relpath):
+        """Index entry for relpath (same shape as list_models items), None if not indexed"""
+        entry = self._parsed_index(username)[1].get(relpath)
+        return dict(entry) if entry is not None else None
+
+    def add_model(self, username, relpath, model_url, display_name=None, metadata=None):
+        """Add a model entry (relpath is like image1/image1.ply)
+
+        metadata: optional dict from convert.model_metadata (plus 'file_size'), stored as attributes
+        """
+        ud = self.ensure_user(username)
+        idx = self.index_path(username)
+        with self.index_lock(username):
             tree = ET.parse(idx)
             root = tree.getroot()
+            # avoid duplicates
             for m in root.findall('model'):
-                path = m.get('path')
-                name = m.get('name') or os.path.basename(path)
-                url = m.get('url')
-                time = m.get('time')  # 新记录有值，旧记录为None
-                models.append({'relpath': path, 'name': name, 'url': url, 'time': time})
-        except ET.ParseError:
-            return []
-        return models
+                if m.get('path') == relpath:
+                    return
+            el = ET.SubElement(root, 'model')
+            el.set('path', relpath)
 
-    def add_model(self, username, relpath, model_url, display_name=None):
-        """Add a model entry (relpath is like image1/image1.ply)"""
-        ud = self.ensure_user(username)
+            #增加一个下载地址
+            el.set('url', model_url)
+
+            #增加创建时间
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            el.set('time', current_time)
+
+            if display_name:
+                el.set('name', display_name)
+
+            for key, value in self._metadata_attrs(metadata or {}).items():
+                el.set(key, value)
+
+            self._write_index(tree, idx)
+
+    def update_model(self, username, relpath, **attrs):
+        """Set attributes on an existing index entry (None removes one); returns False if relpath is not indexed"""
         idx = self.index_path(username)
-        tree = ET.parse(idx)
-        root = tree.getroot()
-        # avoid duplicates
-        for m in root.findall('model'):
-            if m.get('path') == relpath:
-                return
-        el = ET.SubElement(root, 'model')
-        el.set('path', relpath)
-        
-        #增加一个下载地址
-        el.set('url', model_url)
-        
-        #增加创建时间 
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        el.set('time', current_time)
-        
-        if display_name:
-            el.set('name', display_name)
-            
-        tree.write(idx, encoding='utf-8', xml_declaration=True)
+        if not os.path.exists(idx):
+            return False
+        with self.index_lock(username):
+            tree = ET.parse(idx)
+            for m in tree.getroot().findall('model'):
+                if m.get('path') == relpath:
+                    for key, value in attrs.items():
+                        if value is None:
+                            m.attrib.pop(key, None)
+                        else:
+                            m.set(key, str(value))
+                    self._write_index(tree, idx)
+                    return True
+        return False
 
     def remove_model(self, username, relpath):
         idx = self.index_path(username)
         if not os.path.exists(idx):
             return False
-        tree = ET.parse(idx)
-        root = tree.getroot()
-        removed = False
-        for m in root.findall('model'):
-            if m.get('path') == relpath:
-                root.remove(m)
-                removed = True
-        if removed:
-            tree.write(idx, encoding='utf-8', xml_declaration=True)
+        with self.index_lock(username):
+            tree = ET.parse(idx)
+            root = tree.getroot()
+            removed = False
+            for m in root.findall('model'):
+                if m.get('path') == relpath:
+                    root.remove(m)
+                    removed = True
+            if removed:
+                self._write_index(tree, idx)
+        return removed
+
+    def remove_models(self, username, relpaths):
+        """Remove the entries of several relpaths in one index write; returns the number removed"""
+        idx = self.index_path(username)
+        if not os.path.exists(idx):
+            return 0
+        relpaths = set(relpaths)
+        with self.index_lock(username):
+            tree = ET.parse(idx)
+            root = tree.getroot()
+            removed = 0
+            for m in root.findall('model'):
+                if m.get('path') in relpaths:
+                    root.remove(m)
+                    removed += 1
+            if removed:
+                self._write_index(tree, idx)
+        return removed
+
+    def remove_models_under(self, username, relpath):
+        """Remove every index entry equal to relpath or under the folder relpath, in one write.
+        Returns the removed entries' attributes (for restore_models).
+        """
+        idx = self.index_path(username)
+        if not os.path.exists(idx):
+            return []
+        prefix = relpath.rstrip('/') + '/'
+        removed = []
+        with self.index_lock(username):
+            tree = ET.parse(idx)
+            root = tree.getroot()
+            for m in root.findall('model'):
+                path = m.get('path') or ''
+                if path == relpath or path.startswith(prefix):
+                    root.remove(m)
+                    removed.append(dict(m.attrib))
+            if removed:
+                self._write_index(tree, idx)
         return removed
 
+    def restore_models(self, username, entries):
+        """Re-add index entries removed by remove_models_under (attributes kept as-is)"""
+        self.ensure_user(username)
+        idx = self.index_path(username)
+        with self.index_lock(username):
+            tree = ET.parse(idx)
+            root = tree.getroot()
+            existing = {m.get('path') for m in root.findall('model')}
+            for attrib in entries:
+                if attrib.get('path') not in existing:
+                    ET.SubElement(root, 'model', attrib)
+            self._write_index(tree, idx)
+
+    @staticmethod
+    def _ancestor(path, relpaths):
+        """The member of relpaths equal to path or a folder containing it, None if there is none"""
+        if path in relpaths:
+            return path
+        parts = path.split('/')
+        for i in range(len(parts) - 1, 0, -1):
+            prefix = '/'.join(parts[:i])
+            if prefix in relpaths:
+                return prefix
+        return None
+
+    def _relocate(self, m, moves):
+        """Point an index element at its moved path; url and preview follow, other attributes are kept"""
+        old = m.get('path')
+        prefix = self._ancestor(old, moves)
+        new = moves[prefix] + old[len(prefix):]
+        m.set('path', new)
+        url = m.get('url') or ''
+        quoted = urllib.parse.quote(old, safe='')
+        if url.endswith('=' + quoted):
+            m.set('url', url[:-len(quoted)] + urllib.parse.quote(new, safe=''))
+        preview = m.get('preview')
+        if preview and self._ancestor(preview, moves) is not None:
+            preview_prefix = self._ancestor(preview, moves)
+            m.set('preview', moves[preview_prefix] + preview[len(preview_prefix):])
+
+    def update_index(self, username, remove_under=(), moves=None):
+        """Apply several removals and moves to the index in one write.
+
+        remove_under: relpaths whose entries (equal to it or under the folder) are dropped
+        moves: {old_relpath: new_relpath} of files / folders already moved on disk
+        Returns {relpath: [removed entries' attributes]} for every relpath in remove_under.
+        """
+        removed = {relpath: [] for relpath in remove_under}
+        moves = moves or {}
+        idx = self.index_path(username)
+        if not os.path.exists(idx) or not (removed or moves):
+            return removed
+        with self.index_lock(username):
+            tree = ET.parse(idx)
+            root = tree.getroot()
+            changed = False
+            for m in root.findall('model'):
+                path = m.get('path') or ''
+                gone = self._ancestor(path, removed)
+                if gone is not None:
+                    root.remove(m)
+                    removed[gone].append(dict(m.attrib))
+                    changed = True
+                elif self._ancestor(path, moves) is not None:
+                    self._relocate(m, moves)
+                    changed = True
+            if changed:
+                self._write_index(tree, idx)
+        return removed
+
+    def trash_dir(self, username):
+        return os.path.join(self.user_dir(username), self.TRASH_NAME)
+
+    def trash_path(self, username, relpath):
+        """Move a model folder (or file) into the user's trash and drop its index entries.
+
+        The move is a single rename on the same filesystem, so it is atomic and
+        constant-time regardless of folder size; the reaper reclaims the space later.
+        Returns the trash id (used by restore_trash).
+        """
+        full = self.get_full_path(username, relpath)
+        if not os.path.lexists(full):
+            raise FileNotFoundError('源文件不存在')
+        relpath = self.user_relpath(username, relpath)
+
+        trash_id = self._move_to_trash(username, full)
+        removed = self.remove_models_under(username, relpath)
+        self._write_trash_manifest(username, trash_id, relpath, removed)
+        self.update_usage(username, relpath)
+        return trash_id
+
+    def _move_to_trash(self, username, full):
+        trash_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        entry_dir = os.path.join(self.trash_dir(username), trash_id)
+        os.makedirs(entry_dir)
+        os.rename(full, os.path.join(entry_dir, os.path.basename(full)))
+        return trash_id
+
+    def _write_trash_manifest(self, username, trash_id, relpath, removed):
+        manifest = {'relpath': relpath, 'deleted_at': time.time(), 'models': removed}
+        with open(os.path.join(self.trash_dir(username), trash_id, self.MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+    def read_trash_manifest(self, username, trash_id):
+        entry_dir = os.path.join(self.trash_dir(username), os.path.basename(trash_id))
+        with open(os.path.join(entry_dir, self.MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+
+    def restore_trash(self, username, trash_id, max_age=None):
+        """Move a trashed folder back to its original place and restore its index entries.
+        Returns the restored relpath; raises FileNotFoundError if already reaped (or
+        older than max_age seconds), FileExistsError if the original path has been reused.
+        """
+        entry_dir = os.path.join(self.trash_dir(username), os.path.basename(trash_id))
+        try:
+            manifest = self.read_trash_manifest(username, trash_id)
+        except (OSError, ValueError):
+            raise FileNotFoundError('回收站中不存在该记录')
+        if max_age is not None and time.time() - manifest.get('deleted_at', 0) > max_age:
+            raise FileNotFoundError('已超过可撤销时间')
+        relpath = manifest['relpath']
+        target = self.get_full_path(username, relpath)
+        if os.path.lexists(target):
+            raise FileExistsError('目标已存在')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(os.path.join(entry_dir, os.path.basename(target)), target)
+        self.restore_models(username, manifest.get('models', []))
+        os.remove(os.path.join(entry_dir, self.MANIFEST_NAME))
+        os.rmdir(entry_dir)
+        self.update_usage(username, relpath)
+        return relpath
+
     def rename_model(self, username, old_relpath, new_base_name):
         """Rename a model file (only change base name, keep extension and folder).
         new_base_name should not include extension.
+        The index entry keeps its url (re-pointed), time and metadata; one index write.
         Returns new_relpath or raises.
         """
         ud = self.user_dir(username)
@@ -112,47 +471,203 @@ class StorageManager:
         if not os.path.exists(old_full):
             raise FileNotFoundError('源文件不存在')
 
-        folder = os.path.dirname(old_full)
-        old_name = os.path.basename(old_full)
-        # preserve extension (supports .ply.gz)
-        lower = old_name.lower()
-        if lower.endswith('.ply.gz'):
-            ext = '.ply.gz'
-            base_old = old_name[:-7]
-        else:
-            base_old, ext = os.path.splitext(old_name)
-
-        new_name = secure_filename(new_base_name) + ext
-        new_full = os.path.join(folder, new_name)
+        new_full = os.path.join(os.path.dirname(old_full), self._renamed(os.path.basename(old_full), new_base_name))
         if os.path.exists(new_full):
             raise FileExistsError('目标已存在')
-        os.rename(old_full, new_full)
-        # update index
-        old_rel = os.path.relpath(old_full, ud).replace('\\', '/')
-        new_rel = os.path.relpath(new_full, ud).replace('\\', '/')
-        self.remove_model(username, old_rel)
-        self.add_model(username, new_rel)
+        moves = self._move_model_file(ud, old_full, new_full)
+        self.update_index(username, moves=moves)
+        new_rel = moves[os.path.relpath(old_full, ud).replace('\\', '/')]
+        self.update_usage(username, new_rel)
         return new_rel
 
+    @staticmethod
+    def _split_ext(name):
+        # preserve extension (supports .ply.gz)
+        if name.lower().endswith('.ply.gz'):
+            return name[:-7], name[-7:]
+        return os.path.splitext(name)
+
+    def _renamed(self, old_name, new_base_name):
+        base = secure_filename(new_base_name)
+        if not base:
+            raise ValueError('非法的文件名')
+        return base + self._split_ext(old_name)[1]
+
+    def _move_model_file(self, ud, old_full, new_full):
+        """Rename a model file and its sidecars (preview, tiles index); returns {old_relpath: new_relpath}"""
+        def rel(full):
+            return os.path.relpath(full, ud).replace('\\', '/')
+
+        os.rename(old_full, new_full)
+        moves = {rel(old_full): rel(new_full)}
+        old_base = os.path.join(os.path.dirname(old_full), self._split_ext(os.path.basename(old_full))[0])
+        new_base = os.path.join(os.path.dirname(new_full), self._split_ext(os.path.basename(new_full))[0])
+        # 预览图、分块索引跟随模型改名
+        for suffix in self.SIDECAR_SUFFIXES:
+            if os.path.exists(old_base + suffix):
+                os.rename(old_base + suffix, new_base + suffix)
+                moves[rel(old_base + suffix)] = rel(new_base + suffix)
+        return moves
+
+    def user_relpath(self, username, relpath):
+        """Normalized relpath inside the user dir that delete / rename / move may touch
+
+        Raises ValueError for the index, usage and lock files, dot-entries (the
+        trash) and model sidecars, which only ever move together with their model.
+        """
+        ud = self.user_dir(username)
+        full = self.get_full_path(username, relpath)
+        rel = os.path.relpath(full, ud).replace('\\', '/')
+        if rel in (self.INDEX_NAME, self.INDEX_LOCK_NAME, USAGE_NAME, USAGE_LOCK_NAME) \
+                or any(part.startswith('.') for part in rel.split('/')) or rel.endswith(self.SIDECAR_SUFFIXES):
+            raise ValueError('非法路径')
+        return rel
+
+    def _plan_batch_op(self, username, op, indexed):
+        """Validate one batch operation; returns (kind, src relpath, dst relpath or None)"""
+        ud = self.user_dir(username)
+        kind = op.get('op')
+        if kind not in ('delete', 'rename', 'move') or not isinstance(op.get('path'), str) or not op['path']:
+            raise ValueError('参数缺失')
+        src = self.user_relpath(username, op['path'])
+        full = os.path.join(ud, src)
+
+        if kind == 'delete':
+            # 与 /manager/delete 相同：模型文件连同所在文件夹删除（用户根目录下的文件只删除自身）
+            if os.path.isdir(full):
+                return kind, src, None
+            known = os.path.isfile(full) or any(self._ancestor(path, {src}) for path in indexed)
+            if not known:
+                raise FileNotFoundError('模型不存在')
+            folder = os.path.dirname(src)
+            # 文件不在原位置（冷存储）时按所在文件夹删除，文件夹也不存在时只移除索引记录
+            return kind, folder if folder and os.path.isdir(os.path.dirname(full)) else src, None
+
+        if kind == 'rename':
+            if not isinstance(op.get('name'), str) or not op['name']:
+                raise ValueError('参数缺失')
+            if not os.path.isfile(full):
+                raise FileNotFoundError('源文件不存在')
+            dst = f"{os.path.dirname(src)}/{self._renamed(os.path.basename(src), op['name'])}".lstrip('/')
+        else:
+            to = op.get('to')
+            if not isinstance(to, str):
+                raise ValueError('参数缺失')
+            if not os.path.lexists(full):
+                raise FileNotFoundError('源文件不存在')
+            folder = self.user_relpath(username, to) if to.strip('/') not in ('', '.') else ''
+            if folder and os.path.lexists(os.path.join(ud, folder)) and not os.path.isdir(os.path.join(ud, folder)):
+                raise ValueError('目标不是文件夹')
+            dst = f"{folder}/{os.path.basename(src)}".lstrip('/')
+            if self._ancestor(dst, {src}) is not None:
+                raise ValueError('不能移动到自身或其子文件夹')
+            if ('/' in dst or os.path.isdir(full)) and dst.split('/')[0] in self.RESERVED_FOLDER_NAMES:
+                raise ValueError('文件夹名称被系统保留')
+        if os.path.lexists(os.path.join(ud, dst)):
+            raise FileExistsError('目标已存在')
+        return kind, src, dst
+
+    def apply_batch(self, username, ops):
+        """Delete / rename / move several models with one index write.
+
+        ops: list of {'op': 'delete', 'path': relpath}
+                      {'op': 'rename', 'path': model relpath, 'name': new base name without extension}
+                      {'op': 'move', 'path': model file or folder relpath, 'to': folder relpath ('' = user root)}
+        Every operation is validated before anything is touched; an invalid one, or one whose source or
+        target overlaps an earlier operation of the batch, fails on its own and the rest still run.
+        Returns one dict per op, in order: {'ok': True, 'path': new relpath} ({'ok': True, 'trashId': id}
+        for deletes) or {'ok': False, 'error': exception} (ValueError, FileNotFoundError, FileExistsError
+        or OSError).
+        """
+        ud = self.user_dir(username)
+        indexed = [entry['relpath'] for entry in self.list_models(username)]
+        results = [None] * len(ops)
+        plans = []
+        claimed = set()
+        for i, op in enumerate(ops):
+            try:
+                kind, src, dst = self._plan_batch_op(username, op if isinstance(op, dict) else {}, indexed)
+                paths = [src] + ([dst] if dst else [])
+                # 同一批次内源路径、目标路径不能相同或互相包含
+                if any(self._ancestor(p, claimed) is not None or any(self._ancestor(c, {p}) for c in claimed)
+                       for p in paths):
+                    raise FileExistsError('与同批次的其他操作冲突')
+            except (ValueError, FileNotFoundError, FileExistsError) as e:
+                results[i] = {'ok': False, 'error': e}
+                continue
+            claimed.update(paths)
+            plans.append((i, kind, src, dst))
+
+        # 文件系统操作逐项执行，失败的项不进入索引
+        moves, trashed = {}, {}
+        for i, kind, src, dst in plans:
+            full = os.path.join(ud, src)
+            try:
+                if kind == 'delete':
+                    trash_id = self._move_to_trash(username, full) if os.path.lexists(full) else None
+                    trashed[src] = trash_id
+                    results[i] = {'ok': True, 'trashId': trash_id}
+                    continue
+                target = os.path.join(ud, dst)
+                if os.path.lexists(target):
+                    raise FileExistsError('目标已存在')
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if os.path.isdir(full):
+                    os.rename(full, target)
+                    moves[src] = dst
+                else:
+                    moves.update(self._move_model_file(ud, full, target))
+                results[i] = {'ok': True, 'path': dst}
+            except OSError as e:
+                logger.exception(f"批量操作失败: {kind} {username}/{src}")
+                results[i] = {'ok': False, 'error': e}
+
+        removed = self.update_index(username, remove_under=list(trashed), moves=moves)
+        for src, trash_id in trashed.items():
+            if trash_id is not None:
+                self._write_trash_manifest(username, trash_id, src, removed[src])
+        for folder in {UsageStore.folder_key(p) for p in list(trashed) + list(moves) + list(moves.values())}:
+            self.update_usage(username, folder)
+        return results
+
     def save_image(self, username, file_storage, original_name):
         """Save uploaded FileStorage into a new image-folder under user dir.
         Returns (folder_relpath, image_filename, image_fullpath)
         """
         ud = self.ensure_user(username)
         orig = original_name; #secure_filename(file_storage.filename)
-        base = os.path.splitext(orig)[0]
+        folder = self._new_image_folder(ud, orig)
+        image_path = os.path.join(folder, orig)
+        file_storage.save(image_path)
+        rel_folder = os.path.relpath(folder, ud).replace('\\', '/')
+        self.update_usage(username, rel_folder)
+        return rel_folder, orig, image_path
+
+    def save_upload(self, username, src_path, original_name):
+        """Move a file on the same filesystem (completed resumable upload, video keyframe) into a new
+        image-folder, like save_image.
+        Returns (folder_relpath, filename, fullpath)
+        """
+        ud = self.ensure_user(username)
+        folder = self._new_image_folder(ud, original_name)
+        path = os.path.join(folder, original_name)
+        os.replace(src_path, path)
+        rel_folder = os.path.relpath(folder, ud).replace('\\', '/')
+        self.update_usage(username, rel_folder)
+        return rel_folder, original_name, path
+
+    @classmethod
+    def _new_image_folder(cls, ud, original_name):
+        base = os.path.splitext(original_name)[0]
         # create unique folder name
         folder_name = secure_filename(base)
         folder = os.path.join(ud, folder_name)
         i = 1
-        while os.path.exists(folder):
+        while os.path.exists(folder) or os.path.basename(folder) in cls.RESERVED_FOLDER_NAMES:
             folder = os.path.join(ud, f"{folder_name}_{i}")
             i += 1
         os.makedirs(folder, exist_ok=True)
-        image_path = os.path.join(folder, orig)
-        file_storage.save(image_path)
-        rel_folder = os.path.relpath(folder, ud).replace('\\', '/')
-        return rel_folder, orig, image_path
+        return folder
 
     def get_full_path(self, username, relpath):
         ud = self.user_dir(username)
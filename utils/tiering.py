@@ -0,0 +1,316 @@
+"""Cold-storage tiering of models that have not been viewed for a long time.
+
+A model whose last access is older than COLD_AFTER_DAYS is gzip-compressed to
+`COLD_DIR/<user>/<relpath>.gz` (COLD_DIR may be a slower disk) and its PLY is
+removed from the user's folder.  The index entry keeps its metadata and gets
+`tier="cold"` plus `cold_size`; the preview and the tiles index stay in place.
+
+- Access times live in the index (`accessed`, epoch seconds) and are written at
+  most once per ACCESS_TOUCH_INTERVAL per model by serve_model / serve_tiles, so
+  neither filesystem atime nor a write per request is needed.  Entries without
+  `accessed` fall back to their creation `time`, then to the file mtime.  Only
+  the primary (manager role) records accesses or thaws; a read-only storage
+  replica streams cold models with `open_cold` and leaves its copy untouched.
+- `thaw_model` restores the PLY on first access.  It holds an flock on the cold
+  file, so concurrent requests (in any gunicorn worker) decompress once and the
+  others find the hot file when they get the lock.  `open_cold` instead streams
+  the decompressed bytes without restoring.
+- `freeze_model` writes the cold copy first, then marks the index, then removes
+  the PLY; it gives up if the model changes meanwhile (re-conversion, rename).
+- `ColdTierer` scans all users every COLD_SCAN_INTERVAL, oldest models first,
+  throttled to COLD_BYTES_PER_SEC; across gunicorn workers only the holder of
+  a non-blocking flock on `DATA_DIR/.tiering.lock` runs.
+
+    python -m utils.tiering --dry-run
+    python -m utils.tiering --days 30 --user alice
+    python -m utils.tiering --thaw alice 20160915_IMG_0078/20160915_IMG_0078.ply
+"""
+
+import fcntl
+import gzip
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+COLD_TIER = 'cold'
+COLD_SUFFIX = '.gz'
+LOCK_NAME = '.tiering.lock'
+_CHUNK = 1024 * 1024
+
+
+def cold_path(cold_dir, username, relpath):
+    """Location of a model's compressed copy; raises ValueError for paths outside cold_dir/username"""
+    base = os.path.abspath(os.path.join(str(cold_dir), username))
+    full = os.path.abspath(os.path.join(base, relpath + COLD_SUFFIX))
+    if not full.startswith(base + os.sep):
+        raise ValueError('非法路径')
+    return full
+
+
+def is_cold(entry):
+    return bool(entry) and entry.get('tier') == COLD_TIER
+
+
+def last_access(entry, hot_path=None):
+    """Epoch seconds of the last recorded access (index `accessed`, else creation `time`, else mtime)"""
+    if entry.get('accessed'):
+        return entry['accessed']
+    if entry.get('time'):
+        try:
+            return datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S').timestamp()
+        except ValueError:
+            pass
+    if hot_path:
+        try:
+            return os.stat(hot_path).st_mtime
+        except OSError:
+            pass
+    return None
+
+
+def touch_model(sm, username, entry, interval, now=None):
+    """Record an access in the index if the recorded one is older than interval seconds; never raises"""
+    if not entry or not interval:
+        return False
+    now = time.time() if now is None else now
+    if entry.get('accessed') and now - entry['accessed'] < interval:
+        return False
+    try:
+        return sm.update_model(username, entry['relpath'], accessed=int(now))
+    except Exception:
+        logger.exception('记录模型访问时间失败')
+        return False
+
+
+def _copy(src, dst, throttle=None):
+    while True:
+        chunk = src.read(_CHUNK)
+        if not chunk:
+            return
+        dst.write(chunk)
+        if throttle is not None:
+            throttle.consume(nbytes=len(chunk))
+
+
+def freeze_model(sm, cold_dir, username, relpath, level=6, throttle=None):
+    """Move one model to the cold tier; returns (size, compressed_size), or None if it changed or vanished"""
+    hot = sm.get_full_path(username, relpath)
+    cold = cold_path(cold_dir, username, relpath)
+    before = os.stat(hot)
+    os.makedirs(os.path.dirname(cold), exist_ok=True)
+    tmp = f"{cold}.{os.getpid()}.tmp"
+    try:
+        with open(hot, 'rb') as src, open(tmp, 'wb') as raw:
+            with gzip.GzipFile(filename=os.path.basename(hot), mode='wb', fileobj=raw, compresslevel=level,
+                               mtime=0) as dst:
+                _copy(src, dst, throttle)
+            raw.flush()
+            os.fsync(raw.fileno())
+        if _changed(hot, before):
+            return None
+        os.replace(tmp, cold)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    compressed = os.path.getsize(cold)
+    if not sm.update_model(username, relpath, tier=COLD_TIER, cold_size=compressed):
+        os.remove(cold)
+        return None
+    # 更新索引期间模型被改写（重转换 / 改名）时撤销
+    if _changed(hot, before):
+        sm.update_model(username, relpath, tier=None, cold_size=None)
+        os.remove(cold)
+        return None
+    os.remove(hot)
+    sm.update_usage(username, relpath)
+    return before.st_size, compressed
+
+
+def _changed(path, before):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return True
+    return (st.st_size, st.st_mtime_ns, st.st_ino) != (before.st_size, before.st_mtime_ns, before.st_ino)
+
+
+def thaw_model(sm, cold_dir, username, relpath):
+    """Restore a cold model to its folder (no-op if the PLY is already there); returns the hot path.
+
+    Raises FileNotFoundError if neither the PLY nor a cold copy exists.
+    """
+    hot = sm.get_full_path(username, relpath)
+    cold = cold_path(cold_dir, username, relpath)
+    try:
+        f = open(cold, 'rb')
+    except FileNotFoundError:
+        if os.path.isfile(hot):
+            return hot
+        raise
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        # 等锁期间其他请求可能已经恢复完成
+        if os.path.isfile(hot):
+            return hot
+        started = time.monotonic()
+        tmp = os.path.join(os.path.dirname(hot), f".{os.path.basename(hot)}.thaw{os.getpid()}")
+        try:
+            with gzip.GzipFile(fileobj=f, mode='rb') as src, open(tmp, 'wb') as dst:
+                _copy(src, dst)
+            os.replace(tmp, hot)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        sm.update_model(username, relpath, tier=None, cold_size=None, accessed=int(time.time()))
+        os.remove(cold)
+    sm.update_usage(username, relpath)
+    logger.info(f"冷存储模型已恢复: {username}/{relpath}，耗时 {time.monotonic() - started:.2f}s")
+    return hot
+
+
+def open_cold(cold_dir, username, relpath):
+    """Readable file object with the decompressed PLY of a cold model (for streaming without restoring)"""
+    return gzip.open(cold_path(cold_dir, username, relpath), 'rb')
+
+
+def iter_cold(cold_dir, username, relpath, chunk_size=_CHUNK):
+    """Generator over the decompressed bytes; the cold file is opened before returning (FileNotFoundError)"""
+    f = open_cold(cold_dir, username, relpath)
+
+    def generate():
+        with f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    return generate()
+
+
+class ColdTierer:
+    """Moves models not accessed for after_days into the cold tier, every interval seconds
+
+    Args:
+        data_dir: DATA_DIR
+        cold_dir: COLD_DIR
+        after_days: idle days before a model is frozen
+        interval: seconds between scans
+        bytes_per_sec: read budget while compressing (0 = unlimited)
+        level: gzip compression level
+    """
+
+    def __init__(self, data_dir, cold_dir, after_days=90, interval=6 * 3600, bytes_per_sec=0, level=6):
+        from utils.storage import StorageManager
+
+        self.data_dir = str(data_dir)
+        self.cold_dir = str(cold_dir)
+        self.after_days = after_days
+        self.interval = interval
+        self.bytes_per_sec = bytes_per_sec
+        self.level = level
+        self.sm = StorageManager(self.data_dir)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name='cold-tierer', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('冷存储分层失败')
+
+    def candidates(self, users=None, now=None):
+        """[(last_access, username, relpath)] of hot .ply models idle longer than after_days, oldest first"""
+        cutoff = (time.time() if now is None else now) - self.after_days * 86400
+        found = []
+        for username in users or self.sm.usage.users():
+            for entry in self.sm.list_models(username):
+                relpath = entry['relpath']
+                if is_cold(entry) or not relpath.lower().endswith('.ply'):
+                    continue
+                try:
+                    hot = self.sm.get_full_path(username, relpath)
+                except ValueError:
+                    continue
+                accessed = last_access(entry, hot)
+                if accessed is not None and accessed < cutoff and os.path.isfile(hot):
+                    found.append((accessed, username, relpath))
+        found.sort()
+        return found
+
+    def run_once(self, users=None):
+        """One pass; returns {'frozen', 'skipped', 'failed', 'bytes', 'cold_bytes'} (None if another process runs)"""
+        from utils.reaper import _Throttle
+
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(os.path.join(self.data_dir, LOCK_NAME), 'a+') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            throttle = _Throttle(self.bytes_per_sec, 0)
+            stats = {'frozen': 0, 'skipped': 0, 'failed': 0, 'bytes': 0, 'cold_bytes': 0}
+            for _accessed, username, relpath in self.candidates(users):
+                try:
+                    result = freeze_model(self.sm, self.cold_dir, username, relpath, self.level, throttle)
+                except (OSError, ValueError):
+                    logger.exception(f"模型移入冷存储失败: {username}/{relpath}")
+                    stats['failed'] += 1
+                    continue
+                if result is None:
+                    stats['skipped'] += 1
+                    continue
+                stats['frozen'] += 1
+                stats['bytes'] += result[0]
+                stats['cold_bytes'] += result[1]
+            if stats['frozen']:
+                logger.info(f"冷存储分层：移入 {stats['frozen']} 个模型，"
+                            f"{stats['bytes'] / 1024 / 1024:.1f} MB -> {stats['cold_bytes'] / 1024 / 1024:.1f} MB")
+            return stats
+
+
+def main(argv=None):
+    import argparse
+    from config import Config
+
+    ap = argparse.ArgumentParser(description='Move idle models to the cold tier, or restore one')
+    ap.add_argument('--data-dir', default=str(Config.DATA_DIR))
+    ap.add_argument('--cold-dir', default=str(Config.COLD_DIR))
+    ap.add_argument('--days', type=float, default=Config.COLD_AFTER_DAYS, help='Idle days before freezing')
+    ap.add_argument('--user', action='append', help='Only these users (repeatable)')
+    ap.add_argument('--bytes-per-sec', type=int, default=Config.COLD_BYTES_PER_SEC)
+    ap.add_argument('--dry-run', action='store_true', help='Only list the models that would be frozen')
+    ap.add_argument('--thaw', nargs=2, metavar=('USER', 'RELPATH'), help='Restore one model and exit')
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    tierer = ColdTierer(args.data_dir, args.cold_dir, after_days=args.days, bytes_per_sec=args.bytes_per_sec,
+                        level=Config.COLD_COMPRESS_LEVEL)
+    if args.thaw:
+        print(thaw_model(tierer.sm, args.cold_dir, *args.thaw))
+        return 0
+    if args.dry_run:
+        for accessed, username, relpath in tierer.candidates(args.user):
+            print(f"{time.strftime('%Y-%m-%d', time.localtime(accessed))}  {username}/{relpath}")
+        return 0
+    stats = tierer.run_once(args.user)
+    if stats is None:
+        print('another tiering run holds the lock')
+        return 1
+    print(stats)
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -3,7 +3,6 @@ import jwt
 import datetime
 import os
 from dotenv import load_dotenv
-import bcrypt
 
 from config import Config
 
@@ -40,6 +39,7 @@ def verify_jwt(token):
     
 def hash_password(plain_password):
     """明文密码加密（加盐哈希）"""
+    import bcrypt  # 延迟导入，避免拖慢 worker 启动
     # 生成盐值 + 哈希
     salt = bcrypt.gensalt()
     password_hash = bcrypt.hashpw(plain_password.encode('utf-8'), salt)
@@ -47,6 +47,7 @@ def hash_password(plain_password):
 
 def verify_password(plain_password, password_hash):
     """验证明文密码是否匹配加密密码"""
+    import bcrypt
     return bcrypt.checkpw(
         plain_password.encode('utf-8'),
         password_hash.encode('utf-8')
@@ -0,0 +1,158 @@
+"""Lightweight per-task span tracing.
+
+Spans are written as JSON lines to `TRACE_DIR/<task_id>.jsonl`, one file per task,
+so `/sharp/trace/<task_id>` can read a task's timeline without scanning a shared log.
+
+    with tracing.bind_task(task_id, user):     # sets the current task for this thread
+        with tracing.span('convert', file=path):
+            ...
+    tracing.record_span(task_id, 'queue_wait', enqueued_at, time.time())
+
+`TaskIdFilter` adds `record.task_id` and `record.user` to log records so log lines
+emitted inside `bind_task` (or a logged-in request) can be correlated with the trace.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+_current_task = ContextVar('qs_task_id', default=None)
+_current_user = ContextVar('qs_user', default=None)
+_write_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def current_task_id():
+    return _current_task.get()
+
+
+@contextmanager
+def bind_task(task_id, user=None):
+    token = _current_task.set(task_id)
+    user_token = _current_user.set(user)
+    try:
+        yield
+    finally:
+        _current_user.reset(user_token)
+        _current_task.reset(token)
+
+
+def _request_user():
+    try:
+        from flask import g, has_request_context
+    except ImportError:
+        return None
+    return getattr(g, 'username', None) if has_request_context() else None
+
+
+class TaskIdFilter(logging.Filter):
+    """Adds record.task_id and record.user ('-' outside of a task / logged-in request)"""
+
+    def filter(self, record):
+        if not hasattr(record, 'task_id'):
+            record.task_id = _current_task.get() or '-'
+        if not hasattr(record, 'user'):
+            record.user = _current_user.get() or _request_user() or '-'
+        return True
+
+
+def _trace_dir():
+    from config import Config
+    return str(Config.TRACE_DIR)
+
+
+def _trace_path(task_id):
+    return os.path.join(_trace_dir(), f"{os.path.basename(str(task_id))}.jsonl")
+
+
+def _cleanup(directory):
+    """Drop trace files older than TRACE_RETENTION_DAYS (at most once per hour)"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < 3600:
+        return
+    _last_cleanup = now
+    from config import Config
+    cutoff = now - Config.TRACE_RETENTION_DAYS * 86400
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.endswith('.jsonl') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+    except OSError:
+        logger.exception('清理过期 trace 文件失败')
+
+
+def write_spans(task_id, spans):
+    """Append already-built span dicts (e.g. returned by a remote worker)"""
+    if not task_id or not spans:
+        return
+    directory = _trace_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        lines = ''.join(json.dumps(s, ensure_ascii=False) + '\n' for s in spans)
+        with _write_lock, open(_trace_path(task_id), 'a', encoding='utf-8') as f:
+            f.write(lines)
+        _cleanup(directory)
+    except OSError:
+        logger.exception('写入 trace 失败')
+
+
+def record_span(task_id, name, start, end, status='ok', **attrs):
+    """Record a span measured elsewhere (start/end are time.time() values)"""
+    task_id = task_id or _current_task.get()
+    if not task_id:
+        return
+    span_data = {
+        'task_id': task_id,
+        'name': name,
+        'start': round(start, 6),
+        'end': round(end, 6),
+        'duration': round(end - start, 6),
+        'status': status,
+        'pid': os.getpid(),
+        'thread': threading.current_thread().name,
+    }
+    # 每个 span 都记录所属用户，/sharp/trace 据此校验归属（不依赖某个特定 span 存在）
+    user = _current_user.get() or _request_user()
+    if user:
+        span_data['user'] = user
+    if attrs:
+        span_data['attrs'] = attrs
+    write_spans(task_id, [span_data])
+
+
+@contextmanager
+def span(name, task_id=None, **attrs):
+    """Time a block as a span of the current (or given) task; yields a dict for extra attrs"""
+    start = time.time()
+    extra = dict(attrs)
+    status = 'ok'
+    try:
+        yield extra
+    except BaseException as e:
+        status = 'error'
+        extra['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record_span(task_id, name, start, time.time(), status, **extra)
+
+
+def read_trace(task_id):
+    """All spans of a task ordered by start time"""
+    try:
+        with open(_trace_path(task_id), encoding='utf-8') as f:
+            spans = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError):
+        logger.exception('读取 trace 失败')
+        return []
+    spans.sort(key=lambda s: s['start'])
+    return spans
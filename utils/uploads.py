@@ -0,0 +1,243 @@
+"""Resumable (tus-style) chunked uploads.
+
+A large video or image sent over a mobile network no longer restarts from zero
+when the connection drops, and no single request exceeds nginx's body limit:
+
+    POST   /sharp/uploads                  {filename, size, originalName?, lane?} -> uploadId, offset 0
+    HEAD   /sharp/uploads/<id>             Upload-Offset / Upload-Length headers (GET also returns JSON)
+    PATCH  /sharp/uploads/<id>             Upload-Offset header + raw bytes -> new offset
+                                           (PUT is accepted too: wx.request has no PATCH)
+    POST   /sharp/uploads/<id>/complete    file moved into a new folder; an image is queued for reconstruction,
+                                           a video goes through keyframe selection first (keyframes.py)
+    DELETE /sharp/uploads/<id>             abort
+
+Sessions live on disk under `UPLOAD_DIR/<user>/<upload_id>/` (`info.json` +
+`data`), so any gunicorn worker can take any chunk.  The offset is the size of
+`data`; an append holds a non-blocking flock on it and is rejected with the
+current offset when its Upload-Offset does not match (a retried chunk that did
+land, or two clients on one session).  Bytes of a chunk interrupted midway stay
+written and the client resumes from the reported offset.  The request body is
+copied in UPLOAD_VIDEO_CHUNK_SIZE blocks with unbuffered writes.
+
+An open session reserves its declared size against the user's quota when it is
+created (`reserved_bytes`), so parallel sessions cannot add up past the quota.
+
+`UploadCollector` removes sessions without a write for UPLOAD_SESSION_TTL;
+across gunicorn workers only the holder of a non-blocking flock on
+`UPLOAD_DIR/.collector.lock` runs.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+INFO_NAME = 'info.json'
+DATA_NAME = 'data'
+LOCK_NAME = '.collector.lock'
+COMPLETING_SUFFIX = '.completing'
+_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+_DIR_PATTERN = re.compile(r'[0-9a-f]{32}(\.completing)?')
+
+
+class OffsetMismatch(ValueError):
+    """Upload-Offset is not the session's current offset (or another append is running)"""
+
+    def __init__(self, offset):
+        super().__init__(f"偏移量不一致，当前为 {offset}")
+        self.offset = offset
+
+
+class UploadStore:
+    """Upload sessions under base_dir/<username>/<upload_id>/
+
+    Args:
+        base_dir: UPLOAD_DIR (on the same filesystem as DATA_DIR, so completing is a rename)
+        buffer_size: bytes read from the request stream per write
+    """
+
+    def __init__(self, base_dir, buffer_size=1024 * 1024):
+        self.base_dir = str(base_dir)
+        self.buffer_size = buffer_size
+
+    def session_dir(self, username, upload_id):
+        if not _ID_PATTERN.fullmatch(upload_id or ''):
+            raise FileNotFoundError('上传会话不存在')
+        return os.path.join(self.base_dir, username, upload_id)
+
+    def data_path(self, username, upload_id):
+        return os.path.join(self.session_dir(username, upload_id), DATA_NAME)
+
+    def sessions(self, username):
+        try:
+            return [name for name in os.listdir(os.path.join(self.base_dir, username)) if _ID_PATTERN.fullmatch(name)]
+        except FileNotFoundError:
+            return []
+
+    def reserved_bytes(self, username):
+        """Declared Upload-Length of the user's open sessions (counted against the quota at create time)"""
+        total = 0
+        for upload_id in self.sessions(username):
+            try:
+                total += self.info(username, upload_id)['size']
+            except FileNotFoundError:
+                continue  # 并发完成或被清理
+        return total
+
+    def create(self, username, filename, size, **extra):
+        """Start a session for size bytes; returns its info (with 'uploadId' and 'offset')"""
+        upload_id = uuid.uuid4().hex
+        path = self.session_dir(username, upload_id)
+        os.makedirs(path)
+        info = dict(extra, uploadId=upload_id, username=username, filename=filename, size=int(size),
+                    created=time.time())
+        with open(os.path.join(path, INFO_NAME), 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False)
+        open(os.path.join(path, DATA_NAME), 'wb').close()
+        info['offset'] = 0
+        return info
+
+    def info(self, username, upload_id):
+        """Session info plus the current 'offset'; raises FileNotFoundError for unknown / collected sessions"""
+        path = self.session_dir(username, upload_id)
+        try:
+            with open(os.path.join(path, INFO_NAME), encoding='utf-8') as f:
+                info = json.load(f)
+            info['offset'] = os.path.getsize(os.path.join(path, DATA_NAME))
+        except (FileNotFoundError, ValueError):
+            raise FileNotFoundError('上传会话不存在')
+        return info
+
+    def append(self, username, upload_id, offset, stream, length=None):
+        """Append the bytes of stream at offset; returns the new offset.
+
+        Raises OffsetMismatch if offset is not the current one, ValueError if the
+        chunk would go past the declared size.
+        """
+        info = self.info(username, upload_id)
+        with open(self.data_path(username, upload_id), 'ab', buffering=0) as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise OffsetMismatch(os.fstat(f.fileno()).st_size)
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise OffsetMismatch(current)
+            remaining = info['size'] - current
+            if length is not None and length > remaining:
+                raise ValueError('超出声明的文件大小')
+            while remaining > 0:
+                block = stream.read(min(self.buffer_size, remaining))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+            if remaining == 0 and stream.read(1):
+                # 未声明长度（chunked）且超出文件大小：撤销本次写入
+                os.ftruncate(f.fileno(), current)
+                raise ValueError('超出声明的文件大小')
+            return info['size'] - remaining
+
+    def finish(self, username, upload_id):
+        """Claim a fully received session for completion; returns (info, data path).
+
+        The session directory is renamed to `<id>.completing`, so a concurrent
+        or retried completion gets FileNotFoundError instead of a second copy.
+        Raises ValueError if bytes are missing.  Follow with remove(), or
+        release() if the file could not be stored.
+        """
+        info = self.info(username, upload_id)
+        if info['offset'] != info['size']:
+            raise ValueError(f"文件未上传完整：{info['offset']}/{info['size']}")
+        path = self.session_dir(username, upload_id)
+        os.rename(path, path + COMPLETING_SUFFIX)
+        return info, os.path.join(path + COMPLETING_SUFFIX, DATA_NAME)
+
+    def release(self, username, upload_id):
+        """Undo finish() so the client can retry the completion"""
+        path = self.session_dir(username, upload_id)
+        try:
+            os.rename(path + COMPLETING_SUFFIX, path)
+        except OSError:
+            logger.exception(f"恢复上传会话失败: {username}/{upload_id}")
+
+    def remove(self, username, upload_id):
+        path = self.session_dir(username, upload_id)
+        for candidate in (path, path + COMPLETING_SUFFIX):
+            shutil.rmtree(candidate, ignore_errors=True)
+
+    def last_activity(self, path):
+        """Latest mtime of a session directory's files (None if it vanished)"""
+        try:
+            latest = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        for name in (INFO_NAME, DATA_NAME):
+            try:
+                latest = max(latest, os.stat(os.path.join(path, name)).st_mtime)
+            except FileNotFoundError:
+                continue
+        return latest
+
+
+class UploadCollector:
+    """Removes upload sessions idle for more than ttl seconds, every interval seconds"""
+
+    def __init__(self, store, ttl=24 * 3600, interval=3600):
+        self.store = store
+        self.ttl = ttl
+        self.interval = interval
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name='upload-collector', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('清理上传会话失败')
+
+    def run_once(self, now=None):
+        """Remove expired sessions; returns (sessions, bytes) removed, None if another process runs"""
+        base = self.store.base_dir
+        os.makedirs(base, exist_ok=True)
+        cutoff = (time.time() if now is None else now) - self.ttl
+        with open(os.path.join(base, LOCK_NAME), 'a+') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            removed = freed = 0
+            for username in os.listdir(base):
+                user_dir = os.path.join(base, username)
+                if username.startswith('.') or not os.path.isdir(user_dir):
+                    continue
+                # 包括完成过程中崩溃遗留的 .completing 目录
+                for name in os.listdir(user_dir):
+                    if not _DIR_PATTERN.fullmatch(name):
+                        continue
+                    path = os.path.join(user_dir, name)
+                    activity = self.store.last_activity(path)
+                    if activity is None or activity >= cutoff:
+                        continue
+                    try:
+                        freed += os.path.getsize(os.path.join(path, DATA_NAME))
+                    except OSError:
+                        pass
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+            if removed:
+                logger.info(f"已清理 {removed} 个过期上传会话，释放 {freed / 1024 / 1024:.1f} MB")
+            return removed, freed
@@ -0,0 +1,217 @@
+"""Per-user storage accounting, kept next to the model index.
+
+`DATA_DIR/<username>/usage.json` holds the user's totals plus a per-folder
+breakdown:
+
+    {"bytes": 123, "files": 4, "updated": ..., "reconciled": ...,
+     "folders": {"imageFolder1": [bytes, files], ...}}
+
+Writers never walk the whole user dir: each operation rescans only the image
+folder it touched (a handful of files) and applies the difference to the
+totals under an flock on `usage.lock`.  `reconcile` walks everything with
+os.scandir to correct drift (e.g. files changed outside the app); the manager
+role runs it periodically.  Trash (`.trash`) and the top-level metadata files
+are not counted.
+
+    python -m utils.usage              # usage of all users
+    python -m utils.usage --reconcile  # full walk first
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+USAGE_NAME = 'usage.json'
+LOCK_NAME = 'usage.lock'
+
+
+def scan_tree(path):
+    """(bytes, files) of all regular files below path, using os.scandir"""
+    total_bytes = 0
+    total_files = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total_bytes += entry.stat(follow_symlinks=False).st_size
+                            total_files += 1
+                    except FileNotFoundError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return total_bytes, total_files
+
+
+class UsageStore:
+    """Reads and updates usage.json files under data_dir"""
+
+    def __init__(self, data_dir, skip_names=('.trash',)):
+        self.data_dir = str(data_dir)
+        self.skip_names = set(skip_names)
+
+    def user_dir(self, username):
+        return os.path.abspath(os.path.join(self.data_dir, username))
+
+    def _path(self, username):
+        return os.path.join(self.user_dir(username), USAGE_NAME)
+
+    @contextmanager
+    def _locked(self, username):
+        os.makedirs(self.user_dir(username), exist_ok=True)
+        with open(os.path.join(self.user_dir(username), LOCK_NAME), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self, username):
+        try:
+            with open(self._path(username), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault('bytes', 0)
+        data.setdefault('files', 0)
+        data.setdefault('folders', {})
+        return data
+
+    def _write(self, username, data):
+        data['updated'] = time.time()
+        path = self._path(username)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def folder_key(relpath):
+        """Top-level image folder a relpath belongs to"""
+        return relpath.replace('\\', '/').strip('/').split('/')[0]
+
+    def set_folder(self, username, folder, usage):
+        """Record (bytes, files) for one image folder (None removes it) and adjust the totals"""
+        if not folder:
+            return
+        with self._locked(username):
+            data = self.read(username)
+            old_bytes, old_files = data['folders'].pop(folder, (0, 0))
+            new_bytes, new_files = usage or (0, 0)
+            if usage is not None:
+                data['folders'][folder] = [new_bytes, new_files]
+            data['bytes'] = max(0, data['bytes'] + new_bytes - old_bytes)
+            data['files'] = max(0, data['files'] + new_files - old_files)
+            self._write(username, data)
+
+    def rescan_folder(self, username, folder):
+        """Re-measure one image folder (cheap: only that folder is walked)"""
+        if not folder:
+            return
+        full = os.path.join(self.user_dir(username), folder)
+        self.set_folder(username, folder, scan_tree(full) if os.path.isdir(full) else None)
+
+    def check_quota(self, username, incoming_bytes=0, incoming_files=1):
+        """True if the user may store incoming_bytes more (quota 0 = unlimited)"""
+        from config import Config
+        data = self.read(username)
+        if Config.USER_QUOTA_BYTES and data['bytes'] + incoming_bytes > Config.USER_QUOTA_BYTES:
+            return False
+        if Config.USER_QUOTA_FILES and data['files'] + incoming_files > Config.USER_QUOTA_FILES:
+            return False
+        return True
+
+    def reconcile(self, username):
+        """Full scandir walk of one user; rewrites usage.json and returns the byte drift corrected"""
+        ud = self.user_dir(username)
+        # 在锁内遍历，避免遍历期间的增量更新被覆盖（只阻塞该用户自己的写操作）
+        with self._locked(username):
+            folders = {}
+            with os.scandir(ud) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False) and entry.name not in self.skip_names:
+                        folders[entry.name] = list(scan_tree(entry.path))
+            data = self.read(username)
+            total_bytes = sum(b for b, _f in folders.values())
+            drift = total_bytes - data['bytes']
+            data.update(bytes=total_bytes, files=sum(f for _b, f in folders.values()),
+                        folders=folders, reconciled=time.time())
+            self._write(username, data)
+        if drift:
+            logger.warning(f"用户 {username} 存储统计偏差 {drift} 字节，已校正")
+        return drift
+
+    def users(self):
+        try:
+            with os.scandir(self.data_dir) as it:
+                return sorted(e.name for e in it if e.is_dir() and not e.name.startswith('.'))
+        except FileNotFoundError:
+            return []
+
+    def reconcile_all(self):
+        for username in self.users():
+            try:
+                self.reconcile(username)
+            except OSError:
+                logger.exception(f"校正用户 {username} 存储统计失败")
+
+    def all_usage(self):
+        """{username: {'bytes', 'files', 'updated', 'reconciled'}} from the usage files only"""
+        result = {}
+        for username in self.users():
+            data = self.read(username)
+            result[username] = {k: data.get(k) for k in ('bytes', 'files', 'updated', 'reconciled')}
+        return result
+
+
+def start_reconciler(data_dir, interval):
+    """Background thread reconciling every user every interval seconds (one process at a time)"""
+    store = UsageStore(data_dir)
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with open(os.path.join(store.data_dir, '.usage_reconcile.lock'), 'a+') as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    store.reconcile_all()
+            except Exception:
+                logger.exception('存储统计校正失败')
+
+    thread = threading.Thread(target=loop, name='usage-reconciler', daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    import argparse
+    from config import Config
+
+    ap = argparse.ArgumentParser(description='Per-user storage usage')
+    ap.add_argument('--data-dir', default=str(Config.DATA_DIR))
+    ap.add_argument('--reconcile', action='store_true', help='Walk all user dirs and correct usage.json first')
+    args = ap.parse_args(argv)
+
+    store = UsageStore(args.data_dir)
+    if args.reconcile:
+        store.reconcile_all()
+    for username, usage in store.all_usage().items():
+        print(f"{username:<24} {usage['bytes'] / 1024 / 1024:>12.1f} MB {usage['files']:>8} files")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())